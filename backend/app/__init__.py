@@ -1,6 +1,8 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
+import importlib
 import logging
+import os
 
 # 配置日誌
 logging.basicConfig(
@@ -10,12 +12,16 @@ logging.basicConfig(
 
 app = Flask(__name__)
 
+# 前面有支持 X-Sendfile 的反向代理時，由代理直接發送文件
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '0').lower() in ('1', 'true', 'yes')
+
 # 配置 CORS
 CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Range", "If-None-Match"],
+        "expose_headers": ["Content-Range", "Content-Length", "ETag", "Retry-After", "Location"]
     }
 })
 
@@ -31,5 +37,20 @@ def handle_error(error):
 # 註冊路由
 from app import routes
 
+# 導入較慢的第三方模塊，默認在首次使用時才加載
+HEAVY_MODULES = ('yt_dlp', 'openai', 'httpx', 'requests')
+
+def preload_modules():
+    """預先導入較慢的第三方模塊
+
+    gunicorn 使用 gthread worker 並開啟預加載時在主進程中調用，fork 出的 worker
+    直接共享已加載的模塊；gevent worker 需要在導入前 monkey patch，不能這樣預加載。
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
 def create_app():
-    return app
\ No newline at end of file
+    """準備運行所需的目錄並返回應用；導入 app 包本身不做任何文件系統操作"""
+    from .services.youtube_service import init_downloads_directory
+    init_downloads_directory()
+    return app
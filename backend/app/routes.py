@@ -1,22 +1,49 @@
-from flask import jsonify, request, send_file, Response
+from flask import jsonify, make_response, request, send_file, Response, url_for
 from app import app
-from .services.youtube_service import get_video_info, get_video_transcript, download_video, current_progress, detect_platform
-from .services.ai_service import AIService
+from .services.youtube_service import get_video_info, get_video_transcript, detect_platform, metadata_cache, transcript_cache
+from .services.job_service import download_jobs, QueueFullError
+from .services.process_service import process_jobs
+from .services.progress_service import sse_stream, sse_events
+from .services.media_store import media_store
+from .services.stream_service import PassthroughStream, stream_media_key
+from .services.ai_service import AIService, summary_cache
+from .services.llm_client import CircuitOpenError, LLMNotConfiguredError, llm_stats
+from .services.singleflight import inflight
+from .services.state_backend import state_backend
+from .services.ydl_pool import ydl_pool
+from .services.prefetch_service import prefetcher, TRANSCRIPT
 import logging
+import mimetypes
 import os
-import json
-import time
+import unicodedata
+from contextlib import ExitStack
+from functools import wraps
+from urllib.parse import quote
 
 # 設置日誌
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-ai_service = AIService()
-
-# 全局變量來追踪進度
-processing_status = {}
+def user_initiated(view):
+    """標記用戶發起的請求，後台預取在其進行期間讓出；流式響應持續到響應關閉"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        marker = ExitStack()
+        marker.enter_context(prefetcher.user_request())
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            marker.close()
+            raise
+        if response.is_streamed:
+            response.call_on_close(marker.close)
+        else:
+            marker.close()
+        return response
+    return wrapper
 
 @app.route('/api/video/info', methods=['POST', 'OPTIONS'])
+@user_initiated
 def video_info():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
@@ -32,12 +59,15 @@ def video_info():
             
         video_info = get_video_info(url)
         logger.info(f"獲取到視頻信息: {video_info}")
+        # PREFETCH_ENABLED 開啟時，請求可以用 prefetch=false 跳過預取
+        prefetcher.after_video_info(url, video_info, data.get('prefetch') is not False)
         return jsonify(video_info)
     except Exception as e:
         logger.error(f"處理視頻信息時出錯: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/transcript', methods=['POST', 'OPTIONS'])
+@user_initiated
 def get_transcript():
     """獲取視頻字幕"""
     if request.method == 'OPTIONS':
@@ -53,6 +83,7 @@ def get_transcript():
             }), 400
             
         logger.info(f"獲取字幕URL: {url}")
+        prefetcher.cancel(url, (TRANSCRIPT,))
         transcript_data = get_video_transcript(url)
         
         if isinstance(transcript_data, str):
@@ -61,14 +92,22 @@ def get_transcript():
                 'status': 'warning'
             }), 200
             
-        # 組合字幕文本和時間戳
-        transcript_text = '\n'.join([f"[{item['time']}] {item['text']}" for item in transcript_data])
-        
-        return jsonify({
-            'transcript': transcript_text,
-            'timestamps': transcript_data,
+        # format 選擇返回的表示：text 只返回字幕文本，segments 只返回帶時間戳的分段，
+        # columns 返回列式數組，默認同時返回字幕文本和分段
+        response_format = data.get('format', 'both')
+        result = {
+            'language': transcript_data.language,
+            'source': transcript_data.source,
             'status': 'success'
-        }), 200
+        }
+        if response_format == 'columns':
+            result['columns'] = transcript_data.to_columns()
+        else:
+            if response_format in ('text', 'both'):
+                result['transcript'] = transcript_data.to_text()
+            if response_format in ('segments', 'both'):
+                result['timestamps'] = transcript_data.to_segments()
+        return jsonify(result), 200
         
     except Exception as e:
         logger.error(f"處理字幕請求時出錯: {str(e)}")
@@ -77,7 +116,29 @@ def get_transcript():
             'status': 'error'
         }), 500
 
+def service_unavailable_response(error):
+    """AI 服務熔斷時返回 503 和重試提示"""
+    response = jsonify({
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def ai_unavailable_response(error):
+    """未配置 AI 服務時摘要路由返回 503，其他路由照常可用"""
+    return jsonify({'error': str(error)}), 503
+
+def summary_cache_options(data):
+    """摘要緩存控制：cache=false 跳過緩存，refresh=true 重新生成並覆蓋緩存"""
+    return {
+        'use_cache': data.get('cache', True) is not False,
+        'refresh': bool(data.get('refresh', False)),
+    }
+
 @app.route('/api/summary', methods=['POST'])
+@user_initiated
 def generate_summary():
     try:
         data = request.get_json()
@@ -87,84 +148,301 @@ def generate_summary():
         if not transcript:
             return jsonify({'error': '請提供字幕內容'}), 400
             
-        ai_service = AIService()
-        ai_service.set_video_duration(video_duration)  # 設置視頻時長
-        summary = ai_service.summarize_transcript(transcript)
+        summary = AIService().summarize_transcript(
+            transcript, video_duration, **summary_cache_options(data)
+        )
         
         return jsonify({'summary': summary})
+    except LLMNotConfiguredError as e:
+        return ai_unavailable_response(e)
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
     except Exception as e:
         logger.error(f"生成摘要失敗: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/summary/stream', methods=['POST'])
+@user_initiated
+def stream_summary():
+    """以 SSE 流式返回摘要，每個事件標明所屬部分（toc / notes）"""
+    data = request.get_json() or {}
+    transcript = data.get('transcript')
+    if not transcript:
+        return jsonify({'error': '請提供字幕內容'}), 400
+
+    try:
+        ai_service = AIService()
+    except LLMNotConfiguredError as e:
+        return ai_unavailable_response(e)
+    return sse_response(sse_events(ai_service.stream_summary(
+        transcript, data.get('duration', 0), **summary_cache_options(data)
+    )))
+
+def sse_response(stream):
+    """返回 SSE 響應，關閉代理緩衝以便事件即時送達"""
+    return Response(
+        stream,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+def job_resource(job):
+    """下載任務的 JSON 表示，附帶狀態、進度和文件地址"""
+    data = job.to_dict()
+    data['status_url'] = url_for('download_job_status', job_id=job.id)
+    data['progress_url'] = url_for('download_job_progress', job_id=job.id)
+    if job.status == 'done':
+        data['file_url'] = url_for('download_job_file', job_id=job.id)
+    return data
+
+def process_job_resource(job):
+    """處理任務的 JSON 表示，附帶狀態和進度地址"""
+    data = job.to_dict()
+    data['status_url'] = url_for('process_job_status', job_id=job.id)
+    data['progress_url'] = url_for('process_job_progress', job_id=job.id)
+    return data
+
+def queue_full_response(error):
+    """隊列已滿時返回 429 和重試提示"""
+    response = jsonify({
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def content_disposition(filename):
+    """生成附件下載頭，非 ASCII 文件名按 RFC 5987 編碼"""
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return f'attachment; filename="{simple}"; filename*=UTF-8\'\'{quote(filename)}'
+
+def send_media(result, pin=None):
+    """發送媒體存儲中的文件
+
+    支持 Range 斷點續傳和 ETag / If-None-Match 條件請求；WSGI 服務器提供
+    wsgi.file_wrapper 時由其使用 sendfile 零拷貝發送。固定存儲記錄直到響應關閉
+    （USE_X_SENDFILE 時響應體為空，文件由代理在響應返回後讀取），發送期間不會被淘汰。
+    調用方查詢存儲前已固定時傳入 pin，由本函數負責解除。
+    """
+    file_path = result['path']
+    media_key = result.get('media_key')
+    if pin is None and media_key:
+        pin = media_store.pin(media_key)
+    try:
+        if not os.path.exists(file_path):
+            logger.error(f"文件不存在: {file_path}")
+            raise FileNotFoundError(file_path)
+        mimetype = mimetypes.guess_type(result['filename'])[0] or 'application/octet-stream'
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=result['filename'],
+            mimetype=mimetype,
+            conditional=True,
+            # 存儲 key 由內容地址生成，跨重啟保持穩定
+            etag=media_key or True,
+            max_age=86400
+        )
+    except BaseException:
+        if pin:
+            media_store.unpin(pin)
+        raise
+    if pin:
+        response.call_on_close(lambda: media_store.unpin(pin))
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
 @app.route('/api/video/download', methods=['POST'])
-def download_video_endpoint():
+@app.route('/api/video/download/jobs', methods=['POST'])
+def submit_download_job():
+    """提交下載任務，返回任務資源；完成後通過 file_url 以 GET 下載文件"""
+    data = request.get_json() or {}
+    url = data.get('url')
+    if not url:
+        return jsonify({'error': '請提供視頻URL'}), 400
+
     try:
-        data = request.get_json()
-        url = data.get('url')
-        if not url:
-            return jsonify({'error': '請提供視頻URL'}), 400
-        
-        logger.info(f"開始下載視頻: {url}")
-        video_info = download_video(url)
-        
-        if video_info.get('status') == 'error':
-            logger.error(f"下載失敗: {video_info.get('message')}")
-            return jsonify({'error': video_info.get('message')}), 500
-            
+        job = download_jobs.submit(url, priority=int(data.get('priority', 0)))
+    except QueueFullError as e:
+        return queue_full_response(e)
+    response = jsonify(job_resource(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('download_job_status', job_id=job.id)
+    return response
+
+@app.route('/api/video/download/stream', methods=['GET'])
+def stream_download():
+    """直通模式：選擇無需合併的單文件格式，邊下載邊轉發給客戶端
+
+    store=0 時不寫入媒體存儲；已存儲的文件直接從磁盤發送。
+    """
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': '請提供視頻URL'}), 400
+
+    try:
+        media_key = stream_media_key(url)
+    except Exception as e:
+        # 無效或不支持的 URL 在訪問上游之前就能判斷
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # 先固定再查詢，查到的文件在發送結束前不會被其他請求淘汰
+        pin = media_store.pin(media_key)
         try:
-            file_path = video_info['path']
-            logger.info(f"準備發送文件: {file_path}")
-            
-            if not os.path.exists(file_path):
-                logger.error(f"文件不存在: {file_path}")
-                return jsonify({'error': '視頻文件不存在'}), 404
-                
-            file_size = os.path.getsize(file_path)
-            logger.info(f"文件大小: {file_size} bytes")
-            
-            return send_file(
-                file_path,
-                as_attachment=True,
-                download_name=video_info['filename'],
-                mimetype='video/quicktime'
-            )
-            
-        except Exception as e:
-            logger.error(f"發送文件失敗: {str(e)}", exc_info=True)
-            return jsonify({'error': f'文件發送失敗: {str(e)}'}), 500
-            
+            stored = media_store.lookup(media_key)
+        except BaseException:
+            media_store.unpin(pin)
+            raise
+        if stored is not None:
+            return send_media(dict(stored, media_key=media_key), pin=pin)
+        media_store.unpin(pin)
+
+        stream = PassthroughStream(url, tee=request.args.get('store', '1') != '0')
     except Exception as e:
-        logger.error(f"下載處理失敗: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"直通下載失敗: {str(e)}")
+        return jsonify({'error': str(e)}), 502
+
+    headers = {
+        'Content-Disposition': content_disposition(stream.filename),
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    }
+    if stream.content_length is not None:
+        headers['Content-Length'] = str(stream.content_length)
+    return Response(stream, mimetype=stream.content_type, headers=headers, direct_passthrough=True)
+
+@app.route('/api/video/download/jobs/<job_id>', methods=['GET'])
+def download_job_status(job_id):
+    """查詢下載任務狀態"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '下載任務不存在'}), 404
+    return jsonify(job_resource(job))
+
+@app.route('/api/video/download/jobs/<job_id>/file', methods=['GET'])
+def download_job_file(job_id):
+    """下載已完成任務的視頻文件"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '下載任務不存在'}), 404
+    if job.status != 'done':
+        return jsonify({'error': '下載尚未完成', 'status': job.status}), 409
+
+    try:
+        return send_media(job.result)
+    except FileNotFoundError:
+        return jsonify({'error': '視頻文件不存在'}), 404
+
+@app.route('/api/video/download/jobs/<job_id>', methods=['DELETE'])
+def cancel_download_job(job_id):
+    """取消下載任務"""
+    job = download_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': '下載任務不存在'}), 404
+    return jsonify(job_resource(job))
+
+@app.route('/api/process', methods=['POST'])
+def start_process():
+    """一站式處理：服務端依次完成信息、字幕和摘要階段
+
+    默認直接以 SSE 推送任務狀態，每個階段開始和完成時各推送一次，摘要生成期間
+    附帶已生成的部分；stream=false 時返回 202 和任務地址。緩存參數同 /api/summary。
+    """
+    data = request.get_json() or {}
+    url = data.get('url')
+    if not url:
+        return jsonify({'error': '請提供視頻URL'}), 400
+
+    try:
+        prefetcher.cancel(url)
+        job = process_jobs.submit(url, **summary_cache_options(data))
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    if data.get('stream', True) is False:
+        return jsonify(process_job_resource(job)), 202
+    return progress_response(job)
+
+@app.route('/api/process/jobs/<job_id>', methods=['GET'])
+def process_job_status(job_id):
+    """查詢處理任務及各階段狀態"""
+    job = process_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '處理任務不存在'}), 404
+    return jsonify(process_job_resource(job))
+
+@app.route('/api/process/jobs/<job_id>/progress')
+def process_job_progress(job_id):
+    """訂閱處理任務的階段事件"""
+    job = process_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '處理任務不存在'}), 404
+    return progress_response(job)
 
 @app.route('/api/process/status', methods=['GET'])
 def get_process_status():
-    video_id = request.args.get('video_id')
-    if video_id in processing_status:
-        return jsonify(processing_status[video_id])
-    return jsonify({'status': 'unknown'})
+    """按任務 ID 或視頻 ID 查詢處理狀態"""
+    job_id = request.args.get('job_id')
+    job = process_jobs.get(job_id) if job_id else process_jobs.latest(request.args.get('video_id'))
+    if job is None:
+        return jsonify({'status': 'unknown'})
+    return jsonify(process_job_resource(job))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """緩存命中率統計"""
+    return jsonify({
+        'video_info': metadata_cache.stats(),
+        'summary': summary_cache.stats(),
+        'transcript': transcript_cache.stats(),
+        'prefetch': prefetcher.stats(),
+    })
 
 @app.route('/health')
 def health_check():
     """健康檢查端點"""
     try:
-        # 清理下載目錄
-        from .services.youtube_service import init_downloads_directory
-        init_downloads_directory()
-        return jsonify({'status': 'healthy'}), 200
+        return jsonify({
+            'status': 'healthy',
+            'media_store': media_store.stats(),
+            'download_queue': download_jobs.queue_depth(),
+            'process_queue': process_jobs.queue_depth(),
+            'llm': llm_stats(),
+            'inflight': inflight.stats(),
+            'ydl_pool': ydl_pool.stats(),
+            'state': state_backend.stats()
+        }), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+def progress_response(job):
+    """以 SSE 推送任務進度，任務結束後關閉連接"""
+    return sse_response(sse_stream(job.channel))
+
+@app.route('/api/video/download/jobs/<job_id>/progress')
+def download_job_progress(job_id):
+    """訂閱下載任務的進度事件"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '下載任務不存在'}), 404
+    return progress_response(job)
+
 @app.route('/api/video/download/progress')
 def download_progress():
-    def generate():
-        while True:
-            progress = current_progress.get('value', 0)
-            data = json.dumps({
-                'progress': progress,
-                'stage': 'downloading' if progress < 50 else 'processing'
-            })
-            yield f"data: {data}\n\n"
-            time.sleep(0.5)
-    
-    return Response(generate(), mimetype='text/event-stream')
\ No newline at end of file
+    """兼容舊接口：訂閱指定任務或最近提交任務的進度"""
+    job_id = request.args.get('job_id')
+    job = download_jobs.get(job_id) if job_id else download_jobs.latest()
+    if job is None:
+        return jsonify({'error': '下載任務不存在'}), 404
+    return progress_response(job)
@@ -1,31 +1,105 @@
+import hashlib
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Event, Thread
 import logging
 import re
+from config import Config
+from .cache_service import PersistentCache
+from .llm_client import CircuitOpenError, count_tokens, get_llm_client
+from .singleflight import CallAbandoned, inflight
+from .transcript_service import compact_transcript
+from .youtube_service import NO_TRANSCRIPT
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_MODEL = "gpt-3.5-turbo-16k"
+# 修改提示詞或摘要流程時遞增，使舊的緩存結果失效
+SUMMARY_PROMPT_VERSION = 4
+# 摘要按內容緩存並在並發請求間共用，採樣溫度取 0，同一字幕的結果不依賴先到請求的隨機採樣
+SUMMARY_TEMPERATURE = 0
+
+summary_cache = PersistentCache(
+    'summaries',
+    os.path.join(Config.CACHE_DIR, 'summaries.sqlite3'),
+    memory_entries=Config.SUMMARY_CACHE_MEMORY_ENTRIES,
+    disk_entries=Config.SUMMARY_CACHE_DISK_ENTRIES,
+    default_ttl=Config.SUMMARY_CACHE_TTL
+)
+
+# 字幕行開頭的時間戳，例如 [05:30] 或 [01:05:30]
+LINE_TIMESTAMP = re.compile(r'^\[((?:\d{2}:)?\d{2}:\d{2})\]')
+
+
+def split_transcript(transcript, max_tokens):
+    """按字幕行邊界把帶時間戳的字幕切分為不超過 max_tokens 的片段
+
+    返回 [(開始時間, 結束時間, 片段文本)]，時間取自片段首末行的時間戳。
+    """
+    chunks = []
+    lines = []
+    size = 0
+
+    def flush():
+        if not lines:
+            return
+        stamps = [m.group(1) for m in (LINE_TIMESTAMP.match(line) for line in lines) if m]
+        start = stamps[0] if stamps else ''
+        end = stamps[-1] if stamps else ''
+        chunks.append((start, end, '\n'.join(lines)))
+
+    for line in transcript.split('\n'):
+        if not line.strip():
+            continue
+        tokens = count_tokens(line)
+        if lines and size + tokens > max_tokens:
+            flush()
+            lines = []
+            size = 0
+        lines.append(line)
+        size += tokens
+    flush()
+    return chunks
+
+
+def summary_cache_key(transcript, duration):
+    """由原始字幕、提示詞版本、模型、採樣參數、壓縮和分段預算以及視頻時長生成緩存 key
+
+    使用壓縮前的字幕：壓縮結果取決於 tiktoken 是否可用，有無 tiktoken 的 worker 會算出
+    不同的 key。規範化去掉空行和行內多餘空白，同一字幕的不同排版命中同一條記錄。
+    """
+    normalized = '\n'.join(' '.join(line.split()) for line in transcript.splitlines() if line.strip())
+    raw = '\n'.join([
+        str(SUMMARY_PROMPT_VERSION),
+        SUMMARY_MODEL,
+        str(SUMMARY_TEMPERATURE),
+        str(Config.TRANSCRIPT_TOKEN_BUDGET),
+        str(Config.SUMMARY_CHUNK_TOKENS),
+        str(int(duration or 0)),
+        normalized,
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
 class AIService:
-    def __init__(self):
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("未設置 OPENAI_API_KEY 環境變量")
-        self.client = OpenAI(api_key=api_key)
-        self.video_duration = 0
-    
-    def set_video_duration(self, duration):
-        """設置視頻時長（秒）"""
-        self.video_duration = duration
+    """摘要生成服務，無請求級狀態，可在線程間共享
+
+    視頻時長等請求參數通過方法參數傳入；OpenAI 連接池、並發和重試由共享的 LLMClient 管理。
+    """
+
+    def __init__(self, client=None):
+        self.client = client or get_llm_client()
     
-    def parse_timestamp(self, text):
+    def parse_timestamp(self, text, duration):
         """從字幕文本中提取時間戳"""
         timestamps = []
-        pattern = r'\[(\d{2}):(\d{2})\]'
+        pattern = r'\[(?:(\d{2}):)?(\d{2}):(\d{2})\]'
         matches = re.finditer(pattern, text)
         for match in matches:
-            minutes, seconds = map(int, match.groups())
-            total_seconds = minutes * 60 + seconds
-            if total_seconds <= self.video_duration:
+            hours, minutes, seconds = (int(value or 0) for value in match.groups())
+            total_seconds = hours * 3600 + minutes * 60 + seconds
+            if total_seconds <= duration:
                 timestamps.append((total_seconds, match.group()))
         return sorted(timestamps)
     
@@ -58,7 +132,7 @@ class AIService:
                     description = description.strip()
                     
                     # 驗證時間格式
-                    if re.match(r'^\[\d{2}:\d{2}\]$', timestamp):
+                    if re.match(r'^\[(?:\d{2}:)?\d{2}:\d{2}\]$', timestamp):
                         formatted_line = self.format_toc_line(title, description, timestamp)
                         lines.append(formatted_line)
             
@@ -68,13 +142,12 @@ class AIService:
         
         return '\n'.join(lines) if lines else "無法生成目錄，請重試"
     
-    def generate_toc(self, transcript):
-        """生成目錄"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-16k",
-                messages=[
-                    {"role": "system", "content": f"""你是一個專業的視頻分析助手。請按以下格式生成3到8條視頻目錄。每條目錄之間間隔一行：
+    def toc_request(self, transcript, duration):
+        """目錄生成的請求參數"""
+        return dict(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": f"""你是一個專業的視頻分析助手。請按以下格式生成3到8條視頻目錄。每條目錄之間間隔一行：
 
 
 **1**、[02:15] 開場介紹：視頻主要內容概述  
@@ -90,32 +163,39 @@ class AIService:
 要求：
 1. 每個條目必須包含序號、時間戳和主題說明。
 2. 時間點必須按順序排列
-3. 時間點不能超過視頻總長度 {self.video_duration} 秒
+3. 時間點不能超過視頻總長度 {duration} 秒
 4. 忽略廣告和贊助內容
 5. 生成3-8個時間點、時間點為該條目開始的時間
 6. 主題說明要準確概括該時間點的內容
 7. 使用實際的視頻內容時間點
+8. 時間戳格式與字幕一致：一小時以內為 [MM:SS]，超過一小時為 [HH:MM:SS]
                 """},
-                    {"role": "user", "content": transcript}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
+                {"role": "user", "content": transcript}
+            ],
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=500
+        )
+
+    def generate_toc(self, transcript, duration=0):
+        """生成目錄"""
+        try:
+            response = self.client.create(**self.toc_request(transcript, duration))
             
             # 直接返回 AI 生成的內容
             return response.choices[0].message.content
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"生成目錄時發生錯誤: {str(e)}")
             raise Exception(f"生成目錄失敗: {str(e)}")
 
-    def generate_notes(self, transcript):
-        """生成學習筆記"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-16k",
-                messages=[
-                    {"role": "system", "content": """你是一個專業的筆記整理助手。請按照以下格式生成學習筆記：
+    def notes_request(self, transcript):
+        """學習筆記生成的請求參數"""
+        return dict(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": """你是一個專業的筆記整理助手。請按照以下格式生成學習筆記：
 
 ## 📝 學習筆記
 
@@ -148,41 +228,235 @@ class AIService:
 3. 保持內容的實用性和可操作性
 4. 使用清晰的層級結構
                 """},
-                    {"role": "user", "content": transcript}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
+                {"role": "user", "content": transcript}
+            ],
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=1000
+        )
+
+    def generate_notes(self, transcript):
+        """生成學習筆記"""
+        try:
+            response = self.client.create(**self.notes_request(transcript))
             return response.choices[0].message.content
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"生成筆記時發生錯誤: {str(e)}")
             raise Exception(f"生成筆記失敗: {str(e)}")
 
-    def summarize_transcript(self, transcript):
-        """整合目錄和筆記"""
+    def summarize_chunk(self, chunk, index, total):
+        """Map 階段：為一個字幕片段生成保留時間戳的要點摘要"""
+        start, end, text = chunk
+        try:
+            response = self.client.create(
+                model=SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": f"""你是一個專業的視頻分析助手。以下是一段較長視頻的第 {index + 1}/{total} 段字幕（[{start}] 至 [{end}]）。
+請按時間順序整理本段的要點，每條要點一行，格式為：
+
+[MM:SS] 要點內容
+
+要求：
+1. 時間戳必須使用字幕中實際出現的時間，不得編造；超過一小時的時間使用 [HH:MM:SS]
+2. 每個話題轉換都要保留其開始時間
+3. 忽略廣告和贊助內容
+4. 只輸出要點，不要加開場白或總結
+                """},
+                    {"role": "user", "content": text}
+                ],
+                temperature=SUMMARY_TEMPERATURE,
+                max_tokens=Config.SUMMARY_CHUNK_SUMMARY_TOKENS
+            )
+            return response.choices[0].message.content
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"生成第 {index + 1} 段摘要時發生錯誤: {str(e)}")
+            raise Exception(f"生成片段摘要失敗: {str(e)}")
+
+    def condense_transcript(self, transcript):
+        """字幕超出單次請求預算時，先並行摘要各片段，再把帶時間範圍的片段摘要交給 reduce 階段"""
+        chunks = split_transcript(transcript, Config.SUMMARY_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            return transcript
+
+        logger.info(f"字幕較長，分為 {len(chunks)} 段並行摘要")
+        with ThreadPoolExecutor(max_workers=Config.SUMMARY_MAP_CONCURRENCY) as executor:
+            summaries = list(executor.map(
+                lambda item: self.summarize_chunk(item[1], item[0], len(chunks)),
+                enumerate(chunks)
+            ))
+
+        sections = []
+        for (start, end, _), summary in zip(chunks, summaries):
+            sections.append(f"### 片段 [{start}] - [{end}]\n{summary.strip()}")
+        return '\n\n'.join(sections)
+
+    def summarize_transcript(self, transcript, duration=0, use_cache=True, refresh=False):
+        """整合目錄和筆記
+
+        use_cache=False 時既不讀也不寫緩存；refresh=True 時忽略已有緩存、重新生成並覆蓋。
+        """
         try:
             logger.info("開始生成目錄和筆記")
-            if not transcript or transcript == "無字幕內容":
+            if not transcript or transcript == NO_TRANSCRIPT:
                 return "無法生成摘要：未找到字幕內容"
 
-            # 限制輸入長度
-            max_length = 12000
-            if len(transcript) > max_length:
-                transcript = transcript[:max_length] + "..."
+            cache_key = summary_cache_key(transcript, duration)
+            if use_cache and not refresh:
+                cached = summary_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("摘要緩存命中")
+                    return cached
+
+            # 相同字幕的摘要同時只生成一次，並發請求共用結果
+            return inflight.do(f"summary:{cache_key}", self._generate_summary,
+                               compact_transcript(transcript), duration, cache_key if use_cache else None)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"生成摘要時發生錯誤: {str(e)}")
+            raise Exception(f"生成摘要失敗: {str(e)}")
 
-            # 分別生成目錄和筆記
-            toc = self.generate_toc(transcript)
-            notes = self.generate_notes(transcript)
+    def _generate_summary(self, transcript, duration, cache_key=None):
+        """生成目錄和筆記並組合，提供 cache_key 時寫入緩存"""
+        # 長字幕先做 map 階段，目錄和筆記基於覆蓋整個視頻的片段摘要生成
+        transcript = self.condense_transcript(transcript)
 
-            # 組合結果
-            result = f"""## 📋 目錄
+        # 目錄和筆記互不依賴，兩個請求同時發出
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            toc_future = executor.submit(self.generate_toc, transcript, duration)
+            notes_future = executor.submit(self.generate_notes, transcript)
+            toc = toc_future.result()
+            notes = notes_future.result()
+
+        logger.info("目錄和筆記生成完成")
+        summary = self.combine_summary(toc, notes)
+        if cache_key:
+            summary_cache.set(cache_key, summary)
+        return summary
+
+    def combine_summary(self, toc, notes):
+        """組合目錄和筆記"""
+        return f"""## 📋 目錄
 
 {toc}
 
 {notes}"""
 
-            logger.info("目錄和筆記生成完成")
-            return result
+    def stream_summary(self, transcript, duration=0, use_cache=True, refresh=False):
+        """流式生成摘要
+
+        目錄和筆記同時以流式請求生成，按到達順序產出
+        {'section': 'toc' | 'notes', 'delta': 文本}，全部完成後產出
+        {'done': True, 'summary': 完整摘要, 'cached': 是否來自緩存}，失敗時產出 {'error': 錯誤信息}。
+        調用方提前關閉生成器時停止讀取上游響應。相同字幕的摘要已在生成時不再重複請求，
+        等待其完成後直接產出帶 'shared': True 的完成事件；生成方中途斷開時由等待者接替生成。
+        緩存參數同 summarize_transcript。
+        """
+        if not transcript or transcript == NO_TRANSCRIPT:
+            yield {'error': "無法生成摘要：未找到字幕內容"}
+            return
+
+        cache_key = summary_cache_key(transcript, duration)
+        if use_cache and not refresh:
+            cached = summary_cache.get(cache_key)
+            if cached is not None:
+                logger.info("摘要緩存命中")
+                yield {'done': True, 'summary': cached, 'cached': True}
+                return
+
+        # 已有相同字幕的摘要在生成時等待其結果，不再重複調用模型；
+        # 生成方的客戶端斷開時由等待者接替重新生成
+        flight_key = f"summary:{cache_key}"
+        while True:
+            call, leader = inflight.begin(flight_key)
+            if leader:
+                break
+            logger.info("等待進行中的相同摘要")
+            try:
+                summary = call.result()
+            except CallAbandoned:
+                logger.info("進行中的摘要已取消，接替生成")
+                continue
+            except Exception as e:
+                yield {'error': f"生成摘要失敗: {str(e)}"}
+                return
+            yield {'done': True, 'summary': summary, 'cached': False, 'shared': True}
+            return
+
+        try:
+            summary, error = yield from self._stream_sections(compact_transcript(transcript), duration)
+            # 先寫緩存再結束調用，之後到達的請求可以直接命中緩存
+            if error is None and use_cache:
+                summary_cache.set(cache_key, summary)
+        except GeneratorExit:
+            # 調用方斷開不代表生成失敗，交給仍在等待的調用方重新發起
+            inflight.abandon(flight_key, call)
+            raise
+        except BaseException as e:
+            inflight.finish(flight_key, call, error=e)
+            raise
+        inflight.finish(flight_key, call, result=summary, error=error)
+
+        if error is not None:
+            yield {'error': f"生成摘要失敗: {str(error)}"}
+            return
+        yield {'done': True, 'summary': summary, 'cached': False}
+
+    def _stream_sections(self, transcript, duration):
+        """同時流式生成目錄和筆記，產出片段事件，返回 (摘要, 錯誤)"""
+        try:
+            transcript = self.condense_transcript(transcript)
         except Exception as e:
-            logger.error(f"生成摘要時發生錯誤: {str(e)}")
-            raise Exception(f"生成摘要失敗: {str(e)}")
\ No newline at end of file
+            return None, e
+
+        events = Queue()
+        stop = Event()
+
+        def produce(section, request):
+            try:
+                stream = self.client.create(stream=True, **request)
+                try:
+                    for chunk in stream:
+                        if stop.is_set():
+                            break
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            events.put((section, delta, None))
+                finally:
+                    stream.close()
+            except Exception as e:
+                logger.error(f"流式生成 {section} 時發生錯誤: {str(e)}")
+                events.put((section, None, e))
+            finally:
+                events.put((section, None, None))
+
+        for section, request in (('toc', self.toc_request(transcript, duration)),
+                                 ('notes', self.notes_request(transcript))):
+            Thread(target=produce, args=(section, request), daemon=True).start()
+
+        parts = {'toc': [], 'notes': []}
+        pending = len(parts)
+        error = None
+        try:
+            while pending:
+                section, delta, exc = events.get()
+                if exc is not None:
+                    error = error or exc
+                    stop.set()
+                elif delta is None:
+                    pending -= 1
+                else:
+                    parts[section].append(delta)
+                    yield {'section': section, 'delta': delta}
+        finally:
+            stop.set()
+
+        if error is not None:
+            return None, error
+        logger.info("目錄和筆記流式生成完成")
+        return self.combine_summary(''.join(parts['toc']), ''.join(parts['notes'])), None
\ No newline at end of file
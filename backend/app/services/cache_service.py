@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """進程內 LRU 緩存，支持每條記錄獨立的過期時間"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """獲取緩存值，過期或不存在時返回 None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """寫入緩存，返回被淘汰的記錄數
+
+        ttl 為 None 時永不過期，ttl <= 0 時不緩存並刪除已有記錄。
+        """
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return 0
+        expires_at = time.time() + ttl if ttl is not None else None
+        evicted = 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PersistentCache:
+    """兩級緩存：內存 LRU 在前，SQLite 持久化存儲在後"""
+
+    def __init__(self, name, db_path, memory_entries=1024, disk_entries=10000,
+                 default_ttl=3600, dumps=json.dumps, loads=json.loads):
+        self.name = name
+        self.db_path = db_path
+        self.disk_entries = disk_entries
+        self.default_ttl = default_ttl
+        self.memory = LRUCache(memory_entries)
+        self._dumps = dumps
+        self._loads = loads
+        self._lock = Lock()
+        self._conn = None
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+        }
+
+    def _connect(self):
+        """延遲打開 SQLite 連接並建表"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.name}" ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                'expires_at REAL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.name}_accessed" '
+                f'ON "{self.name}" (accessed_at)'
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def get(self, key):
+        """按 key 查詢緩存，依次查內存和磁盤"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    f'SELECT value, expires_at FROM "{self.name}" WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] is not None and row[1] <= now:
+                        conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+                        row = None
+                    else:
+                        conn.execute(
+                            f'UPDATE "{self.name}" SET accessed_at = ? WHERE key = ?', (now, key)
+                        )
+                    conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"讀取緩存 {self.name} 失敗: {str(e)}")
+            row = None
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        value = self._loads(row[0])
+        ttl = row[1] - now if row[1] is not None else None
+        self._count('evictions', self.memory.set(key, value, ttl))
+        self._count('disk_hits')
+        return value
+
+    def set(self, key, value, ttl=None):
+        """寫入兩級緩存，並按容量淘汰最久未訪問的磁盤記錄
+
+        ttl 為 None 時使用 default_ttl；兩者都為 None 時永不過期，ttl <= 0 時不緩存。
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        self._count('evictions', self.memory.set(key, value, ttl))
+        self._count('writes')
+        try:
+            payload = self._dumps(value)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    f'INSERT OR REPLACE INTO "{self.name}" (key, value, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, payload, expires_at, now)
+                )
+                cursor = conn.execute(
+                    f'DELETE FROM "{self.name}" WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                    (now,)
+                )
+                evicted = cursor.rowcount
+                cursor = conn.execute(
+                    f'DELETE FROM "{self.name}" WHERE key IN ('
+                    f'SELECT key FROM "{self.name}" ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                    (self.disk_entries,)
+                )
+                evicted += cursor.rowcount
+                conn.commit()
+                self._stats['evictions'] += evicted
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"寫入緩存 {self.name} 失敗: {str(e)}")
+
+    def delete(self, key):
+        self.memory.delete(key)
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"刪除緩存 {self.name} 失敗: {str(e)}")
+
+    def stats(self):
+        """返回命中率統計"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        hits = stats['memory_hits'] + stats['disk_hits']
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        return stats
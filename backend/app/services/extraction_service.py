@@ -0,0 +1,155 @@
+import copy
+import logging
+import time
+from urllib.parse import parse_qs, urlparse
+
+from config import Config
+from .cache_service import LRUCache
+from .singleflight import inflight
+from .ydl_pool import ydl_pool
+
+logger = logging.getLogger(__name__)
+
+# 提取 info 時使用的選項，只解析不處理格式，保留完整的 formats / subtitles 供後續步驟選擇
+EXTRACT_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': True,
+    'retries': 10,
+    'socket_timeout': 30,
+}
+ydl_pool.register('extract', EXTRACT_OPTS)
+
+# 媒體地址在到期前多少秒視為已過期
+EXPIRE_MARGIN = 300
+
+# 解析 url / playlist 類型結果時最多跟隨的層數
+MAX_RESOLVE_DEPTH = 3
+
+
+def _media_url_expiry(info):
+    """從格式地址的 expire 參數中找出最早的過期時間"""
+    expiries = []
+    for fmt in info.get('formats') or []:
+        url = fmt.get('url')
+        if not url:
+            continue
+        try:
+            expire = parse_qs(urlparse(url).query).get('expire')
+            if expire:
+                expiries.append(float(expire[0]))
+        except (ValueError, TypeError):
+            continue
+    return min(expiries) if expiries else None
+
+
+def best_thumbnail(info):
+    """視頻的縮略圖地址，與 yt-dlp 處理後的 thumbnail 字段一致
+
+    extract_info(process=False) 不會從 thumbnails 推導 thumbnail，只填寫 thumbnails 的
+    提取器（例如 X）需要在這裡按 yt-dlp 的排序規則取最後（最佳）一項。
+    """
+    if info.get('thumbnail'):
+        return info['thumbnail']
+    thumbnails = [t for t in info.get('thumbnails') or [] if isinstance(t, dict) and t.get('url')]
+    if not thumbnails:
+        return None
+    best = max(thumbnails, key=lambda t: (
+        t.get('preference') if t.get('preference') is not None else -1,
+        t.get('width') if t.get('width') is not None else -1,
+        t.get('height') if t.get('height') is not None else -1,
+        t.get('id') if t.get('id') is not None else '',
+        t['url'],
+    ))
+    return best['url']
+
+
+class ExtractionContext:
+    """單個視頻的提取上下文，持有一次 extract_info 的結果供 info、字幕和下載共用"""
+
+    def __init__(self, platform, video_id, url, info):
+        self.platform = platform
+        self.video_id = video_id
+        self.url = url
+        self.info = info
+        self.created_at = time.time()
+        self.expires_at = _media_url_expiry(info)
+
+    @property
+    def key(self):
+        return f"{self.platform}:{self.video_id}"
+
+    def is_expired(self, margin=EXPIRE_MARGIN):
+        """媒體地址是否已經（或即將）過期"""
+        if self.expires_at is None:
+            return False
+        return time.time() + margin >= self.expires_at
+
+    def ttl(self):
+        """上下文在內存中保留的時間"""
+        ttl = Config.EXTRACTION_CONTEXT_TTL
+        if self.expires_at is not None:
+            ttl = min(ttl, self.expires_at - EXPIRE_MARGIN - time.time())
+        return max(ttl, 1)
+
+    def fresh_info(self):
+        """返回 info 的副本，process_ie_result 會修改傳入的字典"""
+        return copy.deepcopy(self.info)
+
+
+_contexts = LRUCache(Config.EXTRACTION_CONTEXT_ENTRIES)
+
+
+def get_extraction(target, refresh=False):
+    """獲取視頻的提取上下文，同一視頻只在首次或地址過期時調用 extract_info
+
+    target 為 resolve_video_target 返回的 (平台, 視頻ID, URL)
+    """
+    platform, video_id, clean_url = target
+    key = f"{platform}:{video_id}"
+
+    if not refresh:
+        context = _contexts.get(key)
+        if context is not None and not context.is_expired():
+            return context
+
+    # 同一視頻同時只做一次提取，並發的 info、字幕和下載請求共用結果
+    return inflight.do(f"extract:{key}", _extract, platform, video_id, clean_url)
+
+
+def _resolve(ydl, info):
+    """process=False 時 url 和 playlist 類型的結果不會被展開，跟隨到單個視頻的 info"""
+    for _ in range(MAX_RESOLVE_DEPTH):
+        result_type = info.get('_type', 'video')
+        if result_type in ('url', 'url_transparent'):
+            resolved = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+            if result_type == 'url_transparent' and isinstance(resolved, dict):
+                # 與 yt-dlp 相同，外層結果中的非空字段覆蓋跳轉後的結果
+                resolved = dict(resolved, **{
+                    key: value for key, value in info.items()
+                    if value is not None and key not in ('_type', 'url', 'ie_key')
+                })
+            info = resolved
+        elif result_type in ('playlist', 'multi_video'):
+            # noplaylist 時仍返回列表的（例如包含多個視頻的推文）取第一個視頻
+            info = next(iter(info.get('entries') or []), None)
+        else:
+            return info
+        if not isinstance(info, dict):
+            return None
+    raise Exception("無法獲取視頻信息：跳轉層數過多")
+
+
+def _extract(platform, video_id, clean_url):
+    logger.info(f"提取視頻信息: {clean_url} (平台: {platform})")
+    with ydl_pool.checkout('extract') as ydl:
+        info = ydl.extract_info(clean_url, download=False, process=False)
+        if isinstance(info, dict):
+            info = _resolve(ydl, info)
+
+    if not isinstance(info, dict):
+        raise Exception("無法獲取視頻信息")
+
+    context = ExtractionContext(platform, video_id, clean_url, info)
+    _contexts.set(context.key, context, ttl=context.ttl())
+    return context
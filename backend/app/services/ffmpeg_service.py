@@ -0,0 +1,134 @@
+import logging
+import subprocess
+import tempfile
+
+from config import Config
+from .state_backend import state_backend
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegError(Exception):
+    """ffmpeg 執行失敗"""
+
+
+class FFmpegCancelled(FFmpegError):
+    """ffmpeg 任務被取消"""
+
+
+def _parse_out_time(key, value):
+    """解析 -progress 輸出中的當前處理時間（秒）"""
+    try:
+        if key in ('out_time_us', 'out_time_ms'):
+            # 兩個字段的單位實際上都是微秒
+            return int(value) / 1_000_000
+        if key == 'out_time':
+            hours, minutes, seconds = value.split(':')
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        pass
+    return None
+
+
+def run_ffmpeg(args, duration=None, progress_callback=None, cancel_event=None):
+    """執行 ffmpeg 並通過 -progress 的機器可讀輸出回報進度
+
+    progress_callback 接收 0-1 之間的完成比例，需要已知的總時長（秒）。
+    同時運行的 ffmpeg 進程數受 FFMPEG_MAX_PROCESSES 限制（共享狀態後端時為整機上限），
+    超出時排隊等待空閒槽位。
+    """
+    try:
+        with state_backend.semaphore('ffmpeg', Config.FFMPEG_MAX_PROCESSES,
+                                     ttl=Config.JOB_LEASE_SECONDS, cancel_event=cancel_event):
+            _run_ffmpeg(args, duration, progress_callback, cancel_event)
+    except InterruptedError:
+        raise FFmpegCancelled('ffmpeg 任務已取消')
+
+
+def _run_ffmpeg(args, duration, progress_callback, cancel_event):
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+           '-progress', 'pipe:1', '-nostats'] + list(args)
+    logger.info(f"執行 ffmpeg: {' '.join(cmd)}")
+
+    # stderr 寫入臨時文件，避免管道寫滿導致 ffmpeg 阻塞
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1
+        )
+        try:
+            for line in process.stdout:
+                if cancel_event is not None and cancel_event.is_set():
+                    process.kill()
+                    raise FFmpegCancelled('ffmpeg 任務已取消')
+
+                key, _, value = line.strip().partition('=')
+                if key == 'progress' and value == 'end':
+                    if progress_callback:
+                        progress_callback(1.0)
+                    continue
+
+                seconds = _parse_out_time(key, value)
+                if seconds is not None and duration and progress_callback:
+                    progress_callback(min(1.0, max(0.0, seconds / duration)))
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', errors='ignore').strip()
+            raise FFmpegError(f"ffmpeg 執行失敗 ({process.returncode}): {message[-500:]}")
+
+
+# 可以直接複製進 MP4 並保持播放器兼容的編碼（按 yt-dlp 的 vcodec / acodec 前綴匹配）
+COPY_VIDEO_CODECS = ('avc1', 'avc3', 'h264')
+COPY_AUDIO_CODECS = ('mp4a', 'aac')
+
+
+def _codec_matches(codec, candidates):
+    return bool(codec) and codec.lower().split('.')[0] in candidates
+
+
+def codec_args(video_codec=None, audio_codec=None, fast=False):
+    """根據輸入編碼決定每條流是直接複製還是轉碼
+
+    已經是 H.264 / AAC 的流直接 -c copy，只有不兼容的流才轉碼；
+    fast 為 True 時使用純軟件的快速預設，以畫質和體積換取轉碼速度。
+    """
+    args = []
+    if _codec_matches(video_codec, COPY_VIDEO_CODECS):
+        args += ['-c:v', 'copy']
+    else:
+        args += ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+        if fast:
+            args += ['-preset', 'veryfast', '-tune', 'fastdecode', '-crf', '26']
+
+    if _codec_matches(audio_codec, COPY_AUDIO_CODECS):
+        args += ['-c:a', 'copy']
+    else:
+        args += ['-c:a', 'aac', '-b:a', '192k']
+    return args
+
+
+def postprocess_profile(fast=False):
+    """描述合併輸出的配置，作為媒體存儲 key 的一部分"""
+    profile = 'mp4+faststart;copy=' + ','.join(COPY_VIDEO_CODECS + COPY_AUDIO_CODECS)
+    return profile + (';fast' if fast else '')
+
+
+def merge_streams(input_paths, output_path, video_codec=None, audio_codec=None,
+                  duration=None, progress_callback=None, cancel_event=None, fast=False):
+    """把分開下載的視頻流和音頻流合併為 MP4，能複製的流直接 remux"""
+    args = []
+    for path in input_paths:
+        args += ['-i', path]
+    for index in range(len(input_paths)):
+        args += ['-map', f'{index}']
+    codecs = codec_args(video_codec, audio_codec, fast)
+    if codecs.count('copy') == 2:
+        logger.info("編碼兼容，直接 remux 不轉碼")
+    args += codecs + ['-movflags', '+faststart', output_path]
+    run_ffmpeg(args, duration, progress_callback, cancel_event)
+    return output_path
@@ -0,0 +1,368 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import nullcontext
+from threading import Event, Lock, Thread
+
+from config import Config
+from .state_backend import keep_alive, process_owner, state_backend
+from .youtube_service import download_video, resolve_video_target
+
+logger = logging.getLogger(__name__)
+
+# 任務狀態
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+TERMINAL_STATES = (DONE, ERROR, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """任務隊列已滿"""
+
+    def __init__(self, retry_after, message='下載隊列已滿，請稍後再試'):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DownloadJob:
+    """單個下載任務，擁有獨立的臨時目錄
+
+    任務記錄保存在狀態後端中，任意進程都可以讀取；cancel_event 和 done_event
+    只在執行任務的進程內有效。
+    """
+
+    KIND = 'download'
+
+    def __init__(self, backend, url, priority, scratch_dir, job_id=None):
+        self.backend = backend
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.priority = priority
+        self.scratch_dir = os.path.join(scratch_dir, self.id)
+        self.status = QUEUED
+        self.progress = 0
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = Event()
+        self.done_event = Event()
+        self.channel = backend.channel(f"{self.KIND}:{self.id}")
+
+    @classmethod
+    def from_record(cls, backend, record):
+        """由後端中的任務記錄恢復，進度取自進度通道的最新狀態"""
+        job = cls(backend, record['url'], record['priority'], '', job_id=record['job_id'])
+        for name in ('scratch_dir', 'status', 'progress', 'result', 'error', 'attempts',
+                     'cancel_requested', 'created_at', 'started_at', 'finished_at'):
+            setattr(job, name, record[name])
+        state = job.channel.state
+        if state and state.get('status') == job.status:
+            job.progress = state.get('progress', job.progress)
+        if job.cancel_requested:
+            job.cancel_event.set()
+        return job
+
+    def to_record(self):
+        return {
+            'job_id': self.id,
+            'url': self.url,
+            'priority': self.priority,
+            'scratch_dir': self.scratch_dir,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def save(self):
+        """寫入任務記錄"""
+        self.backend.save_record(self.KIND, self.id, self.to_record())
+
+    def update(self, *fields, expected=None):
+        """只寫入指定字段，不覆蓋其他進程同時修改的字段；expected 不匹配時不寫入，返回 False"""
+        changes = {name: getattr(self, name) for name in fields}
+        return self.backend.update_record(self.KIND, self.id, changes, expected)
+
+    def publish(self, stage=None):
+        """把當前狀態推送到進度通道，任務結束時關閉通道"""
+        if stage is None:
+            stage = self.status
+        state = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': stage,
+            'progress': round(self.progress, 1),
+        }
+        if self.error:
+            state['error'] = self.error
+        self.channel.publish(state, terminal=self.finished)
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATES
+
+    def wait(self, timeout=None):
+        """等待任務結束"""
+        return self.done_event.wait(timeout)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'progress': self.progress,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.result:
+            data['filename'] = self.result.get('filename')
+        return data
+
+
+class DownloadJobManager:
+    """有界的下載工作池，按優先級和提交順序（FIFO）處理任務
+
+    隊列和任務記錄保存在狀態後端中，使用共享後端時多個進程的工作線程從同一個
+    隊列認領任務。執行中的任務持有租約並定期續約，進程崩潰後租約過期，
+    任務被放回隊列由其他工作線程重新執行，超過重試次數時標記為失敗。
+    """
+
+    QUEUE = 'downloads'
+    # 工作線程檢查過期租約和跨進程取消請求的間隔（秒）
+    CHECK_INTERVAL = 5
+    # 同一階段內推送下載進度的最小間隔（秒），進度回調遠比這頻繁，每次都寫入後端沒有意義
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, runner, backend, workers, max_queue, scratch_dir, retention,
+                 lease=60, max_attempts=3):
+        self.runner = runner
+        self.backend = backend
+        self.workers = workers
+        self.max_queue = max_queue
+        self.scratch_dir = scratch_dir
+        self.retention = retention
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._active = {}
+        self._lock = Lock()
+        self._threads = []
+        self._durations = []
+
+    @property
+    def owner(self):
+        """隊列認領和租約的持有者；每次按當前進程計算，在主進程中創建後 fork 的 worker 各自不同"""
+        return process_owner()
+
+    def _ensure_workers(self):
+        """首次使用時啟動工作線程"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = Thread(target=self._work, name=f'download-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"已啟動 {self.workers} 個下載工作線程")
+
+    def queue_depth(self):
+        return self.backend.queue_length(self.QUEUE)
+
+    def retry_after(self):
+        """根據隊列深度和平均任務時長估算重試等待秒數"""
+        with self._lock:
+            durations = list(self._durations)
+        average = sum(durations) / len(durations) if durations else 60
+        waves = self.queue_depth() / max(self.workers, 1)
+        return max(1, int(average * max(waves, 1)))
+
+    def submit(self, url, priority=0):
+        """提交下載任務，隊列已滿時拋出 QueueFullError"""
+        self._prune()
+        if self.queue_depth() >= self.max_queue:
+            raise QueueFullError(self.retry_after())
+
+        job = DownloadJob(self.backend, url, priority, self.scratch_dir)
+        job.save()
+        job.publish()
+        self.backend.enqueue(self.QUEUE, job.id, priority)
+        self._ensure_workers()
+        logger.info(f"已提交下載任務 {job.id}: {url}")
+        return job
+
+    def get(self, job_id):
+        # 重啟後遺留在共享隊列中的任務也需要工作線程處理
+        self._ensure_workers()
+        with self._lock:
+            job = self._active.get(job_id)
+        if job is not None:
+            return job
+        record = self.backend.load_record(DownloadJob.KIND, job_id)
+        return DownloadJob.from_record(self.backend, record) if record else None
+
+    def latest(self):
+        """最近提交的任務"""
+        records = self.backend.list_records(DownloadJob.KIND)
+        if not records:
+            return None
+        return self.get(max(records, key=lambda record: record['created_at'])['job_id'])
+
+    def cancel(self, job_id):
+        """取消任務，排隊中的任務直接結束，運行中的任務在下一次進度回調時中止"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        if self.backend.remove(self.QUEUE, job.id):
+            self._finish(job, CANCELLED)
+            return job
+        # 運行中：本進程直接設置事件，其他進程的工作線程從任務記錄中讀取取消請求；
+        # 只更新取消標記，任務在此期間已結束時不改動記錄
+        job.cancel_requested = True
+        if not job.update('cancel_requested', expected={'status': [QUEUED, RUNNING]}):
+            return self.get(job_id)
+        job.cancel_event.set()
+        return job
+
+    def _finish(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.save()
+        job.done_event.set()
+        job.publish()
+
+    def _work(self):
+        last_check = 0
+        while True:
+            if time.monotonic() - last_check >= self.CHECK_INTERVAL:
+                last_check = time.monotonic()
+                self._recover()
+            job_id = self.backend.claim(self.QUEUE, self.owner, self.lease)
+            if job_id is None:
+                self.backend.wait_for_work(self.QUEUE, self.CHECK_INTERVAL)
+                continue
+            try:
+                record = self.backend.load_record(DownloadJob.KIND, job_id)
+                job = DownloadJob.from_record(self.backend, record) if record else None
+                if job is not None and not job.finished:
+                    self._run(job)
+            finally:
+                self.backend.complete(self.QUEUE, job_id)
+
+    def _recover(self):
+        """把崩潰進程遺留的任務放回隊列，超過重試次數的標記為失敗"""
+        for job_id in self.backend.recover(self.QUEUE):
+            record = self.backend.load_record(DownloadJob.KIND, job_id)
+            if record is None:
+                self.backend.remove(self.QUEUE, job_id)
+                continue
+            job = DownloadJob.from_record(self.backend, record)
+            if job.attempts >= self.max_attempts:
+                self.backend.remove(self.QUEUE, job_id)
+                self._finish(job, ERROR, error='下載任務多次中斷，已停止重試')
+            else:
+                job.status = QUEUED
+                job.progress = 0
+                job.update('status', 'progress')
+                job.publish()
+            logger.warning(f"恢復中斷的下載任務 {job_id}（第 {job.attempts} 次執行後中斷）")
+
+    def _renew(self, job):
+        """續約並檢查其他進程發出的取消請求"""
+        self.backend.renew_claim(self.QUEUE, job.id, self.owner, self.lease)
+        record = self.backend.load_record(DownloadJob.KIND, job.id)
+        if record and record.get('cancel_requested'):
+            job.cancel_event.set()
+
+    def _video_lock(self, url):
+        """同一視頻同時只下載一次，後到的任務等待後直接命中媒體存儲"""
+        try:
+            platform, video_id, _ = resolve_video_target(url)
+        except Exception:
+            return nullcontext()
+        return self.backend.lock(f"media:{platform}:{video_id}", ttl=self.lease)
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.attempts += 1
+        job.started_at = time.time()
+        # 認領後才到達的取消請求已寫入記錄，不能用讀取時的快照覆蓋
+        job.update('status', 'attempts', 'started_at')
+        job.publish('downloading')
+        os.makedirs(job.scratch_dir, exist_ok=True)
+        with self._lock:
+            self._active[job.id] = job
+
+        last_publish = {'stage': None, 'at': 0}
+
+        def on_progress(value, stage):
+            # 階段變化立即推送，同一階段內按間隔節流；結束狀態由 _finish 推送
+            job.progress = value
+            now = time.monotonic()
+            if stage == last_publish['stage'] and now - last_publish['at'] < self.PROGRESS_INTERVAL:
+                return
+            last_publish.update(stage=stage, at=now)
+            job.publish(stage)
+
+        try:
+            with keep_alive(lambda: self._renew(job), min(self.lease / 3, self.CHECK_INTERVAL)), \
+                    self._video_lock(job.url):
+                result = self.runner(
+                    job.url,
+                    output_path=job.scratch_dir,
+                    progress_callback=on_progress,
+                    cancel_event=job.cancel_event
+                )
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e)}
+
+        with self._lock:
+            self._active.pop(job.id, None)
+            if job.cancel_event.is_set():
+                self._finish(job, CANCELLED)
+            elif result.get('status') == 'error':
+                self._finish(job, ERROR, error=result.get('message'))
+            else:
+                job.progress = 100
+                self._finish(job, DONE, result=result)
+            self._durations = (self._durations + [job.finished_at - job.started_at])[-20:]
+        logger.info(f"下載任務 {job.id} 結束: {job.status}")
+
+    def _prune(self):
+        """移除超過保留時間的已結束任務及其臨時目錄"""
+        now = time.time()
+        for record in self.backend.list_records(DownloadJob.KIND):
+            if record['status'] in TERMINAL_STATES and now - record['finished_at'] > self.retention:
+                self.backend.delete_record(DownloadJob.KIND, record['job_id'])
+                self.backend.delete_channel(f"{DownloadJob.KIND}:{record['job_id']}")
+                shutil.rmtree(record['scratch_dir'], ignore_errors=True)
+
+
+download_jobs = DownloadJobManager(
+    download_video,
+    backend=state_backend,
+    workers=Config.DOWNLOAD_WORKERS,
+    max_queue=Config.DOWNLOAD_QUEUE_LIMIT,
+    scratch_dir=os.path.join(Config.DOWNLOAD_DIR, 'jobs'),
+    retention=Config.DOWNLOAD_JOB_RETENTION,
+    lease=Config.JOB_LEASE_SECONDS,
+    max_attempts=Config.JOB_MAX_ATTEMPTS,
+)
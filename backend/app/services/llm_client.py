@@ -0,0 +1,359 @@
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from threading import BoundedSemaphore, Condition, Lock
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def retryable_errors():
+    """可重試的上游錯誤：限流、服務端錯誤、連接失敗和超時"""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+    )
+
+
+class LLMNotConfiguredError(ValueError):
+    """未設置 OPENAI_API_KEY，AI 摘要功能不可用"""
+
+
+class CircuitOpenError(Exception):
+    """上游連續失敗，熔斷期間直接拒絕請求"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"AI 服務暫時不可用，請 {retry_after} 秒後重試")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text):
+    """粗略估算 token 數：中日韓字符約一個 token，其餘約四個字符一個 token"""
+    cjk = len(re.findall(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]', text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = Lock()
+
+
+def _load_encoding():
+    """從本地目錄加載 tiktoken 編碼，目錄中沒有時下載並保存"""
+    import tiktoken
+    os.environ.setdefault('TIKTOKEN_CACHE_DIR', Config.TIKTOKEN_CACHE_DIR)
+    os.makedirs(os.environ['TIKTOKEN_CACHE_DIR'], exist_ok=True)
+    return tiktoken.get_encoding(Config.TOKENIZER_ENCODING)
+
+
+def _get_encoding():
+    """延遲加載 tiktoken 編碼；編碼不可用時返回 None，只在首次失敗時記錄警告"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    _encoding = _load_encoding()
+                except Exception as e:
+                    logger.warning(f"tiktoken 編碼不可用，改用估算 token 數: {str(e)[:200]}")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def prefetch_encoding():
+    """預先下載 tiktoken 編碼到 TIKTOKEN_CACHE_DIR，在構建鏡像等可以聯網的階段調用"""
+    encoding = _load_encoding()
+    logger.info(f"已準備 tiktoken 編碼 {encoding.name}: {os.environ['TIKTOKEN_CACHE_DIR']}")
+
+
+def count_tokens(text):
+    """計算文本的 token 數，優先使用本地 tokenizer，不可用時退化為估算"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_request_tokens(request):
+    """估算一次請求消耗的 token：提示詞長度加上輸出上限"""
+    prompt = sum(estimate_tokens(message.get('content') or '') for message in request.get('messages', []))
+    return prompt + (request.get('max_tokens') or 0)
+
+
+class TokenBudget:
+    """滑動一分鐘窗口內的 token 預算，超出時阻塞等待窗口騰出額度"""
+
+    WINDOW = 60
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self._spent = deque()
+        self._total = 0
+        self._condition = Condition()
+
+    def _expire(self, now):
+        while self._spent and self._spent[0][0] <= now - self.WINDOW:
+            self._total -= self._spent.popleft()[1]
+
+    def acquire(self, tokens):
+        if not self.tokens_per_minute:
+            return
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                # 單個請求超過整個預算時，等窗口清空後放行，避免永久阻塞
+                if self._total + tokens <= self.tokens_per_minute or not self._spent:
+                    self._spent.append((now, tokens))
+                    self._total += tokens
+                    return
+                wait = self._spent[0][0] + self.WINDOW - now
+                self._condition.wait(timeout=max(wait, 0.05))
+
+    def used(self):
+        with self._condition:
+            self._expire(time.monotonic())
+            return self._total
+
+
+class CircuitBreaker:
+    """連續失敗達到閾值後熔斷，冷卻結束放行一個試探請求"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half_open'
+            return 'open'
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(max(1, int(remaining + 0.999)))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"AI 服務連續失敗 {self._failures} 次，熔斷 {self.cooldown} 秒")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+def retry_after_seconds(error):
+    """讀取錯誤響應中的 Retry-After（秒），沒有時返回 None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get('retry-after')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class ManagedStream:
+    """流式響應的包裝：讀完或關閉時釋放並發名額並斷開上游連接"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._closed = False
+        self._lock = Lock()
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        http_response = getattr(self._stream, 'response', None)
+        if http_response is not None:
+            http_response.close()
+        self._release()
+
+    def __del__(self):
+        self.close()
+
+
+class LLMClient:
+    """進程內共享的 OpenAI 客戶端
+
+    復用同一個 HTTP 連接池，限制並發請求數和每分鐘 token 數；429 / 5xx
+    按 Retry-After 或帶抖動的指數退避重試，上游持續失敗時熔斷。
+    OpenAI SDK 和 httpx 導入較慢，在創建客戶端時才加載。
+    """
+
+    def __init__(self, api_key, base_url=None, max_in_flight=8, tokens_per_minute=0,
+                 max_retries=4, backoff_base=1.0, backoff_max=30.0,
+                 breaker_threshold=5, breaker_cooldown=30, timeout=120):
+        import httpx
+        from openai import OpenAI, RateLimitError
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_in_flight = max_in_flight
+        self._slots = BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._lock = Lock()
+        self.budget = TokenBudget(tokens_per_minute)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._retryable = retryable_errors()
+        self._rate_limit_error = RateLimitError
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+        )
+        # 重試由本類統一處理，關閉 SDK 自帶的重試
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                             timeout=timeout, http_client=self._http)
+
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, attempt, error):
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def _send(self, request):
+        """發送請求，可重試的錯誤按退避策略重試"""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            try:
+                response = self.client.chat.completions.create(**request)
+            except self._retryable as e:
+                # 限流說明上游正常但額度不足，不計入熔斷
+                if isinstance(e, self._rate_limit_error):
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"AI 請求失敗（{type(e).__name__}），{delay:.1f} 秒後第 {attempt + 1} 次重試")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # 請求參數錯誤等不可重試的錯誤同樣說明上游可用
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return response
+
+    def create(self, **request):
+        """chat.completions.create 的受控版本
+
+        stream=True 時返回的迭代器在讀完或關閉前一直佔用並發名額，
+        重試只發生在建立連接階段。
+        """
+        self.budget.acquire(estimate_request_tokens(request))
+        self._acquire()
+        try:
+            response = self._send(request)
+        except BaseException:
+            self._release()
+            raise
+        if not request.get('stream'):
+            self._release()
+            return response
+        return ManagedStream(response, self._release)
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            'in_flight': in_flight,
+            'max_in_flight': self.max_in_flight,
+            'tokens_last_minute': self.budget.used(),
+            'tokens_per_minute': self.budget.tokens_per_minute,
+            'circuit': self.breaker.state,
+        }
+
+
+_client = None
+_client_lock = Lock()
+
+
+def get_llm_client():
+    """返回進程內共享的 LLMClient，首次調用時創建；未設置 API 密鑰時拋出 LLMNotConfiguredError"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.getenv('OPENAI_API_KEY')
+                if not api_key:
+                    raise LLMNotConfiguredError("AI 摘要功能未啟用：未設置 OPENAI_API_KEY 環境變量")
+                _client = LLMClient(
+                    api_key,
+                    base_url=Config.OPENAI_BASE_URL,
+                    max_in_flight=Config.LLM_MAX_IN_FLIGHT,
+                    tokens_per_minute=Config.LLM_TOKENS_PER_MINUTE,
+                    max_retries=Config.LLM_MAX_RETRIES,
+                    breaker_threshold=Config.LLM_BREAKER_THRESHOLD,
+                    breaker_cooldown=Config.LLM_BREAKER_COOLDOWN,
+                    timeout=Config.LLM_TIMEOUT
+                )
+    return _client
+
+
+def llm_configured():
+    """是否已配置 API 密鑰，不創建客戶端"""
+    return bool(os.getenv('OPENAI_API_KEY'))
+
+
+def llm_stats():
+    """共享客戶端的運行統計；客戶端尚未創建時只報告是否已配置"""
+    if _client is None:
+        return {'configured': llm_configured(), 'initialized': False}
+    return dict(_client.stats(), configured=True, initialized=True)
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from threading import Lock
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 固定記錄的有效期（秒），崩潰的 worker 遺留的固定記錄過期後不再阻止淘汰
+PIN_TTL = 6 * 3600
+
+
+def make_media_key(video_key, format_selector, profile):
+    """由 (平台:視頻ID, 格式選擇器, 後處理配置) 生成內容地址"""
+    raw = '\n'.join([video_key, format_selector, profile])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MediaStore:
+    """按內容地址管理已下載的媒體文件
+
+    寫入先落到同一文件系統的臨時文件再原子 rename；索引保存在 SQLite 中，
+    重啟後仍然有效；總大小超過上限時按最近訪問時間淘汰未被固定的文件。
+    固定記錄同樣保存在索引中，對共享存儲目錄的所有 worker 進程生效。
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.index_path = os.path.join(root, 'index.sqlite3')
+        self._lock = Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS media ('
+                'key TEXT PRIMARY KEY, path TEXT NOT NULL, filename TEXT NOT NULL, '
+                'size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS media_accessed ON media (accessed_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pins ('
+                'token TEXT PRIMARY KEY, key TEXT NOT NULL, pinned_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS pins_key ON pins (key)')
+            conn.commit()
+            self._conn = conn
+            self._reconcile()
+        return self._conn
+
+    def _reconcile(self):
+        """啟動時移除文件已丟失的索引記錄和殘留的臨時文件"""
+        rows = self._conn.execute('SELECT key, path FROM media').fetchall()
+        missing = [(key,) for key, path in rows if not os.path.exists(path)]
+        if missing:
+            self._conn.executemany('DELETE FROM media WHERE key = ?', missing)
+            self._conn.commit()
+            logger.info(f"已移除 {len(missing)} 條失效的媒體索引")
+
+        cutoff = time.time() - 24 * 3600
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _row_to_entry(self, row):
+        key, path, filename, size, created_at, accessed_at = row
+        return {
+            'key': key,
+            'path': path,
+            'filename': filename,
+            'size': size,
+            'created_at': created_at,
+            'accessed_at': accessed_at,
+        }
+
+    def lookup(self, key):
+        """查詢已緩存的媒體文件，命中時更新訪問時間"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT key, path, filename, size, created_at, accessed_at FROM media WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[1]):
+                conn.execute('DELETE FROM media WHERE key = ?', (key,))
+                conn.commit()
+                return None
+            conn.execute('UPDATE media SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+        return self._row_to_entry(row)
+
+    def commit(self, key, src_path, filename):
+        """把下載完成的文件原子地移入存儲並登記索引"""
+        ext = os.path.splitext(filename)[1]
+        dest_dir = os.path.join(self.objects_dir, key[:2])
+        dest_path = os.path.join(dest_dir, key + ext)
+
+        with self._lock:
+            self._connect()
+        os.makedirs(dest_dir, exist_ok=True)
+
+        # 先放到存儲目錄下的臨時文件，保證最終 rename 在同一文件系統內完成
+        tmp_path = os.path.join(self.tmp_dir, f'{key}.{uuid.uuid4().hex}{ext}')
+        try:
+            os.replace(src_path, tmp_path)
+        except OSError:
+            shutil.copyfile(src_path, tmp_path)
+            os.remove(src_path)
+        os.replace(tmp_path, dest_path)
+
+        now = time.time()
+        size = os.path.getsize(dest_path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO media (key, path, filename, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, dest_path, filename, size, now, now)
+            )
+            self._conn.commit()
+        logger.info(f"已存入媒體文件 {filename} ({size} bytes)")
+        # 剛存入的文件由調用方接着使用，即使單獨超出容量或其餘空間都被固定也不淘汰
+        self.evict(keep=(key,))
+        return self._row_to_entry((key, dest_path, filename, size, now, now))
+
+    def pin(self, key):
+        """固定文件，發送期間不會被任何進程淘汰；返回解除固定時使用的標記"""
+        token = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT INTO pins (token, key, pinned_at) VALUES (?, ?, ?)', (token, key, time.time()))
+            conn.commit()
+        return token
+
+    def unpin(self, token):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM pins WHERE token = ?', (token,))
+            conn.commit()
+
+    def total_bytes(self):
+        with self._lock:
+            conn = self._connect()
+            return conn.execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+
+    def evict(self, keep=()):
+        """總大小超出上限時，按最近訪問時間從舊到新淘汰未固定且不在 keep 中的文件"""
+        removed = []
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+            if total <= self.max_bytes:
+                return removed
+            conn.execute('DELETE FROM pins WHERE pinned_at <= ?', (time.time() - PIN_TTL,))
+            pinned = {key for key, in conn.execute('SELECT DISTINCT key FROM pins')}
+            pinned.update(keep)
+            rows = conn.execute(
+                'SELECT key, path, size FROM media ORDER BY accessed_at ASC'
+            ).fetchall()
+            for key, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key in pinned:
+                    continue
+                conn.execute('DELETE FROM media WHERE key = ?', (key,))
+                removed.append(path)
+                total -= size
+            conn.commit()
+
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"刪除媒體文件失敗: {str(e)}")
+        if removed:
+            logger.info(f"已淘汰 {len(removed)} 個媒體文件")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            count, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media'
+            ).fetchone()
+            pinned = conn.execute(
+                'SELECT COUNT(DISTINCT key) FROM pins WHERE pinned_at > ?', (time.time() - PIN_TTL,)
+            ).fetchone()[0]
+        return {
+            'files': count,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'pinned': pinned,
+        }
+
+
+media_store = MediaStore(Config.MEDIA_STORE_DIR, Config.MEDIA_STORE_MAX_BYTES)
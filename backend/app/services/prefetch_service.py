@@ -0,0 +1,199 @@
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from queue import PriorityQueue
+from threading import Condition, Thread
+
+from config import Config
+from .llm_client import llm_configured
+from .youtube_service import get_video_transcript, resolve_video_target
+
+logger = logging.getLogger(__name__)
+
+# 預取操作及其優先級，數值越小越先執行；摘要依賴字幕，在字幕預取完成後才排入
+TRANSCRIPT = 'transcript'
+SUMMARY = 'summary'
+PRIORITIES = {TRANSCRIPT: 1, SUMMARY: 2}
+
+# 用戶請求較多時，預取線程重新檢查的間隔（秒）
+YIELD_INTERVAL = 0.5
+
+
+class PrefetchTask:
+    """單個預取任務，排隊超過有效期或被取消時不再執行"""
+
+    def __init__(self, op, url, key, duration, ttl):
+        self.op = op
+        self.url = url
+        self.key = key
+        self.duration = duration
+        self.expires_at = time.time() + ttl
+        self.cancelled = False
+        self.started = False
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+
+class PrefetchScheduler:
+    """低優先級的後台預取
+
+    獲取視頻信息後預先抓取字幕（可選摘要）寫入各自的緩存，後續請求直接命中緩存；
+    預取進行中時相同的用戶請求通過 single-flight 共用結果。工作線程數即並發預算，
+    有用戶請求在進行時讓出，用戶請求到達前尚未開始的預取由用戶請求取代。
+    """
+
+    def __init__(self, enabled, summary, workers, max_queue, ttl, yield_threshold):
+        self.enabled = enabled
+        self.summary = summary
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.yield_threshold = yield_threshold
+        self._queue = PriorityQueue()
+        self._tasks = {}
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._threads = []
+        self._user_active = 0
+        self._ai_service = None
+        self._stats = {
+            'scheduled': 0,
+            'completed': 0,
+            'failed': 0,
+            'expired': 0,
+            'cancelled': 0,
+            'dropped': 0,
+        }
+
+    @property
+    def ai_service(self):
+        """首次預取摘要時才創建 AI 服務"""
+        with self._condition:
+            if self._ai_service is None:
+                from .ai_service import AIService
+                self._ai_service = AIService()
+            return self._ai_service
+
+    def _ensure_workers(self):
+        """首次排入任務時啟動工作線程"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = Thread(target=self._work, name=f'prefetch-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"已啟動 {self.workers} 個預取工作線程")
+
+    def after_video_info(self, url, info, enabled=None):
+        """視頻信息獲取成功後調用；enabled 為 False 時跳過，只能關閉不能繞過 PREFETCH_ENABLED"""
+        if not self.enabled or enabled is False:
+            return
+        self.schedule(TRANSCRIPT, url, info.get('platform'), info.get('video_id'), info.get('duration') or 0)
+
+    def schedule(self, op, url, platform, video_id, duration=0):
+        """排入預取任務，同一視頻的同一操作已在隊列或執行中時忽略"""
+        key = f"{op}:{platform}:{video_id}"
+        with self._condition:
+            if key in self._tasks:
+                return None
+            if len(self._tasks) >= self.max_queue:
+                self._stats['dropped'] += 1
+                return None
+            task = PrefetchTask(op, url, key, duration, self.ttl)
+            self._tasks[key] = task
+            self._stats['scheduled'] += 1
+            self._ensure_workers()
+        self._queue.put((PRIORITIES[op], next(self._sequence), task))
+        logger.info(f"已排入預取任務: {key}")
+        return task
+
+    def cancel(self, url, ops=(TRANSCRIPT, SUMMARY)):
+        """用戶已發起相同的請求時取消尚未開始的預取"""
+        try:
+            platform, video_id, _ = resolve_video_target(url)
+        except Exception:
+            return
+        with self._condition:
+            for op in ops:
+                task = self._tasks.get(f"{op}:{platform}:{video_id}")
+                if task is not None and not task.started:
+                    task.cancelled = True
+
+    @contextmanager
+    def user_request(self):
+        """標記用戶請求進行中，期間預取線程在達到閾值時暫停開始新任務"""
+        with self._condition:
+            self._user_active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._user_active -= 1
+                self._condition.notify_all()
+
+    def _claim(self, task):
+        """等待用戶請求讓出後開始任務，任務被取消或過期時返回 False"""
+        with self._condition:
+            while self._user_active >= self.yield_threshold and not task.cancelled and not task.expired:
+                self._condition.wait(YIELD_INTERVAL)
+            if task.cancelled:
+                self._stats['cancelled'] += 1
+            elif task.expired:
+                self._stats['expired'] += 1
+            else:
+                task.started = True
+                return True
+            self._tasks.pop(task.key, None)
+            return False
+
+    def _work(self):
+        while True:
+            _, _, task = self._queue.get()
+            if not self._claim(task):
+                continue
+            try:
+                self._run(task)
+                outcome = 'completed'
+            except Exception as e:
+                logger.warning(f"預取任務 {task.key} 失敗: {str(e)}")
+                outcome = 'failed'
+            with self._condition:
+                self._tasks.pop(task.key, None)
+                self._stats[outcome] += 1
+
+    def _run(self, task):
+        transcript = get_video_transcript(task.url)
+        # 無字幕時返回提示文本，沒有可預取的摘要
+        if isinstance(transcript, str):
+            return
+        if task.op == TRANSCRIPT:
+            if self.summary and llm_configured():
+                _, platform, video_id = task.key.split(':', 2)
+                self.schedule(SUMMARY, task.url, platform, video_id, task.duration)
+        else:
+            self.ai_service.summarize_transcript(transcript.to_text(), task.duration)
+        logger.info(f"預取完成: {task.key}")
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                'enabled': self.enabled,
+                'summary': self.summary,
+                'pending': len(self._tasks),
+                'user_active': self._user_active,
+            })
+            return stats
+
+
+prefetcher = PrefetchScheduler(
+    enabled=Config.PREFETCH_ENABLED,
+    summary=Config.PREFETCH_SUMMARY,
+    workers=Config.PREFETCH_WORKERS,
+    max_queue=Config.PREFETCH_QUEUE_LIMIT,
+    ttl=Config.PREFETCH_TTL,
+    yield_threshold=Config.PREFETCH_YIELD_THRESHOLD,
+)
@@ -0,0 +1,351 @@
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+from config import Config
+from .job_service import QUEUED, RUNNING, DONE, ERROR, TERMINAL_STATES, QueueFullError
+from .llm_client import llm_configured
+from .prefetch_service import prefetcher
+from .state_backend import keep_alive, process_owner, state_backend
+from .youtube_service import NO_TRANSCRIPT, get_video_info, get_video_transcript, resolve_video_target
+
+logger = logging.getLogger(__name__)
+
+# 階段狀態（運行中、完成、失敗沿用任務狀態）
+PENDING = 'pending'
+SKIPPED = 'skipped'
+STAGES = ('info', 'transcript', 'summary')
+
+# 摘要生成過程中推送部分結果的最小間隔（秒）
+PARTIAL_INTERVAL = 0.25
+
+
+class StageError(Exception):
+    """階段沒有產出可用結果"""
+
+
+class StageSkipped(Exception):
+    """階段正常結束但沒有結果（例如視頻沒有字幕），異常信息作為跳過原因"""
+
+
+class ProcessJob:
+    """一站式處理任務：依次產出視頻信息、字幕和摘要，記錄每個階段的狀態
+
+    每次狀態變化同時寫入狀態後端的任務記錄和進度通道，其他進程可以查詢和訂閱。
+    """
+
+    KIND = 'process'
+
+    def __init__(self, backend, url, platform, video_id, options):
+        self.backend = backend
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.platform = platform
+        self.video_id = video_id
+        self.options = options
+        self.status = QUEUED
+        self.stages = {name: {'status': PENDING} for name in STAGES}
+        self.info = None
+        self.transcript = None
+        self.summary = None
+        self.partial = {'toc': '', 'notes': ''}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done_event = Event()
+        self.channel = backend.channel(f"{self.KIND}:{self.id}")
+        # 信息和字幕階段在不同線程中並行更新任務
+        self._lock = Lock()
+        self.publish()
+
+    def publish(self):
+        """保存任務記錄並推送到進度通道，任務結束時關閉通道"""
+        state = self.to_dict()
+        self.backend.save_record(self.KIND, self.id, state)
+        self.channel.publish(state, terminal=self.finished)
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATES
+
+    def wait(self, timeout=None):
+        """等待任務結束"""
+        return self.done_event.wait(timeout)
+
+    def start(self):
+        with self._lock:
+            self.status = RUNNING
+            self.started_at = time.time()
+        self.publish()
+
+    def start_stage(self, name):
+        with self._lock:
+            self.stages[name] = {'status': RUNNING, 'started_at': time.time()}
+        self.publish()
+
+    def finish_stage(self, name, status, result=None, error=None, **details):
+        """記錄階段結果，成功時保存到同名屬性"""
+        with self._lock:
+            stage = self.stages[name]
+            stage['status'] = status
+            stage.update(details)
+            if 'started_at' in stage:
+                stage['finished_at'] = time.time()
+                stage['elapsed'] = round(stage['finished_at'] - stage['started_at'], 3)
+            if error:
+                stage['error'] = error
+            if status == DONE:
+                setattr(self, name, result)
+        self.publish()
+
+    def add_partial(self, section, delta):
+        with self._lock:
+            self.partial[section] += delta
+
+    def finish(self):
+        """所有階段結束後確定任務狀態，任一階段失敗時以第一個錯誤結束"""
+        with self._lock:
+            errors = [self.stages[name].get('error') for name in STAGES
+                      if self.stages[name]['status'] == ERROR]
+            self.status = ERROR if errors else DONE
+            self.error = errors[0] if errors else None
+            self.finished_at = time.time()
+        self.done_event.set()
+        self.publish()
+
+    def to_dict(self):
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'url': self.url,
+                'platform': self.platform,
+                'video_id': self.video_id,
+                'status': self.status,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+            if self.info is not None:
+                data['info'] = self.info
+            if self.transcript is not None:
+                data['transcript'] = {
+                    'language': self.transcript.language,
+                    'source': self.transcript.source,
+                    'segments': len(self.transcript),
+                }
+            if self.summary is not None:
+                data['summary'] = self.summary
+            elif self.stages['summary']['status'] == RUNNING:
+                data['partial'] = dict(self.partial)
+            if self.error:
+                data['error'] = self.error
+            return data
+
+
+class StoredProcessJob:
+    """從狀態後端讀出的處理任務（可能由其他進程執行），只讀"""
+
+    def __init__(self, backend, record):
+        self.record = record
+        self.id = record['job_id']
+        self.status = record['status']
+        self.channel = backend.channel(f"{ProcessJob.KIND}:{self.id}")
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATES
+
+    def to_dict(self):
+        return dict(self.record)
+
+
+class ProcessJobManager:
+    """一站式處理任務池
+
+    每個任務中信息和字幕兩個階段互不依賴，並行執行；摘要階段需要字幕和視頻時長，
+    在兩者完成後於服務端直接生成，客戶端無需再上傳字幕。
+
+    任務在提交它的進程內執行，執行期間持有租約；租約過期而任務未結束說明執行進程
+    已退出，查詢時把任務標記為失敗。
+    """
+
+    def __init__(self, backend, workers, max_queue, retention, lease=60):
+        self.backend = backend
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.lease = lease
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='process')
+        # 每個運行中的任務最多佔用一個階段線程，不會相互等待
+        self._stage_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='process-stage')
+        self._jobs = {}
+        self._lock = Lock()
+        self._ai_service = None
+
+    @property
+    def owner(self):
+        """任務租約的持有者，取當前進程而不是創建管理器的進程"""
+        return process_owner()
+
+    @property
+    def ai_service(self):
+        """首次生成摘要時才創建 AI 服務，未配置 API 密鑰只影響摘要階段"""
+        with self._lock:
+            if self._ai_service is None:
+                from .ai_service import AIService
+                self._ai_service = AIService()
+            return self._ai_service
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def submit(self, url, use_cache=True, refresh=False):
+        """提交處理任務；URL 無效時拋出異常，隊列已滿時拋出 QueueFullError"""
+        self._prune()
+        platform, video_id, _ = resolve_video_target(url)
+        if self.queue_depth() >= self.max_queue:
+            raise QueueFullError(5, '處理隊列已滿，請稍後再試')
+
+        job = ProcessJob(self.backend, url, platform, video_id, {'use_cache': use_cache, 'refresh': refresh})
+        self.backend.acquire_lease(self._lease_name(job.id), self.owner, self.lease)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        logger.info(f"已提交處理任務 {job.id}: {url}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = self.backend.load_record(ProcessJob.KIND, job_id)
+        return self._stored(record) if record else None
+
+    def latest(self, video_id):
+        """指定視頻最近提交的任務"""
+        records = [record for record in self.backend.list_records(ProcessJob.KIND)
+                   if record['video_id'] == video_id]
+        if not records:
+            return None
+        return self.get(max(records, key=lambda record: record['created_at'])['job_id'])
+
+    def _lease_name(self, job_id):
+        return f"{ProcessJob.KIND}:{job_id}"
+
+    def _stored(self, record):
+        """其他進程的任務；執行進程的租約已過期而任務未結束時標記為失敗"""
+        job = StoredProcessJob(self.backend, record)
+        if not job.finished and self.backend.lease_owner(self._lease_name(job.id)) is None:
+            record = dict(record, status=ERROR, error='處理中斷：執行任務的進程已退出', finished_at=time.time())
+            self.backend.save_record(ProcessJob.KIND, job.id, record)
+            job.channel.publish(record, terminal=True)
+            job = StoredProcessJob(self.backend, record)
+        return job
+
+    def _run(self, job):
+        lease = self._lease_name(job.id)
+        try:
+            with prefetcher.user_request(), keep_alive(
+                lambda: self.backend.acquire_lease(lease, self.owner, self.lease), self.lease / 3
+            ):
+                self._run_stages(job)
+        finally:
+            self.backend.release_lease(lease, self.owner)
+
+    def _run_stages(self, job):
+        try:
+            job.start()
+            info_future = self._stage_executor.submit(
+                self._run_stage, job, 'info', self._fetch_info, job.url
+            )
+            transcript = self._run_stage(job, 'transcript', self._fetch_transcript, job.url)
+            info = info_future.result()
+
+            if job.stages['transcript']['status'] == SKIPPED:
+                job.finish_stage('summary', SKIPPED, reason='視頻沒有字幕，跳過摘要')
+            elif info is None or transcript is None:
+                job.finish_stage('summary', SKIPPED)
+            elif not llm_configured():
+                # 未配置 AI 服務時只產出信息和字幕
+                job.finish_stage('summary', SKIPPED, reason='未設置 OPENAI_API_KEY，跳過摘要')
+            else:
+                self._run_stage(job, 'summary', self._summarize, job,
+                                transcript.to_text(), info.get('duration') or 0)
+        except Exception as e:
+            logger.error(f"處理任務 {job.id} 出錯: {str(e)}", exc_info=True)
+            for name in STAGES:
+                if job.stages[name]['status'] in (PENDING, RUNNING):
+                    job.finish_stage(name, ERROR, error=str(e))
+        finally:
+            job.finish()
+            logger.info(f"處理任務 {job.id} 結束: {job.status}")
+
+    def _run_stage(self, job, name, func, *args):
+        """執行單個階段並記錄狀態，失敗或跳過時返回 None"""
+        job.start_stage(name)
+        try:
+            result, details = func(*args)
+        except StageSkipped as e:
+            logger.info(f"處理任務 {job.id} 跳過 {name} 階段: {str(e)}")
+            job.finish_stage(name, SKIPPED, reason=str(e))
+            return None
+        except Exception as e:
+            logger.error(f"處理任務 {job.id} 的 {name} 階段失敗: {str(e)}")
+            job.finish_stage(name, ERROR, error=str(e))
+            return None
+        job.finish_stage(name, DONE, result, **details)
+        return result
+
+    def _fetch_info(self, url):
+        return get_video_info(url), {}
+
+    def _fetch_transcript(self, url):
+        transcript = get_video_transcript(url)
+        # 沒有字幕不是錯誤，任務照常完成；獲取失敗時返回的也是提示文本，按失敗處理
+        if transcript == NO_TRANSCRIPT:
+            raise StageSkipped(transcript)
+        if isinstance(transcript, str):
+            raise StageError(transcript)
+        return transcript, {}
+
+    def _summarize(self, job, transcript, duration):
+        """流式生成摘要，按間隔推送已生成的部分"""
+        last_publish = 0
+        for event in self.ai_service.stream_summary(transcript, duration, **job.options):
+            if 'error' in event:
+                raise StageError(event['error'])
+            if event.get('done'):
+                return event['summary'], {'cached': event['cached']}
+            job.add_partial(event['section'], event['delta'])
+            now = time.monotonic()
+            if now - last_publish >= PARTIAL_INTERVAL:
+                job.publish()
+                last_publish = now
+        raise StageError('摘要生成中斷')
+
+    def _prune(self):
+        """移除超過保留時間的已結束任務"""
+        now = time.time()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished:
+                    del self._jobs[job_id]
+        for record in self.backend.list_records(ProcessJob.KIND):
+            if record['status'] in TERMINAL_STATES and now - record['finished_at'] > self.retention:
+                self.backend.delete_record(ProcessJob.KIND, record['job_id'])
+                self.backend.delete_channel(f"{ProcessJob.KIND}:{record['job_id']}")
+
+
+process_jobs = ProcessJobManager(
+    backend=state_backend,
+    workers=Config.PROCESS_WORKERS,
+    max_queue=Config.PROCESS_QUEUE_LIMIT,
+    retention=Config.PROCESS_JOB_RETENTION,
+    lease=Config.JOB_LEASE_SECONDS,
+)
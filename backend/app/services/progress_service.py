@@ -0,0 +1,80 @@
+import json
+import logging
+from threading import Condition
+
+logger = logging.getLogger(__name__)
+
+# 無新事件時發送保活註釋的間隔（秒）
+KEEPALIVE_INTERVAL = 15
+
+
+class ProgressChannel:
+    """單個任務的進度通道
+
+    發布方只更新最新狀態並喚醒等待者，訂閱方醒來時只讀取最新狀態，
+    中間狀態自然合併；遲到的訂閱者會先收到最後一次已知狀態。
+    通道只存在於當前進程內，多 worker 部署時由狀態後端的 StateChannel 代替。
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._state = None
+        self._version = 0
+        self._closed = False
+
+    @property
+    def state(self):
+        with self._condition:
+            return self._state
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+    def publish(self, state, terminal=False):
+        """發布新狀態，與上一次相同的狀態會被忽略"""
+        with self._condition:
+            if self._closed:
+                return
+            if state == self._state and not terminal:
+                return
+            self._state = state
+            self._version += 1
+            self._closed = terminal
+            self._condition.notify_all()
+
+    def subscribe(self, keepalive=KEEPALIVE_INTERVAL):
+        """按變化產出狀態，超時無變化時產出 None 作為保活信號，終止狀態後結束"""
+        seen = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._version != seen, timeout=keepalive)
+                if self._version == seen:
+                    state = None
+                else:
+                    seen = self._version
+                    state = self._state
+                closed = self._closed and state is not None
+            yield state
+            if closed:
+                return
+
+
+def sse_stream(channel, keepalive=KEEPALIVE_INTERVAL):
+    """把進度通道轉換為 SSE 文本流"""
+    for state in channel.subscribe(keepalive):
+        if state is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"data: {json.dumps(state)}\n\n"
+
+
+def sse_events(events):
+    """把事件字典序列轉換為 SSE 文本流，每個事件原樣發送、不做合併"""
+    for event in events:
+        yield f"data: {json.dumps(event)}\n\n"
@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+PART_RETRIES = 3
+
+
+class ByteProgress:
+    """彙總多條流、多個分段的下載字節數"""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._totals = {}
+        self._downloaded = {}
+        self._lock = Lock()
+
+    def set_total(self, key, total):
+        with self._lock:
+            self._totals[key] = total or 0
+
+    def set_downloaded(self, key, downloaded):
+        """用於 yt-dlp 進度回調這類直接給出累計值的來源"""
+        with self._lock:
+            self._downloaded[key] = downloaded
+        self._notify()
+
+    def add(self, key, amount):
+        with self._lock:
+            self._downloaded[key] = self._downloaded.get(key, 0) + amount
+        self._notify()
+
+    def fraction(self):
+        with self._lock:
+            total = sum(self._totals.values())
+            downloaded = sum(self._downloaded.values())
+        if not total:
+            return 0.0
+        return min(1.0, downloaded / total)
+
+    def _notify(self):
+        if self.callback:
+            self.callback(self.fraction())
+
+
+class _Throttle:
+    """單連接限速，rate 為每秒字節數，0 表示不限速"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        self.consumed += amount
+        expected = self.consumed / self.rate
+        elapsed = time.monotonic() - self.started
+        if expected > elapsed:
+            time.sleep(expected - elapsed)
+
+
+def _split_ranges(size, connections, min_segment):
+    """把 [0, size) 切分為不超過 connections 個、每段不小於 min_segment 的區間"""
+    count = max(1, min(connections, size // max(min_segment, 1)))
+    step = -(-size // count)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def probe_range_support(session, url, headers):
+    """探測資源大小以及服務器是否支持 Range 請求"""
+    response = session.get(url, headers=dict(headers, Range='bytes=0-0'), stream=True, timeout=30)
+    try:
+        if response.status_code != 206:
+            return None
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    finally:
+        response.close()
+
+
+def fetch_segmented(url, path, headers=None, cookies=None, connections=4, rate_limit=0,
+                    min_segment=1024 * 1024, progress=None, progress_key=None,
+                    cancel_event=None, session=None, chunk_size=None):
+    """用多個並行 Range 請求下載單個文件
+
+    各分段寫入預分配文件的對應偏移；服務器不支持 Range 時退化為單連接下載。
+    chunk_size 為單次請求的字節上限（yt-dlp 格式中的 downloader_options.http_chunk_size），
+    每個連接按此大小依次請求子區間，YouTube 等平台會對超過該大小的 Range 請求限速。
+    返回下載的總字節數。
+    """
+    import requests
+    from yt_dlp.utils import DownloadCancelled, DownloadError
+
+    headers = dict(headers or {})
+    session = session or requests.Session()
+    if cookies is not None:
+        session.cookies = cookies
+    progress_key = progress_key or path
+
+    size = probe_range_support(session, url, headers)
+    ranges = _split_ranges(size, connections, min_segment) if size else [(0, None)]
+    if progress:
+        progress.set_total(progress_key, size)
+
+    with open(path, 'wb') as f:
+        if size:
+            f.truncate(size)
+
+    # 任一分段失敗時通知其餘分段儘快停止
+    failed = Event()
+
+    def fetch_part(start, end):
+        offset = start
+        throttle = _Throttle(rate_limit)
+        failures = 0
+        while True:
+            part_headers = dict(headers)
+            if end is not None:
+                stop = min(end, offset + chunk_size - 1) if chunk_size else end
+                part_headers['Range'] = f'bytes={offset}-{stop}'
+            elif offset > start:
+                # 不支持 Range 時只能從頭重新下載
+                if progress:
+                    progress.add(progress_key, start - offset)
+                offset = start
+            requested = offset
+            try:
+                with session.get(url, headers=part_headers, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    if end is not None and response.status_code != 206:
+                        raise Exception("服務器未按 Range 返回分段")
+                    with open(path, 'r+b') as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(READ_SIZE):
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise DownloadCancelled('下載已取消')
+                            if failed.is_set():
+                                return
+                            f.write(chunk)
+                            offset += len(chunk)
+                            throttle.consume(len(chunk))
+                            if progress:
+                                progress.add(progress_key, len(chunk))
+                if end is None or offset > end:
+                    return
+            except (requests.RequestException, OSError) as e:
+                logger.warning(f"分段 {start}-{end} 在偏移 {offset} 處下載失敗: {str(e)}")
+            # 沒有進展的請求計為一次失敗，取得進展後重新計數；不支持 Range 時每次中斷都從頭開始
+            failures = failures + 1 if end is None or offset == requested else 0
+            if failures >= PART_RETRIES:
+                raise DownloadError(f"分段 {start}-{end} 下載失敗")
+
+    def run_part(start, end):
+        try:
+            fetch_part(start, end)
+        except BaseException:
+            failed.set()
+            raise
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(run_part, start, end) for start, end in ranges]
+        for future in futures:
+            future.result()
+
+    return os.path.getsize(path)
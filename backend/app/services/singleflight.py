@@ -0,0 +1,86 @@
+import logging
+from concurrent.futures import Future
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class CallAbandoned(Exception):
+    """leader 沒有完成調用就退出（例如客戶端斷開），等待者應重新發起，而不是當作失敗"""
+
+
+class SingleFlight:
+    """合併相同的進行中調用
+
+    同一個鍵同時只執行一次：第一個調用方（leader）實際執行，其餘調用方等待同一個
+    Future，得到相同的結果或異常。調用結束即移除，結果不做緩存，失敗後的下一次調用會重新執行。
+    leader 中途放棄時等待者收到 CallAbandoned，由其中一個接替成為新的 leader 重新執行。
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self._executed = 0
+        self._shared = 0
+        self._abandoned = 0
+
+    def begin(self, key):
+        """加入鍵對應的調用，返回 (Future, 是否為 leader)；leader 必須調用 finish"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._shared += 1
+                return call, False
+            call = Future()
+            self._calls[key] = call
+            self._executed += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """leader 結束調用，喚醒所有等待者"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+
+    def abandon(self, key, call):
+        """leader 放棄調用：喚醒等待者重新發起，不把取消當作結果發布"""
+        with self._lock:
+            self._abandoned += 1
+        self.finish(key, call, error=CallAbandoned(key))
+
+    def do(self, key, func, *args, **kwargs):
+        """執行 func 或等待進行中的相同調用，返回結果或拋出其異常"""
+        while True:
+            call, leader = self.begin(key)
+            if leader:
+                break
+            logger.debug(f"合併進行中的調用: {key}")
+            try:
+                return call.result()
+            except CallAbandoned:
+                logger.info(f"進行中的調用已放棄，重新發起: {key}")
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self._executed,
+                'shared': self._shared,
+                'abandoned': self._abandoned,
+            }
+
+
+# 進程內共用，鍵為 "操作:平台:視頻ID"（摘要為 "summary:緩存鍵"）
+inflight = SingleFlight()
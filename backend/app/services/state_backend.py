@@ -0,0 +1,829 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from threading import Condition, Event, Lock, Thread
+
+from config import Config
+from .progress_service import KEEPALIVE_INTERVAL, ProgressChannel
+
+logger = logging.getLogger(__name__)
+
+# 輪詢型後端檢查隊列和鎖的間隔（秒）
+POLL_INTERVAL = 0.25
+
+# 進度通道的兜底重讀間隔（秒）：SQLite 監視線程或 Redis 發布通知出錯時，訂閱者最多等待這麼久
+CHANNEL_FALLBACK_INTERVAL = 15
+
+# SQLite 後端檢查其他進程寫入的間隔（秒）：每個進程只有一個監視線程，
+# PRAGMA data_version 未變化時不讀取任何表
+CHANGE_CHECK_INTERVAL = 0.1
+
+
+def process_owner():
+    """當前進程的唯一標識，用作隊列認領和租約的持有者"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class StateChannel:
+    """基於後端讀寫的進度通道，接口與 ProgressChannel 相同
+
+    訂閱方在後端的變化通知上等待，收到通知或兜底超時後才重新讀取通道。
+    """
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    @property
+    def state(self):
+        return self.backend.read_channel(self.name)[1]
+
+    @property
+    def closed(self):
+        return self.backend.read_channel(self.name)[2]
+
+    def publish(self, state, terminal=False):
+        self.backend.publish(self.name, state, terminal)
+
+    def subscribe(self, keepalive=KEEPALIVE_INTERVAL):
+        """按變化產出狀態，超時無變化時產出 None 作為保活信號，終止狀態後結束"""
+        seen = 0
+        idle_since = time.monotonic()
+        # 先訂閱變化通知再讀取，讀取之後的發布不會丟失
+        with self.backend.watch_channel(self.name) as wait:
+            while True:
+                version, state, closed = self.backend.read_channel(self.name)
+                if version != seen and state is not None:
+                    seen = version
+                    idle_since = time.monotonic()
+                    yield state
+                    if closed:
+                        return
+                    continue
+                remaining = keepalive - (time.monotonic() - idle_since)
+                if remaining <= 0:
+                    idle_since = time.monotonic()
+                    yield None
+                else:
+                    wait(seen, remaining)
+
+
+class StateBackend:
+    """協調狀態後端
+
+    保存任務記錄、進度狀態、帶租約的任務隊列和鎖，多個進程（或節點）通過同一個
+    後端協調。子類實現基本操作；進度訂閱的變化通知、等待新任務和阻塞鎖默認以輪詢實現。
+
+    隊列中的任務被認領後持有租約，持有者定期續約；持有者崩潰後租約過期，
+    recover 把任務放回隊列，由其他工作線程重新執行。
+    """
+
+    poll_interval = POLL_INTERVAL
+
+    # 任務記錄
+
+    def save_record(self, kind, record_id, record):
+        raise NotImplementedError
+
+    def load_record(self, kind, record_id):
+        raise NotImplementedError
+
+    def list_records(self, kind):
+        raise NotImplementedError
+
+    def update_record(self, kind, record_id, changes, expected=None):
+        """原子地更新記錄中的部分字段，不覆蓋其他字段
+
+        expected 為 {字段: 允許的取值列表}，記錄不存在或任一字段不在允許的取值中時
+        不更新並返回 False。
+        """
+        raise NotImplementedError
+
+    def delete_record(self, kind, record_id):
+        raise NotImplementedError
+
+    # 進度
+
+    def publish(self, channel, state, terminal=False):
+        """發布進度狀態，與上一次相同的狀態忽略，通道結束後的發布忽略"""
+        raise NotImplementedError
+
+    def read_channel(self, channel):
+        """返回 (版本號, 最新狀態, 是否已結束)"""
+        raise NotImplementedError
+
+    def delete_channel(self, channel):
+        raise NotImplementedError
+
+    @contextmanager
+    def watch_channel(self, channel):
+        """訂閱通道的變化通知，yield wait(version, timeout)：等到通道版本號超過 version
+        或超時後返回，返回後由調用方重新讀取；默認按 poll_interval 休眠"""
+        yield lambda version, timeout: time.sleep(min(timeout, self.poll_interval))
+
+    def channel(self, name):
+        return StateChannel(self, name)
+
+    # 隊列
+
+    def enqueue(self, queue, item_id, priority=0):
+        raise NotImplementedError
+
+    def claim(self, queue, owner, lease):
+        """認領優先級最高（數值最小）、最早入隊的任務，返回任務 ID 或 None"""
+        raise NotImplementedError
+
+    def renew_claim(self, queue, item_id, owner, lease):
+        """續約已認領的任務，認領已失效時返回 False"""
+        raise NotImplementedError
+
+    def complete(self, queue, item_id):
+        """移除已認領的任務"""
+        raise NotImplementedError
+
+    def remove(self, queue, item_id):
+        """移除尚未被認領的任務，成功時返回 True"""
+        raise NotImplementedError
+
+    def recover(self, queue):
+        """把租約已過期的任務放回隊列，返回這些任務的 ID"""
+        raise NotImplementedError
+
+    def queue_length(self, queue):
+        """等待認領的任務數"""
+        raise NotImplementedError
+
+    def wait_for_work(self, queue, timeout):
+        """等待新任務入隊，輪詢型後端直接休眠"""
+        time.sleep(min(timeout, self.poll_interval * 4))
+
+    # 租約
+
+    def acquire_lease(self, name, owner, ttl):
+        """獲取或續約租約，已被其他持有者持有時返回 False"""
+        raise NotImplementedError
+
+    def release_lease(self, name, owner):
+        raise NotImplementedError
+
+    def lease_owner(self, name):
+        """當前有效的持有者，無人持有時返回 None"""
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, name, ttl=60, timeout=None, owner=None):
+        """跨進程互斥鎖，持有期間自動續約；timeout 秒內未獲得時拋出 TimeoutError"""
+        owner = owner or f"{process_owner()}:{uuid.uuid4().hex}"
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.acquire_lease(name, owner, ttl):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"等待鎖 {name} 超時")
+            time.sleep(self.poll_interval)
+        try:
+            with keep_alive(lambda: self.acquire_lease(name, owner, ttl), ttl / 3):
+                yield
+        finally:
+            self.release_lease(name, owner)
+
+    @contextmanager
+    def semaphore(self, name, count, ttl=60, cancel_event=None):
+        """跨進程計數信號量：共 count 個租約槽位，持有其中之一即可進入
+
+        等待期間 cancel_event 被設置時拋出 InterruptedError。
+        """
+        owner = f"{process_owner()}:{uuid.uuid4().hex}"
+        lease = None
+        while lease is None:
+            for slot in range(count):
+                if self.acquire_lease(f"{name}:{slot}", owner, ttl):
+                    lease = f"{name}:{slot}"
+                    break
+            else:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError(f"等待 {name} 時已取消")
+                time.sleep(self.poll_interval)
+        try:
+            with keep_alive(lambda: self.acquire_lease(lease, owner, ttl), ttl / 3):
+                yield
+        finally:
+            self.release_lease(lease, owner)
+
+    def stats(self):
+        return {'backend': type(self).__name__}
+
+
+def _record_matches(record, expected):
+    return record is not None and all(record.get(name) in values for name, values in (expected or {}).items())
+
+
+@contextmanager
+def keep_alive(renew, interval):
+    """在後台線程中按間隔調用 renew（續約），退出時停止"""
+    stop = Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                renew()
+            except Exception as e:
+                logger.warning(f"續約失敗: {str(e)}")
+
+    thread = Thread(target=run, name='lease-keeper', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+class MemoryBackend(StateBackend):
+    """進程內後端，只適用於單個進程；進度通道直接使用 ProgressChannel"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._work = Condition(self._lock)
+        self._records = {}
+        self._channels = {}
+        self._pending = {}
+        self._claims = {}
+        self._leases = {}
+        self._sequence = itertools.count()
+
+    def save_record(self, kind, record_id, record):
+        with self._lock:
+            self._records.setdefault(kind, {})[record_id] = record
+
+    def load_record(self, kind, record_id):
+        with self._lock:
+            return self._records.get(kind, {}).get(record_id)
+
+    def list_records(self, kind):
+        with self._lock:
+            return list(self._records.get(kind, {}).values())
+
+    def update_record(self, kind, record_id, changes, expected=None):
+        with self._lock:
+            records = self._records.get(kind, {})
+            record = records.get(record_id)
+            if not _record_matches(record, expected):
+                return False
+            records[record_id] = dict(record, **changes)
+            return True
+
+    def delete_record(self, kind, record_id):
+        with self._lock:
+            self._records.get(kind, {}).pop(record_id, None)
+
+    def channel(self, name):
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None:
+                channel = self._channels[name] = ProgressChannel()
+            return channel
+
+    def publish(self, channel, state, terminal=False):
+        self.channel(channel).publish(state, terminal)
+
+    def read_channel(self, channel):
+        channel = self.channel(channel)
+        return channel.version, channel.state, channel.closed
+
+    def delete_channel(self, channel):
+        with self._lock:
+            self._channels.pop(channel, None)
+
+    def enqueue(self, queue, item_id, priority=0):
+        with self._lock:
+            heapq.heappush(self._pending.setdefault(queue, []), (priority, next(self._sequence), item_id))
+            self._work.notify_all()
+
+    def claim(self, queue, owner, lease):
+        with self._lock:
+            pending = self._pending.get(queue)
+            if not pending:
+                return None
+            entry = heapq.heappop(pending)
+            self._claims.setdefault(queue, {})[entry[2]] = (owner, time.time() + lease, entry)
+            return entry[2]
+
+    def renew_claim(self, queue, item_id, owner, lease):
+        with self._lock:
+            claims = self._claims.get(queue, {})
+            claim = claims.get(item_id)
+            if claim is None or claim[0] != owner:
+                return False
+            claims[item_id] = (owner, time.time() + lease, claim[2])
+            return True
+
+    def complete(self, queue, item_id):
+        with self._lock:
+            self._claims.get(queue, {}).pop(item_id, None)
+
+    def remove(self, queue, item_id):
+        with self._lock:
+            pending = self._pending.get(queue, [])
+            for index, entry in enumerate(pending):
+                if entry[2] == item_id:
+                    pending.pop(index)
+                    heapq.heapify(pending)
+                    return True
+            return False
+
+    def recover(self, queue):
+        now = time.time()
+        with self._lock:
+            claims = self._claims.get(queue, {})
+            expired = [item_id for item_id, (_, expires_at, _) in claims.items() if expires_at <= now]
+            for item_id in expired:
+                heapq.heappush(self._pending.setdefault(queue, []), claims.pop(item_id)[2])
+            if expired:
+                self._work.notify_all()
+            return expired
+
+    def queue_length(self, queue):
+        with self._lock:
+            return len(self._pending.get(queue, []))
+
+    def wait_for_work(self, queue, timeout):
+        with self._lock:
+            self._work.wait_for(lambda: self._pending.get(queue), timeout=timeout)
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] != owner and current[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] == owner:
+                del self._leases[name]
+
+    def lease_owner(self, name):
+        with self._lock:
+            current = self._leases.get(name)
+            if current is None or current[1] <= time.time():
+                return None
+            return current[0]
+
+
+class SQLiteBackend(StateBackend):
+    """單機多進程後端
+
+    所有狀態保存在同一個 SQLite 文件中（WAL 模式），寫操作在 BEGIN IMMEDIATE
+    事務中執行，由 SQLite 的文件鎖保證多個進程之間的原子性。
+
+    其他進程的發布由每個進程一個的監視線程發現：它在專用連接上輪詢 PRAGMA data_version，
+    數據庫有變化時才重讀被訂閱通道的版本號並喚醒本進程的等待者，訂閱者本身不輪詢。
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS records ('
+        'kind TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL, '
+        'PRIMARY KEY (kind, id))',
+        'CREATE TABLE IF NOT EXISTS channels ('
+        'name TEXT PRIMARY KEY, version INTEGER NOT NULL, state TEXT, closed INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS queue ('
+        'seq INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, item_id TEXT NOT NULL, '
+        'priority INTEGER NOT NULL, owner TEXT, lease_expires REAL, UNIQUE (queue, item_id))',
+        'CREATE INDEX IF NOT EXISTS queue_pending ON queue (queue, owner, priority, seq)',
+        'CREATE TABLE IF NOT EXISTS leases ('
+        'name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._conn = None
+        # 已知的通道版本號，本進程發布或監視線程發現變化時喚醒本進程內的訂閱者
+        self._published = Condition()
+        self._versions = {}
+        # 本進程內各通道的訂閱者數，只有存在訂閱者時監視線程才檢查數據庫
+        self._watched = {}
+        self._watcher = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def save_record(self, kind, record_id, record):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO records (kind, id, data, updated_at) VALUES (?, ?, ?, ?)',
+                (kind, record_id, json.dumps(record), time.time())
+            )
+
+    def load_record(self, kind, record_id):
+        rows = self._query('SELECT data FROM records WHERE kind = ? AND id = ?', (kind, record_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def list_records(self, kind):
+        return [json.loads(data) for data, in self._query('SELECT data FROM records WHERE kind = ?', (kind,))]
+
+    def update_record(self, kind, record_id, changes, expected=None):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data FROM records WHERE kind = ? AND id = ?', (kind, record_id)).fetchone()
+            record = json.loads(row[0]) if row else None
+            if not _record_matches(record, expected):
+                return False
+            record.update(changes)
+            conn.execute('UPDATE records SET data = ?, updated_at = ? WHERE kind = ? AND id = ?',
+                         (json.dumps(record), time.time(), kind, record_id))
+            return True
+
+    def delete_record(self, kind, record_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM records WHERE kind = ? AND id = ?', (kind, record_id))
+
+    def publish(self, channel, state, terminal=False):
+        data = json.dumps(state)
+        with self._transaction() as conn:
+            row = conn.execute('SELECT version, state, closed FROM channels WHERE name = ?',
+                               (channel,)).fetchone()
+            if row is not None and (row[2] or (row[1] == data and not terminal)):
+                return
+            conn.execute(
+                'INSERT INTO channels (name, version, state, closed) VALUES (?, 1, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET version = version + 1, state = excluded.state, '
+                'closed = excluded.closed',
+                (channel, data, int(terminal))
+            )
+            version = row[0] + 1 if row is not None else 1
+        with self._published:
+            self._versions[channel] = max(version, self._versions.get(channel, 0))
+            self._published.notify_all()
+
+    @contextmanager
+    def watch_channel(self, channel):
+        """本進程的發布直接喚醒等待者，其他進程的發布由監視線程發現後喚醒"""
+        def wait(version, timeout):
+            with self._published:
+                self._published.wait_for(lambda: self._versions.get(channel, 0) > version,
+                                         timeout=min(timeout, CHANNEL_FALLBACK_INTERVAL))
+
+        with self._published:
+            self._watched[channel] = self._watched.get(channel, 0) + 1
+            if self._watcher is None:
+                self._watcher = Thread(target=self._watch_changes, name='state-watcher', daemon=True)
+                self._watcher.start()
+            self._published.notify_all()
+        try:
+            yield wait
+        finally:
+            with self._published:
+                self._watched[channel] -= 1
+                if not self._watched[channel]:
+                    del self._watched[channel]
+
+    def _watch_changes(self):
+        """監視線程：數據庫被其他連接修改後重讀被訂閱通道的版本號"""
+        conn = None
+        data_version, checked = None, set()
+        while True:
+            with self._published:
+                # 沒有訂閱者時掛起，不訪問數據庫
+                self._published.wait_for(lambda: self._watched)
+                channels = set(self._watched)
+            try:
+                if conn is None:
+                    # 確保表已創建
+                    with self._lock:
+                        self._connect()
+                    conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                # 新訂閱的通道可能錯過了上一次檢查之前的變化，需要重讀一次
+                if current != data_version or not channels <= checked:
+                    names = list(channels)
+                    rows = conn.execute(
+                        f"SELECT name, version FROM channels WHERE name IN ({', '.join('?' * len(names))})",
+                        names
+                    ).fetchall()
+                    data_version, checked = current, channels
+                    with self._published:
+                        for name, version in rows:
+                            self._versions[name] = max(version, self._versions.get(name, 0))
+                        self._published.notify_all()
+            except sqlite3.Error:
+                logger.exception("檢查狀態數據庫變化失敗，訂閱者將在兜底間隔後重讀")
+                if conn is not None:
+                    conn.close()
+                conn, data_version = None, None
+            time.sleep(CHANGE_CHECK_INTERVAL)
+
+    def read_channel(self, channel):
+        rows = self._query('SELECT version, state, closed FROM channels WHERE name = ?', (channel,))
+        if not rows:
+            return 0, None, False
+        version, state, closed = rows[0]
+        return version, json.loads(state) if state else None, bool(closed)
+
+    def delete_channel(self, channel):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM channels WHERE name = ?', (channel,))
+        with self._published:
+            self._versions.pop(channel, None)
+
+    def enqueue(self, queue, item_id, priority=0):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO queue (queue, item_id, priority) VALUES (?, ?, ?)',
+                (queue, item_id, priority)
+            )
+
+    def claim(self, queue, owner, lease):
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT seq, item_id FROM queue WHERE queue = ? AND owner IS NULL '
+                'ORDER BY priority, seq LIMIT 1', (queue,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE queue SET owner = ?, lease_expires = ? WHERE seq = ?',
+                         (owner, time.time() + lease, row[0]))
+            return row[1]
+
+    def renew_claim(self, queue, item_id, owner, lease):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE queue SET lease_expires = ? WHERE queue = ? AND item_id = ? AND owner = ?',
+                (time.time() + lease, queue, item_id, owner)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, queue, item_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM queue WHERE queue = ? AND item_id = ? AND owner IS NOT NULL',
+                         (queue, item_id))
+
+    def remove(self, queue, item_id):
+        with self._transaction() as conn:
+            cursor = conn.execute('DELETE FROM queue WHERE queue = ? AND item_id = ? AND owner IS NULL',
+                                  (queue, item_id))
+            return cursor.rowcount > 0
+
+    def recover(self, queue):
+        with self._transaction() as conn:
+            expired = [item_id for item_id, in conn.execute(
+                'SELECT item_id FROM queue WHERE queue = ? AND owner IS NOT NULL AND lease_expires <= ?',
+                (queue, time.time())
+            )]
+            conn.executemany('UPDATE queue SET owner = NULL, lease_expires = NULL WHERE queue = ? AND item_id = ?',
+                             [(queue, item_id) for item_id in expired])
+            return expired
+
+    def queue_length(self, queue):
+        return self._query('SELECT COUNT(*) FROM queue WHERE queue = ? AND owner IS NULL', (queue,))[0][0]
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT owner, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute('INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                         (name, owner, now + ttl))
+            return True
+
+    def release_lease(self, name, owner):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+    def lease_owner(self, name):
+        rows = self._query('SELECT owner FROM leases WHERE name = ? AND expires_at > ?', (name, time.time()))
+        return rows[0][0] if rows else None
+
+    def stats(self):
+        stats = super().stats()
+        stats['path'] = self.path
+        return stats
+
+
+class RedisBackend(StateBackend):
+    """多節點後端，使用 Redis 或兼容 Redis 協議的服務（需要安裝 redis 包）
+
+    需要原子性的操作以 Lua 腳本執行；租約和認領的過期時間使用各節點的本地時鐘，
+    租約時長應遠大於節點間的時鐘偏差。
+    """
+
+    # KEYS: 通道、變化通知頻道
+    PUBLISH = """
+    local current = redis.call('HMGET', KEYS[1], 'state', 'closed')
+    if current[2] == '1' then return 0 end
+    if current[1] == ARGV[1] and ARGV[2] == '0' then return 0 end
+    redis.call('HSET', KEYS[1], 'state', ARGV[1], 'closed', ARGV[2])
+    local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+    redis.call('PUBLISH', KEYS[2], version)
+    return version
+    """
+
+    # KEYS: 待認領、已認領（按過期時間排序）、持有者、原始分數
+    CLAIM = """
+    local entry = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    if #entry == 0 then return false end
+    redis.call('ZREM', KEYS[1], entry[1])
+    redis.call('ZADD', KEYS[2], ARGV[2], entry[1])
+    redis.call('HSET', KEYS[3], entry[1], ARGV[1])
+    redis.call('HSET', KEYS[4], entry[1], entry[2])
+    return entry[1]
+    """
+
+    RENEW_CLAIM = """
+    if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then return 0 end
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+    return 1
+    """
+
+    RECOVER = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, item in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], item)
+        redis.call('HDEL', KEYS[3], item)
+        redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[4], item), item)
+    end
+    return expired
+    """
+
+    ACQUIRE = """
+    local owner = redis.call('GET', KEYS[1])
+    if owner and owner ~= ARGV[1] then return 0 end
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+    """
+
+    RELEASE = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+    return 0
+    """
+
+    def __init__(self, url, prefix='videodownload:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用 Redis 狀態後端需要安裝 redis 包")
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._scripts = {
+            name: self._redis.register_script(getattr(self, name))
+            for name in ('PUBLISH', 'CLAIM', 'RENEW_CLAIM', 'RECOVER', 'ACQUIRE', 'RELEASE')
+        }
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    def _queue_keys(self, queue):
+        return [self._key('queue', queue, name) for name in ('pending', 'claimed', 'owners', 'scores')]
+
+    def save_record(self, kind, record_id, record):
+        self._redis.hset(self._key('records', kind), record_id, json.dumps(record))
+
+    def load_record(self, kind, record_id):
+        data = self._redis.hget(self._key('records', kind), record_id)
+        return json.loads(data) if data else None
+
+    def list_records(self, kind):
+        return [json.loads(data) for data in self._redis.hvals(self._key('records', kind))]
+
+    def update_record(self, kind, record_id, changes, expected=None):
+        key = self._key('records', kind)
+
+        def update(pipe):
+            # WATCH 期間記錄被其他客戶端修改時事務失敗，redis-py 自動重試
+            data = pipe.hget(key, record_id)
+            record = json.loads(data) if data else None
+            if not _record_matches(record, expected):
+                return False
+            record.update(changes)
+            pipe.multi()
+            pipe.hset(key, record_id, json.dumps(record))
+            return True
+
+        return self._redis.transaction(update, key, value_from_callable=True)
+
+    def delete_record(self, kind, record_id):
+        self._redis.hdel(self._key('records', kind), record_id)
+
+    def publish(self, channel, state, terminal=False):
+        self._scripts['PUBLISH'](keys=[self._key('channel', channel), self._key('notify', channel)],
+                                 args=[json.dumps(state), '1' if terminal else '0'])
+
+    @contextmanager
+    def watch_channel(self, channel):
+        """通過 Redis 發布/訂閱接收版本號通知，每個訂閱者佔用一個連接"""
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._key('notify', channel))
+
+        def wait(version, timeout):
+            deadline = time.monotonic() + min(timeout, CHANNEL_FALLBACK_INTERVAL)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                message = pubsub.get_message(timeout=remaining)
+                if message is not None and int(message['data']) > version:
+                    return
+
+        try:
+            yield wait
+        finally:
+            pubsub.close()
+
+    def read_channel(self, channel):
+        version, state, closed = self._redis.hmget(self._key('channel', channel), 'version', 'state', 'closed')
+        return int(version or 0), json.loads(state) if state else None, closed == '1'
+
+    def delete_channel(self, channel):
+        self._redis.delete(self._key('channel', channel))
+
+    def enqueue(self, queue, item_id, priority=0):
+        # 分數 = 優先級 * 1e13 + 入隊序號，同優先級按入隊順序
+        sequence = self._redis.incr(self._key('queue', queue, 'sequence'))
+        self._redis.zadd(self._queue_keys(queue)[0], {item_id: priority * 1e13 + sequence})
+
+    def claim(self, queue, owner, lease):
+        return self._scripts['CLAIM'](keys=self._queue_keys(queue), args=[owner, time.time() + lease]) or None
+
+    def renew_claim(self, queue, item_id, owner, lease):
+        _, claimed, owners, _ = self._queue_keys(queue)
+        return bool(self._scripts['RENEW_CLAIM'](keys=[claimed, owners], args=[item_id, owner, time.time() + lease]))
+
+    def complete(self, queue, item_id):
+        _, claimed, owners, scores = self._queue_keys(queue)
+        pipe = self._redis.pipeline()
+        pipe.zrem(claimed, item_id)
+        pipe.hdel(owners, item_id)
+        pipe.hdel(scores, item_id)
+        pipe.execute()
+
+    def remove(self, queue, item_id):
+        return bool(self._redis.zrem(self._queue_keys(queue)[0], item_id))
+
+    def recover(self, queue):
+        return list(self._scripts['RECOVER'](keys=self._queue_keys(queue), args=[time.time()]))
+
+    def queue_length(self, queue):
+        return self._redis.zcard(self._queue_keys(queue)[0])
+
+    def acquire_lease(self, name, owner, ttl):
+        return bool(self._scripts['ACQUIRE'](keys=[self._key('lease', name)], args=[owner, int(ttl * 1000)]))
+
+    def release_lease(self, name, owner):
+        self._scripts['RELEASE'](keys=[self._key('lease', name)], args=[owner])
+
+    def lease_owner(self, name):
+        return self._redis.get(self._key('lease', name))
+
+    def stats(self):
+        stats = super().stats()
+        stats['url'] = self.url
+        return stats
+
+
+def create_state_backend(name=None):
+    """按 STATE_BACKEND 配置創建後端：memory（默認）、sqlite 或 redis"""
+    name = (name or Config.STATE_BACKEND).lower()
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(Config.STATE_DB_PATH)
+    if name == 'redis':
+        return RedisBackend(Config.STATE_REDIS_URL)
+    raise ValueError(f"未知的狀態後端: {name}")
+
+
+state_backend = create_state_backend()
@@ -0,0 +1,121 @@
+import logging
+import os
+import uuid
+
+from .extraction_service import get_extraction
+from .media_store import make_media_key, media_store
+from .youtube_service import resolve_video_target, sanitize_filename
+from .ydl_pool import ydl_pool
+
+logger = logging.getLogger(__name__)
+
+# 直通模式只選擇無需合併、可直接 HTTP 讀取的單文件格式
+STREAM_FORMAT = (
+    'best[ext=mp4][vcodec!=none][acodec!=none][protocol^=http]'
+    '/best[vcodec!=none][acodec!=none][protocol^=http]'
+)
+STREAM_PROFILE = 'passthrough'
+CHUNK_SIZE = 256 * 1024
+
+ydl_pool.register('stream', {
+    'format': STREAM_FORMAT,
+    'quiet': True,
+    'no_warnings': True,
+    'socket_timeout': 30,
+})
+
+
+def stream_media_key(url):
+    """直通下載在媒體存儲中的 key，不需要訪問上游"""
+    platform, video_id, _ = resolve_video_target(url)
+    return make_media_key(f"{platform}:{video_id}", STREAM_FORMAT, STREAM_PROFILE)
+
+
+class PassthroughStream:
+    """邊從上游讀取邊轉發給客戶端的媒體流，可選同時寫入媒體存儲"""
+
+    def __init__(self, url, tee=True):
+        from yt_dlp.networking import Request
+
+        self.media_key = stream_media_key(url)
+        context = get_extraction(resolve_video_target(url))
+
+        # 傳輸期間一直佔用池中的實例，結束時歸還
+        self._pooled = ydl_pool.acquire('stream')
+        self._ydl = self._pooled.ydl
+        try:
+            selected = self._ydl.process_ie_result(context.fresh_info(), download=False)
+            if not selected.get('url') or selected.get('requested_formats'):
+                raise Exception("沒有可直接傳輸的單文件格式")
+
+            self.filename = f"{sanitize_filename(context.info.get('title') or context.video_id)}.{selected.get('ext', 'mp4')}"
+            self._response = self._ydl.urlopen(
+                Request(selected['url'], headers=selected.get('http_headers') or {})
+            )
+        except Exception:
+            ydl_pool.release(self._pooled)
+            raise
+
+        length = self._response.get_header('Content-Length')
+        self.content_length = int(length) if length and length.isdigit() else None
+        self.content_type = self._response.get_header('Content-Type') or 'video/mp4'
+        # 判斷傳輸是否完整：優先用響應頭的長度，其次用格式信息中的文件大小
+        self.expected_size = self.content_length or selected.get('filesize')
+        self._chunked = 'chunked' in (self._response.get_header('Transfer-Encoding') or '').lower()
+
+        self._finished = False
+        self._tee_path = None
+        self._tee_file = None
+        if tee:
+            os.makedirs(media_store.tmp_dir, exist_ok=True)
+            self._tee_path = os.path.join(media_store.tmp_dir, f'{self.media_key}.{uuid.uuid4().hex}.part')
+            self._tee_file = open(self._tee_path, 'wb')
+
+    def __iter__(self):
+        received = 0
+        completed = False
+        try:
+            while True:
+                chunk = self._response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if self._tee_file:
+                    self._tee_file.write(chunk)
+                yield chunk
+            completed = self._is_complete(received)
+        finally:
+            self._finish(completed)
+
+    def _is_complete(self, received):
+        """上游讀到結尾後判斷文件是否完整
+
+        已知大小時按字節數核對；未知大小時只有以結束塊收尾的分塊傳輸可以確認完整，
+        靠關閉連接結束的響應無法區分正常結束和上游中斷，不存入媒體存儲。
+        """
+        if self.expected_size:
+            return received == self.expected_size
+        return self._chunked and received > 0
+
+    def close(self):
+        """WSGI 服務器在連接結束時調用，客戶端提前斷開時也能釋放上游連接"""
+        self._finish(False)
+
+    def _finish(self, completed):
+        """結束傳輸；完整收到的文件存入媒體存儲，否則丟棄臨時文件"""
+        if self._finished:
+            return
+        self._finished = True
+        self._response.close()
+        ydl_pool.release(self._pooled)
+        if not self._tee_file:
+            return
+        self._tee_file.close()
+        if completed:
+            media_store.commit(self.media_key, self._tee_path, self.filename)
+        else:
+            logger.info("直通傳輸未完成或無法確認完整，丟棄臨時文件")
+            try:
+                os.remove(self._tee_path)
+            except OSError:
+                pass
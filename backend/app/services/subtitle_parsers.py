@@ -0,0 +1,204 @@
+import codecs
+import io
+import json
+import re
+import xml.etree.ElementTree as ElementTree
+
+# 各解析器統一產出 (開始毫秒, 持續毫秒, 文本) 元組，文本已合併空白。
+# 輸入可以是 bytes / str，也可以是帶 read() 的響應對象；傳入響應時邊讀邊解析，
+# 解析過程佔用的內存只與讀取塊大小和單個事件大小有關，與字幕總長度無關。
+
+READ_SIZE = 64 * 1024
+
+VTT_TIMING = re.compile(
+    r'^(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})\s+-->\s+(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})'
+)
+VTT_TAG = re.compile(r'<[^>]*>')
+WHITESPACE = ' \t\r\n'
+
+
+def _text(raw):
+    return ' '.join(raw.split())
+
+
+def _as_stream(data):
+    """把 bytes / str 包裝為可按塊讀取的二進制流"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    return data
+
+
+class _ChunkReader:
+    """按塊讀取並增量解碼 UTF-8，已消費的部分及時丟棄"""
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.stream.read(self.read_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk or b'', final=self.eof)
+        self.pos = 0
+
+    def lines(self):
+        """逐行產出文本，兼容 \\n 和 \\r\\n 換行"""
+        while True:
+            index = self.buf.find('\n', self.pos)
+            if index >= 0:
+                line = self.buf[self.pos:index]
+                self.pos = index + 1
+                yield line.rstrip('\r')
+            elif self.eof:
+                if self.pos < len(self.buf):
+                    line = self.buf[self.pos:]
+                    self.pos = len(self.buf)
+                    yield line.rstrip('\r')
+                return
+            else:
+                self.fill()
+
+    def skip(self, chars):
+        while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+            self.pos += 1
+
+
+def parse_json3(data):
+    """流式解析 YouTube json3 字幕：events[].segs[].utf8
+
+    定位到 events 數組後逐個解碼事件對象，不構造完整的 JSON 樹。
+    """
+    reader = _ChunkReader(_as_stream(data))
+    decoder = json.JSONDecoder()
+
+    # 定位 "events": [
+    while True:
+        index = reader.buf.find('"events"', reader.pos)
+        if index >= 0:
+            bracket = reader.buf.find('[', index)
+            if bracket >= 0:
+                reader.pos = bracket + 1
+                break
+        if reader.eof:
+            return
+        # 保留末尾幾個字符，避免 key 被塊邊界截斷
+        reader.pos = max(reader.pos, len(reader.buf) - 16)
+        reader.fill()
+
+    while True:
+        reader.skip(WHITESPACE + ',')
+        if reader.pos >= len(reader.buf):
+            if reader.eof:
+                return
+            reader.fill()
+            continue
+        if reader.buf[reader.pos] == ']':
+            return
+        try:
+            event, end = decoder.raw_decode(reader.buf, reader.pos)
+        except json.JSONDecodeError:
+            # 事件跨越塊邊界，讀入更多數據後重試
+            if reader.eof:
+                raise
+            reader.fill()
+            continue
+        reader.pos = end
+
+        segs = event.get('segs')
+        if not segs:
+            continue
+        # 自動字幕的逐詞片段自帶前導空格，直接拼接
+        text = _text(''.join(seg.get('utf8', '') for seg in segs))
+        if text:
+            yield event.get('tStartMs', 0), event.get('dDurationMs', 0), text
+
+
+def parse_srv3(data):
+    """流式解析 YouTube srv3 (timedtext format 3) 字幕：<p t="ms" d="ms"><s>詞</s></p>"""
+    # 記錄當前打開的元素，處理完的段落從父元素中移除，避免整棵樹留在內存中
+    parents = []
+    for event, element in ElementTree.iterparse(_as_stream(data), events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag != 'p':
+            continue
+        text = _text(''.join(element.itertext()))
+        if text:
+            yield int(element.get('t', 0)), int(element.get('d', 0)), text
+        if parents:
+            parents[-1].remove(element)
+
+
+def _vtt_ms(hours, minutes, seconds, millis):
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def parse_vtt(data):
+    """逐行解析 WebVTT 字幕
+
+    YouTube 自動字幕的 VTT 以滾動方式顯示，每個 cue 會重複上一個 cue 的行，
+    這裡只輸出未出現過的新行。
+    """
+    reader = _ChunkReader(_as_stream(data))
+
+    last_line = None
+    start = end = None
+    lines = []
+
+    def flush():
+        nonlocal last_line
+        new_lines = []
+        for line in lines:
+            text = _text(VTT_TAG.sub('', line))
+            if text and text != last_line:
+                new_lines.append(text)
+                last_line = text
+        if new_lines:
+            return start, end - start, ' '.join(new_lines)
+        return None
+
+    for raw in reader.lines():
+        line = raw.strip()
+        match = VTT_TIMING.match(line)
+        if match:
+            if start is not None:
+                segment = flush()
+                if segment:
+                    yield segment
+            groups = match.groups()
+            start = _vtt_ms(*groups[:4])
+            end = _vtt_ms(*groups[4:])
+            lines = []
+        elif not raw:
+            # 只有完全空的行才結束 cue，YouTube 自動字幕首個 cue 以單個空格行佔位
+            if start is not None:
+                segment = flush()
+                if segment:
+                    yield segment
+            start = None
+            lines = []
+        elif start is not None:
+            lines.append(line)
+
+    if start is not None:
+        segment = flush()
+        if segment:
+            yield segment
+
+
+PARSERS = {
+    'json3': parse_json3,
+    'srv3': parse_srv3,
+    'vtt': parse_vtt,
+}
+
+# 格式優先級：數值越小越優先
+FORMAT_RANK = {ext: rank for rank, ext in enumerate(PARSERS)}
@@ -0,0 +1,319 @@
+import json
+import logging
+import re
+import struct
+import sys
+from array import array
+
+from config import Config
+from .llm_client import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 帶時間戳的字幕行，例如 [05:30] 或 [1:05:30]
+TIMESTAMP_LINE = re.compile(r'^\[(?:(\d+):)?(\d+):(\d{2})\]\s*(.*)$')
+
+HTML_TAG = re.compile(r'<[^>]+>')
+# 括號內的音效提示詞，例如 [音樂]、(Applause)、[Music]；其他括號內容屬於正文，保留
+NOISE_CUES = (
+    r'music|background music|applause|laughter|laughing|laughs|cheering|cheers|silence|'
+    r'inaudible|noise|foreign|音樂|音乐|背景音樂|背景音乐|掌聲|掌声|鼓掌|笑聲|笑声|笑|歡呼|欢呼|'
+    r'音楽|拍手|笑い'
+)
+BRACKETED_NOISE = re.compile(
+    rf'[\[(（【]\s*(?:{NOISE_CUES})\s*[\])）】]|♪[^♪]*♪|[♪♫]+',
+    re.IGNORECASE
+)
+# 中日文字符（韓文用空格分詞，不包括在內）
+CJK_CHAR = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]')
+# 判定與上一段重疊的最小長度：分詞文字按詞，中日文按字符
+MIN_WORD_OVERLAP = 2
+MIN_CJK_OVERLAP = 4
+# 只含語氣詞的片段
+FILLER_ONLY = re.compile(
+    r'^(?:(?:um+|uh+|hmm+|ah+|oh+|er+|嗯+|呃+|啊+|哦+|喔+|欸+|那個|就是)[\s,，.。!！?？…]*)+$',
+    re.IGNORECASE
+)
+
+
+def format_timestamp(seconds):
+    """秒數格式化為 MM:SS，超過一小時為 HH:MM:SS"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class CompactTranscript:
+    """緊湊存儲的字幕
+
+    開始時間和持續時間（毫秒）保存在兩個平行整數數組中，全部文本以 UTF-8
+    拼接為一個緩衝區，另用偏移數組定位每段文本，避免每段一個字典和時間字符串。
+    序列化為列式二進制格式，從緩存讀出時只解析頭部，各列在首次訪問時才解碼。
+    """
+
+    MAGIC = b'CTR1'
+    # 魔數、元信息長度、段數、文本字節數
+    HEADER = struct.Struct('<4sIII')
+
+    def __init__(self, starts=None, durations=None, text=b'', offsets=None, language=None, source=None):
+        self._starts = starts if starts is not None else array('q')
+        self._durations = durations if durations is not None else array('q')
+        self._text = bytearray(text)
+        self._offsets = offsets if offsets is not None else array('q', [0])
+        self._count = len(self._starts)
+        self._blob = None
+        self.language = language
+        self.source = source
+
+    @classmethod
+    def from_segments(cls, segments, language=None, source=None):
+        """由 (開始毫秒, 持續毫秒, 文本) 序列構建，序列可以是逐段產出的生成器"""
+        transcript = cls(language=language, source=source)
+        for start_ms, duration_ms, text in segments:
+            transcript.append(start_ms, duration_ms, text)
+        return transcript
+
+    def to_bytes(self):
+        """序列化為列式格式：頭部、元信息、starts、durations、offsets、文本（整數均為小端 int64）"""
+        meta = json.dumps({'language': self.language, 'source': self.source}).encode('utf-8')
+        columns = []
+        for column in (self.starts, self.durations, self.offsets):
+            if sys.byteorder == 'big':
+                column = array('q', column)
+                column.byteswap()
+            columns.append(column.tobytes())
+        header = self.HEADER.pack(self.MAGIC, len(meta), len(self), len(self.text))
+        return b''.join([header, meta] + columns + [bytes(self.text)])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """從 to_bytes 的結果恢復，只解析頭部和元信息"""
+        magic, meta_size, count, _ = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("無效的字幕緩存數據")
+        offset = cls.HEADER.size
+        meta = json.loads(bytes(data[offset:offset + meta_size]))
+        transcript = cls(language=meta.get('language'), source=meta.get('source'))
+        transcript._count = count
+        transcript._blob = (memoryview(data), offset + meta_size)
+        return transcript
+
+    def _load(self):
+        """首次訪問時從序列化數據中解碼各列"""
+        blob = self._blob
+        if blob is None:
+            return
+        data, offset = blob
+        count = self._count
+        columns = []
+        for size in (count, count, count + 1):
+            column = array('q')
+            column.frombytes(data[offset:offset + size * 8])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            offset += size * 8
+        self._starts, self._durations, self._offsets = columns
+        # 文本不複製，直接引用序列化數據中的切片
+        self._text = data[offset:]
+        self._blob = None
+
+    @property
+    def starts(self):
+        self._load()
+        return self._starts
+
+    @property
+    def durations(self):
+        self._load()
+        return self._durations
+
+    @property
+    def offsets(self):
+        self._load()
+        return self._offsets
+
+    @property
+    def text(self):
+        self._load()
+        return self._text
+
+    def append(self, start_ms, duration_ms, text):
+        self._load()
+        if not isinstance(self._text, bytearray):
+            self._text = bytearray(self._text)
+        self._starts.append(int(start_ms))
+        self._durations.append(int(duration_ms))
+        self._text += text.encode('utf-8')
+        self._offsets.append(len(self._text))
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def text_at(self, index):
+        offsets = self.offsets
+        return str(self.text[offsets[index]:offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        """逐段產出 (開始毫秒, 持續毫秒, 文本)"""
+        starts, durations = self.starts, self.durations
+        for index in range(len(self)):
+            yield starts[index], durations[index], self.text_at(index)
+
+    def to_segments(self):
+        """轉為接口使用的 [{'time': 時間戳, 'text': 文本}]"""
+        return [{'time': format_timestamp(start / 1000), 'text': text} for start, _, text in self]
+
+    def to_text(self):
+        """轉為每行 "[時間戳] 文本" 的字幕文本"""
+        return '\n'.join(f"[{format_timestamp(start / 1000)}] {text}" for start, _, text in self)
+
+    def to_columns(self):
+        """轉為列式 JSON：{'start_ms': [...], 'duration_ms': [...], 'text': [...]}"""
+        return {
+            'start_ms': self.starts.tolist(),
+            'duration_ms': self.durations.tolist(),
+            'text': [text for _, _, text in self],
+        }
+
+    def nbytes(self):
+        """數據佔用的字節數"""
+        return 8 * (3 * len(self) + 1) + len(self.text)
+
+
+def clean_caption_text(text):
+    """移除 HTML 標籤、括號內的音效描述和多餘空白"""
+    text = HTML_TAG.sub('', text)
+    text = BRACKETED_NOISE.sub('', text)
+    return ' '.join(text.split())
+
+
+def parse_transcript_lines(transcript):
+    """把 "[MM:SS] 文本" 格式的字幕解析為 [(秒數, 文本)]，無時間戳的行併入上一段"""
+    segments = []
+    for line in transcript.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = TIMESTAMP_LINE.match(line)
+        if match:
+            hours, minutes, seconds, text = match.groups()
+            start = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+            segments.append((start, text))
+        elif segments:
+            start, text = segments[-1]
+            segments[-1] = (start, f"{text} {line}")
+        else:
+            segments.append((0, line))
+    return segments
+
+
+def _is_cjk_run(text):
+    """不含空白且以中日文字符為主的片段，只有這類文本按字符比較重疊"""
+    if not text or any(char.isspace() for char in text):
+        return False
+    return len(CJK_CHAR.findall(text)) * 2 >= len(text)
+
+
+def _strip_overlap(previous, text):
+    """去掉與上一段結尾重疊的開頭（自動字幕滾動顯示時常見），返回剩餘部分
+
+    只有完全相同的片段整段丟棄；用空格分詞的文字至少重疊 MIN_WORD_OVERLAP 個詞，
+    中日文至少重疊 MIN_CJK_OVERLAP 個字符才視為重複，避免刪掉恰好相同的短句或單詞。
+    """
+    if not previous:
+        return text
+    if text == previous:
+        return ''
+    # 逐詞比較上一段的後綴和本段的前綴
+    prev_words = previous.split()
+    words = text.split()
+    for size in range(min(len(prev_words), len(words)), MIN_WORD_OVERLAP - 1, -1):
+        if prev_words[-size:] == words[:size]:
+            return ' '.join(words[size:])
+    # 中日文字幕沒有空格分詞，按字符比較
+    for size in range(min(len(previous), len(text)), MIN_CJK_OVERLAP - 1, -1):
+        overlap = text[:size]
+        if previous.endswith(overlap) and _is_cjk_run(overlap):
+            return text[size:].strip()
+    return text
+
+
+def clean_segments(segments):
+    """清理噪聲並去除重複或重疊的片段"""
+    cleaned = []
+    previous = ''
+    for start, text in segments:
+        text = clean_caption_text(text)
+        if not text or FILLER_ONLY.match(text):
+            continue
+        remainder = _strip_overlap(previous, text)
+        previous = text
+        if remainder:
+            cleaned.append((start, remainder))
+    return cleaned
+
+
+def merge_windows(segments, window_seconds):
+    """把相鄰片段合併為時間窗口，窗口以其第一段的開始時間為錨點"""
+    windows = []
+    for start, text in segments:
+        if windows and start - windows[-1][0] < window_seconds:
+            windows[-1][1].append(text)
+        else:
+            windows.append((start, [text]))
+    return [(start, ' '.join(texts)) for start, texts in windows]
+
+
+def _render(windows):
+    return '\n'.join(f"[{format_timestamp(start)}] {text}" for start, text in windows)
+
+
+def _shrink(windows, ratio):
+    """按比例截短每個窗口的文本，保留所有時間錨點，使內容仍覆蓋整個視頻"""
+    shrunk = []
+    for start, text in windows:
+        keep = max(1, int(len(text) * ratio))
+        if keep < len(text):
+            cut = text.rfind(' ', 0, keep + 1)
+            text = text[:cut if cut > keep // 2 else keep].rstrip() + '…'
+        shrunk.append((start, text))
+    return shrunk
+
+
+def compact_transcript(transcript, max_tokens=None, window_seconds=None):
+    """在發送給模型前壓縮字幕
+
+    依次清理噪聲、去除滾動字幕的重複內容、合併為時間窗口；仍超出 token 預算時
+    先加大窗口，再按比例截短各窗口。時間戳錨點始終保留。
+    """
+    max_tokens = max_tokens or Config.TRANSCRIPT_TOKEN_BUDGET
+    window_seconds = window_seconds or Config.TRANSCRIPT_WINDOW_SECONDS
+
+    segments = clean_segments(parse_transcript_lines(transcript))
+    if not segments:
+        return transcript
+
+    windows = merge_windows(segments, window_seconds)
+    result = _render(windows)
+    tokens = count_tokens(result)
+
+    # 時間戳本身也佔 token，窗口加大可以減少錨點數量
+    while tokens > max_tokens and window_seconds < Config.TRANSCRIPT_MAX_WINDOW_SECONDS:
+        window_seconds *= 2
+        windows = merge_windows(segments, window_seconds)
+        result = _render(windows)
+        tokens = count_tokens(result)
+
+    ratio = max_tokens / tokens if tokens else 1
+    while tokens > max_tokens and ratio > 0.01:
+        result = _render(_shrink(windows, ratio))
+        tokens = count_tokens(result)
+        ratio *= 0.9
+
+    logger.info(f"字幕壓縮完成: {len(segments)} 段 -> {len(windows)} 個窗口，約 {tokens} tokens")
+    return result
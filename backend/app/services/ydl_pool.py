@@ -0,0 +1,165 @@
+import logging
+from contextlib import contextmanager
+from threading import Lock
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 每次借出時可臨時覆蓋的選項，歸還時恢復為配置中的值
+OVERRIDABLE = ('format', 'outtmpl')
+
+
+class PooledYoutubeDL:
+    """池中的單個 yt-dlp 實例
+
+    進度和後處理鉤子在創建時固定為轉發函數，借出時再指向調用方的鉤子，
+    實例本身（連同其 HTTP 會話和 cookie）在多次借出之間保持不變。
+    """
+
+    def __init__(self, profile, options):
+        from yt_dlp import YoutubeDL
+
+        self.profile = profile
+        self.progress_hook = None
+        self.postprocessor_hook = None
+        self.ydl = YoutubeDL(dict(
+            options,
+            progress_hooks=[self._on_progress],
+            postprocessor_hooks=[self._on_postprocess],
+        ))
+        self._defaults = {key: self.ydl.params.get(key) for key in OVERRIDABLE}
+        # 格式選擇器在 YoutubeDL 初始化時按 format 選項構建，覆蓋 format 時需要一併替換
+        self._default_selector = self.ydl.format_selector
+
+    def _on_progress(self, d):
+        if self.progress_hook:
+            self.progress_hook(d)
+
+    def _on_postprocess(self, d):
+        if self.postprocessor_hook:
+            self.postprocessor_hook(d)
+
+    def prepare(self, progress_hook=None, postprocessor_hook=None, **overrides):
+        """借出前設置本次使用的鉤子和選項"""
+        self.progress_hook = progress_hook
+        self.postprocessor_hook = postprocessor_hook
+        for key, value in overrides.items():
+            if key not in OVERRIDABLE:
+                raise ValueError(f"不支持覆蓋的選項: {key}")
+            if key == 'outtmpl':
+                # yt-dlp 初始化後把輸出模板保存為按類型區分的字典
+                value = dict(self._defaults['outtmpl'], default=value)
+            elif key == 'format':
+                self.ydl.format_selector = value if callable(value) else self.ydl.build_format_selector(value)
+            self.ydl.params[key] = value
+
+    def reset(self):
+        """歸還時恢復配置中的選項並解除鉤子"""
+        self.progress_hook = None
+        self.postprocessor_hook = None
+        for key, value in self._defaults.items():
+            self.ydl.params[key] = dict(value) if isinstance(value, dict) else value
+        self.ydl.format_selector = self._default_selector
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            logger.warning(f"關閉 yt-dlp 實例失敗: {str(e)}")
+
+
+class YoutubeDLPool:
+    """按選項配置分組的 yt-dlp 實例池
+
+    創建 YoutubeDL 需要加載提取器和建立請求處理器，每次調用都新建實例會丟掉
+    已建立的 HTTP 長連接。池中的實例用完歸還，下次借出時繼續使用原有連接和
+    磁盤上的簽名緩存；同一實例同時只借給一個調用方。每種配置最多保留
+    max_idle 個空閒實例，超出的在歸還時關閉。yt-dlp 自身的錯誤（視頻不可用、
+    下載失敗、取消）不影響實例狀態，照常歸還；其他異常的實例不再放回。
+
+    登記配置不會導入 yt-dlp，模塊在首次創建實例時才加載。
+    """
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._profiles = {}
+        self._idle = {}
+        self._lock = Lock()
+        self._in_use = 0
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def register(self, profile, options):
+        """登記選項配置，實例在首次借出時才創建"""
+        with self._lock:
+            self._profiles[profile] = dict(options)
+            self._idle.setdefault(profile, [])
+
+    def acquire(self, profile, progress_hook=None, postprocessor_hook=None, **overrides):
+        """借出實例，用完必須調用 release"""
+        with self._lock:
+            options = self._profiles[profile]
+            idle = self._idle[profile]
+            pooled = idle.pop() if idle else None
+            self._stats['reused' if pooled else 'created'] += 1
+            self._in_use += 1
+        if pooled is None:
+            try:
+                pooled = PooledYoutubeDL(profile, options)
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                raise
+        pooled.prepare(progress_hook, postprocessor_hook, **overrides)
+        return pooled
+
+    def release(self, pooled, discard=False):
+        """歸還實例，discard 為 True 或空閒實例已滿時關閉"""
+        pooled.reset()
+        with self._lock:
+            self._in_use -= 1
+            idle = self._idle[pooled.profile]
+            keep = not discard and len(idle) < self.max_idle
+            if keep:
+                idle.append(pooled)
+            elif discard:
+                self._stats['discarded'] += 1
+        if not keep:
+            pooled.close()
+
+    @contextmanager
+    def checkout(self, profile, progress_hook=None, postprocessor_hook=None, **overrides):
+        """借出實例並在離開時歸還，yield YoutubeDL 對象"""
+        from yt_dlp.utils import YoutubeDLError
+
+        pooled = self.acquire(profile, progress_hook, postprocessor_hook, **overrides)
+        try:
+            yield pooled.ydl
+        except YoutubeDLError:
+            self.release(pooled)
+            raise
+        except BaseException:
+            self.release(pooled, discard=True)
+            raise
+        self.release(pooled)
+
+    def close(self):
+        """關閉所有空閒實例"""
+        with self._lock:
+            idle = [pooled for instances in self._idle.values() for pooled in instances]
+            for instances in self._idle.values():
+                instances.clear()
+        for pooled in idle:
+            pooled.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'in_use': self._in_use,
+                'idle': {profile: len(instances) for profile, instances in self._idle.items()},
+            })
+            return stats
+
+
+ydl_pool = YoutubeDLPool(max_idle=Config.YDL_POOL_SIZE)
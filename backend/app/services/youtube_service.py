@@ -1,40 +1,121 @@
-from yt_dlp import YoutubeDL
 import logging
 import time
 import re
 import os
-import requests
 import glob
-from threading import Lock, Timer
-import unicodedata
-import subprocess
 import shutil
-import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from config import Config
+from .cache_service import PersistentCache
+from .extraction_service import best_thumbnail, get_extraction
+from .ffmpeg_service import merge_streams, postprocess_profile
+from .media_store import make_media_key, media_store
+from .segmented_download import ByteProgress, fetch_segmented
+from .singleflight import inflight
+from .subtitle_parsers import FORMAT_RANK, PARSERS
+from .transcript_service import CompactTranscript, clean_caption_text
+from .ydl_pool import ydl_pool
 
 logger = logging.getLogger(__name__)
 
-# 全局變量用於追踪下載狀態
-download_lock = Lock()
-current_download = None
-merge_process = None
-current_progress = {'value': 0}
+# 下載視頻時使用的格式選擇器
+DOWNLOAD_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+# 各類操作使用的 yt-dlp 選項，實例由 ydl_pool 按配置複用；
+# 輸出路徑、格式和進度鉤子在每次借出時單獨設置
+DOWNLOAD_OPTS = {
+    'format': DOWNLOAD_FORMAT,
+    'noplaylist': True,
+    'force_overwrites': True,
+    # 出錯時拋出異常，以便在媒體地址失效時刷新後重試
+    'ignoreerrors': False,
+    'no_warnings': True,
+    'quiet': False,
+    'outtmpl': '%(title)s.%(ext)s',
+    'concurrent_fragment_downloads': Config.DOWNLOAD_CONNECTIONS_PER_STREAM,
+}
+if Config.DOWNLOAD_CONNECTION_RATE_LIMIT:
+    DOWNLOAD_OPTS['ratelimit'] = Config.DOWNLOAD_CONNECTION_RATE_LIMIT
+
+AUDIO_OPTS = {
+    'format': 'bestaudio/best',
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'wav',
+    }],
+    'outtmpl': 'temp_audio/%(id)s.%(ext)s',
+    'quiet': False,
+    'no_warnings': False,
+    'extract_flat': False,
+    'no_playlist': True,
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    },
+    'socket_timeout': 30,
+    'retries': 10,
+}
+
+# 字幕文件只通過實例的 HTTP 會話下載，同一實例的連續請求複用長連接
+SUBTITLE_OPTS = {
+    'quiet': True,
+    'no_warnings': True
+}
+
+ydl_pool.register('download', DOWNLOAD_OPTS)
+ydl_pool.register('audio', AUDIO_OPTS)
+ydl_pool.register('subtitles', SUBTITLE_OPTS)
+
+# 字幕語言偏好，越靠前越優先
+SUBTITLE_LANGUAGES = ['zh-TW', 'zh-Hant', 'zh-HK', 'zh', 'zh-Hans', 'zh-CN', 'en']
+
+# 視頻沒有可用字幕時返回的提示文本，與獲取失敗時的提示區分
+NO_TRANSCRIPT = "無字幕內容"
+
+# 視頻信息緩存，以平台和規範化視頻ID為 key
+metadata_cache = PersistentCache(
+    'video_info',
+    os.path.join(Config.CACHE_DIR, 'metadata.sqlite3'),
+    memory_entries=Config.METADATA_CACHE_MEMORY_ENTRIES,
+    disk_entries=Config.METADATA_CACHE_DISK_ENTRIES,
+)
+
+# 字幕緩存：每個 (視頻, 語言, 來源) 保存一份列式二進制數據；
+# transcript_tracks 記錄每個視頻選中的字幕軌，命中時無需再訪問平台
+transcript_cache = PersistentCache(
+    'transcripts',
+    os.path.join(Config.CACHE_DIR, 'transcripts.sqlite3'),
+    memory_entries=Config.TRANSCRIPT_CACHE_MEMORY_ENTRIES,
+    disk_entries=Config.TRANSCRIPT_CACHE_DISK_ENTRIES,
+    default_ttl=Config.TRANSCRIPT_CACHE_TTL,
+    dumps=lambda transcript: transcript.to_bytes(),
+    loads=CompactTranscript.from_bytes
+)
+transcript_tracks = PersistentCache(
+    'transcript_tracks',
+    os.path.join(Config.CACHE_DIR, 'transcripts.sqlite3'),
+    memory_entries=Config.TRANSCRIPT_CACHE_MEMORY_ENTRIES,
+    disk_entries=Config.TRANSCRIPT_CACHE_DISK_ENTRIES,
+    default_ttl=Config.TRANSCRIPT_CACHE_TTL
+)
 
 def init_downloads_directory(output_path='downloads'):
-    """初始化下載目錄，清理所有歷史文件"""
+    """初始化下載目錄，只清理過期的任務臨時目錄，不影響媒體存儲和進行中的下載"""
     try:
         base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         full_output_path = os.path.abspath(os.path.join(base_path, output_path))
-        
-        # 如果目錄存在，刪除它及其所有內容
-        if os.path.exists(full_output_path):
-            shutil.rmtree(full_output_path)
-            logger.info(f"已清理下載目錄: {full_output_path}")
-        
-        # 創建新的空目錄
-        os.makedirs(full_output_path)
-        logger.info(f"已創建新的下載目錄: {full_output_path}")
+        os.makedirs(full_output_path, exist_ok=True)
+
+        jobs_path = os.path.join(full_output_path, 'jobs')
+        if os.path.isdir(jobs_path):
+            cutoff = time.time() - Config.DOWNLOAD_JOB_RETENTION
+            for name in os.listdir(jobs_path):
+                path = os.path.join(jobs_path, name)
+                if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    logger.info(f"已清理過期的任務目錄: {path}")
     except Exception as e:
-        logger.error(f"清理下載目錄時出錯: {str(e)}")
+        logger.error(f"初始化下載目錄時出錯: {str(e)}")
 
 def detect_platform(url):
     """檢測URL所屬平台"""
@@ -81,50 +162,30 @@ def extract_audio(url, output_path='temp_audio'):
     if not video_id:
         raise Exception("無法從URL中提取視頻ID")
     
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'wav',
-        }],
-        'outtmpl': f'{output_path}/%(id)s.%(ext)s',
-        'quiet': False,
-        'no_warnings': False,
-        'extract_flat': False,
-        'no_playlist': True,
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-        },
-        'socket_timeout': 30,
-        'retries': 10,
-    }
-    
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.cache.remove()  # 清除緩存
-            info = ydl.extract_info(url, download=False)
-            
-            # 選擇最佳音頻格式
-            formats = info['formats']
-            audio_formats = [f for f in formats if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
-            
-            if not audio_formats:
-                raise Exception("無法找到合適的音頻格式")
-            
-            # 按比特率排序
-            best_audio = max(audio_formats, key=lambda x: x.get('abr', 0))
-            
-            # 設置具體的格式
-            ydl_opts['format'] = best_audio['format_id']
-            
-            with YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            
-            audio_path = f"{output_path}/{video_id}.wav"
-            if os.path.exists(audio_path):
-                return audio_path
-            raise Exception("音頻文件未生成")
-            
+        context = get_extraction(resolve_video_target(url))
+
+        # 選擇最佳音頻格式
+        formats = context.info.get('formats') or []
+        audio_formats = [f for f in formats if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
+
+        if not audio_formats:
+            raise Exception("無法找到合適的音頻格式")
+
+        # 按比特率排序
+        best_audio = max(audio_formats, key=lambda x: x.get('abr') or 0)
+
+        # 設置具體的格式，直接用已提取的 info 下載，不再重新解析頁面
+        with ydl_pool.checkout(
+            'audio', format=best_audio['format_id'], outtmpl=f'{output_path}/%(id)s.%(ext)s'
+        ) as ydl:
+            ydl.process_ie_result(context.fresh_info(), download=True)
+
+        audio_path = f"{output_path}/{video_id}.wav"
+        if os.path.exists(audio_path):
+            return audio_path
+        raise Exception("音頻文件未生成")
+
     except Exception as e:
         logger.error(f"音頻提取失敗: {str(e)}")
         raise Exception(f"音頻提取失敗: {str(e)}")
@@ -140,25 +201,6 @@ def clean_temp_files(directory='downloads'):
             except Exception as e:
                 logger.error(f"刪除臨時文件失敗: {str(e)}")
 
-def get_merge_progress(stderr):
-    """從 FFmpeg 輸出解析合併進度"""
-    try:
-        line = stderr.readline().decode('utf-8', errors='ignore')
-        if 'frame=' in line:
-            # 從輸出中提取進度信息
-            match = re.search(r'time=(\d+):(\d+):(\d+)', line)
-            if match:
-                hours, minutes, seconds = map(int, match.groups())
-                total_seconds = hours * 3600 + minutes * 60 + seconds
-                # 假設總時長為視頻時長
-                progress = min(100, int((total_seconds / total_duration) * 100))
-                if progress % 5 == 0:  # 每5%報告一次
-                    logger.info(f"合併進度: {progress}%")
-                return progress
-    except Exception as e:
-        logger.error(f"解析合併進度失敗: {str(e)}")
-    return None
-
 def sanitize_filename(filename):
     """清理文件名，除特殊字符"""
     # 移除特殊字符和標點符號
@@ -192,117 +234,187 @@ def find_downloaded_file(directory, title):
         logger.error(f"查找文件時出錯: {str(e)}")
     return None
 
-def download_video(url, output_path='downloads'):
-    """下載視頻為 MP4 格式"""
-    global current_download, current_progress
-    current_progress['value'] = 0  # 重置進度
-    
-    if not download_lock.acquire(blocking=False):
-        logger.warning("另一個下載正在進行中")
-        return {
-            'status': 'error',
-            'message': '另一個下載正在進行中，請稍後再試'
-        }
-    
+def download_video(url, output_path='downloads', progress_callback=None, cancel_event=None):
+    """下載視頻為 MP4 格式
+
+    progress_callback(progress, stage) 接收 0-100 的總進度和當前階段，
+    cancel_event 被設置時中止下載
+    """
+    # yt-dlp 和 requests 導入較慢，首次下載時才加載
+    import requests
+    from yt_dlp.utils import DownloadCancelled, DownloadError
+
     try:
         # 清理之前的臨時文件
         clean_temp_files(output_path)
-        current_download = url
         
         base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         full_output_path = os.path.abspath(os.path.join(base_path, output_path))
         
         if not os.path.exists(full_output_path):
             os.makedirs(full_output_path)
+
+        def report(progress, stage):
+            if progress_callback:
+                progress_callback(progress, stage)
+
+        # 下載階段在總進度中佔的區間，分軌下載時剩餘部分留給合併；進度按所有流的字節數彙總
+        download = {'span': 100}
+        download['bytes'] = ByteProgress(
+            lambda fraction: report(download['span'] * fraction, 'downloading')
+        )
         
         def progress_hook(d):
-            global current_progress  # 使用模組級別的全局變量
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled('下載已取消')
             if d['status'] == 'downloading':
-                try:
-                    progress = float(d.get('_percent_str', '0%').replace('%', ''))
-                    filename = d.get('filename', '')
-                    
-                    if '.m4a' in filename:
-                        total_progress = 40 + (progress * 0.1)
-                    else:
-                        total_progress = progress * 0.4
-                    
-                    current_progress['value'] = total_progress
-                    logger.info(f"總進度: {total_progress:.1f}%")
-                except Exception as e:
-                    logger.error(f"處理進度時出錯: {str(e)}")
+                key = d.get('info_dict', {}).get('format_id') or d.get('filename')
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total:
+                    download['bytes'].set_total(key, total)
+                download['bytes'].set_downloaded(key, d.get('downloaded_bytes', 0))
             elif d['status'] == 'finished':
                 logger.info("檔案下載完成，開始處理...")
-            elif d['status'] == 'merging formats':
-                logger.info("正在處理影片文件...")
-        
-        ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'merge_output_format': 'mp4',
-            'postprocessor_args': [
-                '-c:v', 'h264',
-                '-c:a', 'aac',
-                '-movflags', '+faststart'
-            ],
-            'noplaylist': True,
-            'progress_hooks': [progress_hook],
-            'force_overwrites': True,
-            'ignoreerrors': True,
-            'no_warnings': True,
-            'quiet': False,
-            'outtmpl': '%(title)s.%(ext)s',  # 使用簡單的輸出模板
-        }
+
+        # 記錄後處理完成後文件的最終路徑
+        final_files = []
+
+        def postprocessor_hook(d):
+            if d['status'] == 'finished':
+                filepath = d.get('info_dict', {}).get('filepath')
+                if filepath:
+                    final_files.append(filepath)
         
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                # 先獲取視頻信息
-                info = ydl.extract_info(url, download=False)
-                if not isinstance(info, dict):
-                    raise Exception("無法獲取視頻信息")
-                
-                # 清理文件名
-                title = info.get('title', '')
-                if not title:
-                    raise Exception("無法獲取視頻標題")
-                
-                clean_title = sanitize_filename(title)
-                expected_filename = f"{clean_title}.mp4"
-                expected_path = os.path.join(full_output_path, expected_filename)
-                
-                # 更新下載選項
-                ydl_opts['outtmpl'] = os.path.join(full_output_path, clean_title + '.%(ext)s')
-                
-                # 使用新的選項進行下載
-                with YoutubeDL(ydl_opts) as ydl_download:
+            target = resolve_video_target(url)
+            media_key = make_media_key(
+                f"{target[0]}:{target[1]}",
+                DOWNLOAD_FORMAT,
+                postprocess_profile(Config.DOWNLOAD_FAST_PRESET)
+            )
+
+            # 已下載過的相同視頻直接從媒體存儲返回，不訪問上游
+            stored = media_store.lookup(media_key)
+            if stored is not None:
+                logger.info(f"命中媒體存儲: {stored['filename']}")
+                report(100, 'done')
+                return {
+                    'status': 'success',
+                    'filename': stored['filename'],
+                    'path': stored['path'],
+                    'media_key': media_key,
+                    'cached': True
+                }
+
+            context = get_extraction(target)
+
+            # 清理文件名
+            title = context.info.get('title', '')
+            if not title:
+                raise Exception("無法獲取視頻標題")
+
+            clean_title = sanitize_filename(title)
+            outtmpl = os.path.join(full_output_path, clean_title + '.%(ext)s')
+
+            def fetch(context):
+                """用已提取的 info 選擇格式並下載，不再重新解析頁面；需要合併時返回各分軌路徑"""
+                with ydl_pool.checkout(
+                    'download',
+                    progress_hook=progress_hook,
+                    postprocessor_hook=postprocessor_hook,
+                    outtmpl=outtmpl
+                ) as ydl:
                     logger.info("開始下載...")
-                    ydl_download.download([url])
-                
-                # 等待文件系統同步
-                time.sleep(2)
-                
-                # 檢查文件是否存在
-                if os.path.exists(expected_path):
-                    logger.info(f"下載完成: {expected_path}")
-                    return {
-                        'status': 'success',
-                        'filename': expected_filename,
-                        'path': expected_path
-                    }
-                else:
-                    # 嘗試查找類似名稱的文件
-                    files = os.listdir(full_output_path)
-                    mp4_files = [f for f in files if f.endswith('.mp4')]
-                    if mp4_files:
-                        actual_path = os.path.join(full_output_path, mp4_files[0])
-                        logger.info(f"找到下載文件: {actual_path}")
-                        return {
-                            'status': 'success',
-                            'filename': mp4_files[0],
-                            'path': actual_path
-                        }
-                    
-                    raise Exception("無法找到下載的視頻文件")
-                    
+                    selected = ydl.process_ie_result(context.fresh_info(), download=False)
+                    requested = selected.get('requested_formats')
+                    download['bytes'] = ByteProgress(download['bytes'].callback)
+                    if not requested:
+                        # 單文件格式交給 yt-dlp 完成下載和修復，最終路徑由後處理鉤子給出
+                        download['span'] = 100
+                        ydl.process_info(selected)
+                        return selected, None
+
+                    download['span'] = 50
+                    session = requests.Session()
+
+                    def fetch_track(fmt):
+                        part_info = dict(selected)
+                        part_info.pop('requested_formats', None)
+                        part_info.update(fmt)
+                        part_path = os.path.join(
+                            full_output_path, f"{clean_title}.f{fmt['format_id']}.{fmt['ext']}"
+                        )
+                        if fmt.get('protocol') in ('http', 'https') and not fmt.get('fragments'):
+                            # 單文件 HTTP 流拆成多個並行 Range 請求
+                            fetch_segmented(
+                                fmt['url'],
+                                part_path,
+                                headers=fmt.get('http_headers'),
+                                cookies=ydl.cookiejar,
+                                connections=Config.DOWNLOAD_CONNECTIONS_PER_STREAM,
+                                rate_limit=Config.DOWNLOAD_CONNECTION_RATE_LIMIT,
+                                min_segment=Config.DOWNLOAD_MIN_SEGMENT_SIZE,
+                                progress=download['bytes'],
+                                progress_key=fmt['format_id'],
+                                cancel_event=cancel_event,
+                                session=session,
+                                chunk_size=(fmt.get('downloader_options') or {}).get('http_chunk_size')
+                            )
+                        else:
+                            # 分片協議（DASH / HLS）由 yt-dlp 並發下載分片
+                            ydl.dl(part_path, part_info)
+                        return part_path
+
+                    # 視頻流和音頻流同時下載
+                    try:
+                        with ThreadPoolExecutor(max_workers=len(requested)) as executor:
+                            parts = list(executor.map(fetch_track, requested))
+                    finally:
+                        session.close()
+                    return selected, parts
+
+            try:
+                selected, parts = fetch(context)
+            except DownloadError as e:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise
+                logger.warning(f"下載失敗，刷新媒體地址後重試: {str(e)}")
+                selected, parts = fetch(get_extraction(target, refresh=True))
+
+            if parts:
+                final_path = os.path.join(full_output_path, f"{clean_title}.mp4")
+                report(download['span'], 'processing')
+                logger.info("正在處理影片文件...")
+                merge_streams(
+                    parts,
+                    final_path,
+                    video_codec=selected.get('vcodec'),
+                    audio_codec=selected.get('acodec'),
+                    duration=selected.get('duration'),
+                    progress_callback=lambda fraction: report(50 + fraction * 50, 'processing'),
+                    cancel_event=cancel_event,
+                    fast=Config.DOWNLOAD_FAST_PRESET
+                )
+                for part_path in parts:
+                    os.remove(part_path)
+            elif final_files:
+                final_path = final_files[-1]
+            else:
+                final_path = (selected.get('requested_downloads') or [{}])[0].get('filepath')
+
+            if not final_path or not os.path.exists(final_path):
+                raise Exception("無法找到下載的視頻文件")
+
+            logger.info(f"下載完成: {final_path}")
+            stored = media_store.commit(media_key, final_path, os.path.basename(final_path))
+            return {
+                'status': 'success',
+                'filename': stored['filename'],
+                'path': stored['path'],
+                'media_key': media_key,
+                'cached': False
+            }
+
         except Exception as e:
             logger.error(f"下載過程出錯: {str(e)}")
             raise
@@ -316,13 +428,9 @@ def download_video(url, output_path='downloads'):
     finally:
         # 清理臨時文件
         clean_temp_files(output_path)
-        # 重置下載狀態
-        current_download = None
-        download_lock.release()
-
-def get_video_info(url):
-    logger.info(f"開始獲取視頻信息: {url}")
 
+def resolve_video_target(url):
+    """解析URL，返回 (平台, 規範化視頻ID, 清理後的URL)"""
     platform = detect_platform(url)
 
     if platform == 'youtube':
@@ -339,112 +447,125 @@ def get_video_info(url):
     else:
         raise Exception("不支援的平台，目前支援 YouTube 和 X (Twitter)")
 
-    logger.info(f"處理URL: {clean_url} (平台: {platform})")
+    return platform, video_id, clean_url
 
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'format': 'best',
-        'extract_flat': False,
-        'no_playlist': True,
-        'retries': 10,
-        'socket_timeout': 30,
-    }
+def get_video_info(url):
+    logger.info(f"開始獲取視頻信息: {url}")
+
+    platform, video_id, clean_url = resolve_video_target(url)
+    cache_key = f"{platform}:{video_id}"
+
+    cached = metadata_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"命中視頻信息緩存: {cache_key}")
+        return cached
+
+    return inflight.do(f"info:{cache_key}", _fetch_video_info, platform, video_id, clean_url)
 
+def _fetch_video_info(platform, video_id, clean_url):
+    cache_key = f"{platform}:{video_id}"
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(clean_url, download=False)
-
-            if not info:
-                raise Exception("無法獲取視頻信息")
-
-            result = {
-                'title': info.get('title'),
-                'video_id': video_id,
-                'platform': platform,
-                'thumbnail': info.get('thumbnail'),
-                'description': info.get('description'),
-                'duration': info.get('duration'),
-                'url': clean_url,
-            }
+        info = get_extraction((platform, video_id, clean_url)).info
+
+        result = {
+            'title': info.get('title'),
+            'video_id': video_id,
+            'platform': platform,
+            'thumbnail': best_thumbnail(info),
+            'description': info.get('description'),
+            'duration': info.get('duration'),
+            'url': clean_url,
+        }
 
-            logger.info(f"成功獲取視頻信息: {result['title']}")
-            return result
+        metadata_cache.set(cache_key, result, ttl=Config.METADATA_CACHE_TTL.get(platform))
+        logger.info(f"成功獲取視頻信息: {result['title']}")
+        return result
 
     except Exception as e:
         logger.error(f"獲取視頻信息失敗: {str(e)}")
         raise Exception(f"獲取視頻信息失敗: {str(e)}")
 
+def rank_subtitle_tracks(info):
+    """列出可用的字幕軌並按優先級排序，返回 [(語言, 來源, 字幕格式信息)]
+
+    手動字幕優先於自動字幕。手動字幕按語言偏好排序，其他語言排在最後；
+    自動字幕優先原始語言的語音識別結果，其次是偏好語言的自動翻譯，其餘翻譯語言忽略。
+    同一語言內按 json3 > srv3 > vtt 選擇格式。
+    """
+    original = info.get('language')
+    ranked = []
+    for source_rank, (source, key) in enumerate((('manual', 'subtitles'), ('auto', 'automatic_captions'))):
+        tracks = info.get(key)
+        if not isinstance(tracks, dict):
+            continue
+        for lang, formats in tracks.items():
+            if lang == 'live_chat' or not isinstance(formats, list):
+                continue
+            if source == 'auto' and (lang.endswith('-orig') or lang == original):
+                lang_rank = -1
+            elif lang in SUBTITLE_LANGUAGES:
+                lang_rank = SUBTITLE_LANGUAGES.index(lang)
+            elif source == 'manual':
+                lang_rank = len(SUBTITLE_LANGUAGES)
+            else:
+                continue
+            for sub in formats:
+                if not isinstance(sub, dict) or not sub.get('url') or sub.get('ext') not in FORMAT_RANK:
+                    continue
+                ranked.append(((source_rank, lang_rank, FORMAT_RANK[sub['ext']]), lang, source, sub))
+    ranked.sort(key=lambda item: item[0])
+    return [(lang, source, sub) for _, lang, source, sub in ranked]
+
 def get_video_transcript(url):
-    """獲取視頻字幕和時間戳"""
+    """獲取視頻字幕和時間戳，成功時返回 CompactTranscript，失敗時返回提示文本"""
     try:
-        clean_url = url.split('&')[0]  # 移除額外參數
+        target = resolve_video_target(url)
+        platform, video_id, clean_url = target
+        video_key = f"{platform}:{video_id}"
         logger.info(f"開始獲取視頻字幕: {clean_url}")
-        
-        ydl_opts = {
-            'writesubtitles': True,
-            'writeautomaticsub': True,
-            'skip_download': True,
-            'subtitleslangs': ['zh-Hant', 'zh-TW', 'zh-HK', 'en'],
-            'quiet': True,
-            'no_warnings': True
-        }
-        
-        with YoutubeDL(ydl_opts) as ydl:
-            logger.info("正在提取字幕信息...")
-            info = ydl.extract_info(clean_url, download=False)
-            
-            if not isinstance(info, dict):
-                raise Exception("無法獲取視頻信息")
-            
-            transcript_with_time = []
-            
-            # 檢查手動字幕
-            if 'subtitles' in info and isinstance(info['subtitles'], dict):
-                logger.info(f"找到手動字幕: {info['subtitles'].keys()}")
-                for lang in ['zh-TW', 'zh-Hant', 'zh-HK', 'en']:
-                    if lang in info['subtitles']:
-                        try:
-                            subs = info['subtitles'][lang]
-                            if isinstance(subs, list) and subs:
-                                for sub in subs:
-                                    if isinstance(sub, dict) and 'ext' in sub and sub['ext'] == 'json3':
-                                        sub_data = ydl.urlopen(sub['url']).read()
-                                        sub_json = json.loads(sub_data)
-                                        if 'events' in sub_json:
-                                            for event in sub_json['events']:
-                                                if 'segs' in event:
-                                                    start_time = event.get('tStartMs', 0) / 1000
-                                                    text = ' '.join(seg['utf8'] for seg in event['segs'] if 'utf8' in seg)
-                                                    if text.strip():
-                                                        minutes = int(start_time // 60)
-                                                        seconds = int(start_time % 60)
-                                                        timestamp = f"{minutes:02d}:{seconds:02d}"
-                                                        transcript_with_time.append({
-                                                            'time': timestamp,
-                                                            'text': text.strip()
-                                                        })
-                                            return transcript_with_time
-                        except Exception as e:
-                            logger.error(f"處理字幕數據時出錯: {str(e)}")
-                            continue
-            
-            # 檢查自動字幕
-            if not transcript_with_time and 'automatic_captions' in info:
-                logger.info("使用自動字幕")
-                # 使用相同的邏輯處理自動字幕
-                # ...
-            
-            if not transcript_with_time:
-                logger.warning("未找到可用字幕")
-                return "無字幕內容"
-            
-            return transcript_with_time
-            
+
+        track = transcript_tracks.get(video_key)
+        if track is not None:
+            cached = transcript_cache.get(f"{video_key}:{track['language']}:{track['source']}")
+            if cached is not None:
+                logger.info(f"字幕緩存命中: {video_key} ({track['language']}, {track['source']})")
+                return cached
+
+        return inflight.do(f"transcript:{video_key}", _fetch_transcript, target)
     except Exception as e:
         logger.error(f"獲取字幕失敗: {str(e)}")
         return "無法獲取字幕"
 
+def _fetch_transcript(target):
+    """按優先級下載並解析字幕軌，寫入緩存"""
+    platform, video_id, _ = target
+    video_key = f"{platform}:{video_id}"
+
+    # 字幕列表來自共用的提取上下文，這裡的實例只用於請求字幕文件
+    with ydl_pool.checkout('subtitles') as ydl:
+        logger.info("正在提取字幕信息...")
+        info = get_extraction(target).info
+
+        # 按優先級依次嘗試，下載或解析失敗時換下一個字幕軌
+        for lang, source, sub in rank_subtitle_tracks(info):
+            try:
+                # 邊下載邊解析，直接寫入緊湊存儲，不保留完整的響應內容
+                with closing(ydl.urlopen(sub['url'])) as response:
+                    transcript = CompactTranscript.from_segments(
+                        PARSERS[sub['ext']](response), language=lang, source=source
+                    )
+            except Exception as e:
+                logger.error(f"處理字幕數據時出錯 ({lang}, {sub['ext']}): {str(e)}")
+                continue
+            if len(transcript):
+                logger.info(f"使用{'手動' if source == 'manual' else '自動'}字幕: {lang} ({sub['ext']})，共 {len(transcript)} 段")
+                transcript_cache.set(f"{video_key}:{lang}:{source}", transcript)
+                transcript_tracks.set(video_key, {'language': lang, 'source': source})
+                return transcript
+        
+        logger.warning("未找到可用字幕")
+        return NO_TRANSCRIPT
+
 def process_subtitles(subtitle_list):
     """處理字幕格式"""
     try:
@@ -459,18 +580,14 @@ def process_subtitles(subtitle_list):
                     text = item['data'].strip()
                 
                 if text:
-                    # 移除 HTML 標籤
-                    text = re.sub(r'<[^>]+>', '', text)
-                    # 移除方括號內的內容（通常是音效描述）
-                    text = re.sub(r'\[[^\]]*\]', '', text)
-                    # 移除多餘的空白
-                    text = ' '.join(text.split())
+                    # 移除 HTML 標籤、音效描述和多餘的空白
+                    text = clean_caption_text(text)
                     if text:
                         text_lines.append(text)
         
         if not text_lines:
             logger.warning("字幕列表為空")
-            return "無字幕內容"
+            return NO_TRANSCRIPT
             
         # 合併文本並清理格式
         full_text = '\n'.join(text_lines)  # 使用換行符分隔，保持段落結構
@@ -478,12 +595,9 @@ def process_subtitles(subtitle_list):
         # 如果文本太短，可能不是有效的字幕
         if len(full_text.strip()) < 10:
             logger.warning("字幕內容過短")
-            return "無字幕內容"
+            return NO_TRANSCRIPT
             
         return full_text
     except Exception as e:
         logger.error(f"處理字幕時出錯: {str(e)}")
         return "字幕處理失敗"
-
-# 在文件末尾調用初始化
-init_downloads_directory() 
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""共享 LLMClient 壓力測試
+
+啟動本地 OpenAI 測試樁（按比例注入 429 和 500），並發發起摘要請求，
+檢查上游觀察到的最大並發不超過配置上限，並統計重試後的成功率和耗時。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_llm_client [--requests 40] [--concurrency 20] [--max-in-flight 4]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.llm_client import LLMClient
+from benchmarks.openai_stub import start_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=40, help='請求總數')
+    parser.add_argument('--concurrency', type=int, default=20, help='調用方線程數')
+    parser.add_argument('--max-in-flight', type=int, default=4, help='LLMClient 並發上限')
+    parser.add_argument('--latency', type=float, default=0.2, help='測試樁響應延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='測試樁返回 500 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.1, help='測試樁返回 429 的比例')
+    args = parser.parse_args()
+
+    server, stats, base_url = start_stub(latency=args.latency, error_rate=args.error_rate,
+                                         rate_limit_rate=args.rate_limit_rate, retry_after=1)
+    client = LLMClient('stub', base_url=base_url, max_in_flight=args.max_in_flight,
+                       max_retries=6, backoff_base=0.1, backoff_max=2, breaker_threshold=1000)
+
+    def call(index):
+        started = time.perf_counter()
+        try:
+            if index % 2:
+                response = client.create(model='stub', max_tokens=100,
+                                         messages=[{'role': 'user', 'content': f'請求 {index}'}])
+                response.choices[0].message.content
+            else:
+                stream = client.create(model='stub', max_tokens=100, stream=True,
+                                       messages=[{'role': 'user', 'content': f'請求 {index}'}])
+                ''.join(chunk.choices[0].delta.content or '' for chunk in stream if chunk.choices)
+            return True, time.perf_counter() - started
+        except Exception as e:
+            print(f"請求 {index} 失敗: {e}")
+            return False, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    ok = sum(1 for success, _ in results if success)
+    latencies = sorted(latency for _, latency in results)
+    print(f"成功 {ok}/{args.requests}，總耗時 {elapsed:.2f} s，"
+          f"p50 {latencies[len(latencies) // 2]:.2f} s，p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} s")
+    print(f"上游請求 {stats.requests} 次（429: {stats.rate_limited}，500: {stats.errors}），"
+          f"上游最大並發 {stats.max_in_flight} / 上限 {args.max_in_flight}")
+    print(f"客戶端狀態: {client.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""分段並行下載基準測試
+
+在本地啟動一個支持 Range、按連接限速的 HTTP 測試服務器，模擬視頻 CDN 對單連接的帶寬限制，
+比較「視頻和音頻依次單連接下載」與「兩條流同時下載、每條流多連接分段」的耗時。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_segmented_download [--size-mb 32] [--rate-mb 8] [--connections 4]
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from app.services.segmented_download import ByteProgress, fetch_segmented
+
+
+def make_handler(files, rate):
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = files.get(self.path)
+            if data is None:
+                self.send_error(404)
+                return
+
+            start, end = 0, len(data) - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+
+            # 每個連接獨立限速
+            chunk = 64 * 1024
+            sent = 0
+            started = time.monotonic()
+            for offset in range(start, end + 1, chunk):
+                piece = data[offset:min(offset + chunk, end + 1)]
+                self.wfile.write(piece)
+                sent += len(piece)
+                delay = sent / rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    return RangeHandler
+
+
+def run(label, base_url, tracks, connections, parallel_tracks, workdir):
+    progress = ByteProgress()
+
+    def fetch(name):
+        path = os.path.join(workdir, f'{label}-{name.strip("/")}')
+        fetch_segmented(base_url + name, path, connections=connections,
+                        min_segment=256 * 1024, progress=progress, progress_key=name)
+        return os.path.getsize(path)
+
+    started = time.perf_counter()
+    if parallel_tracks:
+        with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+            sizes = list(executor.map(fetch, tracks))
+    else:
+        sizes = [fetch(name) for name in tracks]
+    elapsed = time.perf_counter() - started
+    total_mb = sum(sizes) / 1024 ** 2
+    print(f"{label:<40} {elapsed:7.2f} s  {total_mb / elapsed:7.1f} MiB/s  progress={progress.fraction():.0%}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=32, help='視頻流大小（MiB），音頻流為其 1/4')
+    parser.add_argument('--rate-mb', type=float, default=8, help='服務器單連接限速（MiB/s）')
+    parser.add_argument('--connections', type=int, default=4, help='每條流的並發連接數')
+    args = parser.parse_args()
+
+    files = {
+        '/video.mp4': os.urandom(args.size_mb * 1024 ** 2),
+        '/audio.m4a': os.urandom(args.size_mb * 1024 ** 2 // 4),
+    }
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(files, args.rate_mb * 1024 ** 2))
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    tracks = list(files)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        baseline = run('sequential, 1 connection per stream', base_url, tracks, 1, False, workdir)
+        run('parallel streams, 1 connection', base_url, tracks, 1, True, workdir)
+        best = run(f'parallel streams, {args.connections} connections', base_url, tracks,
+                   args.connections, True, workdir)
+        print(f"speedup: {baseline / best:.1f}x")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
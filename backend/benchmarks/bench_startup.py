@@ -0,0 +1,106 @@
+"""啟動時間基準測試
+
+每輪啟動一個新的 Python 進程，測量導入應用（wsgi）、首個 /health 請求的耗時，
+以及在首次使用時才加載的第三方模塊（yt-dlp、OpenAI SDK 等）另需的導入時間；
+--server 時改為啟動 gunicorn，測量從啟動到 /health 返回 200 的時間。
+不需要 OPENAI_API_KEY，未配置時摘要路由不可用但應用照常啟動。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_startup [--rounds 5] [--server] [--worker-class gevent]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from wsgi import app
+imported = time.perf_counter()
+response = app.test_client().get('/health')
+assert response.status_code == 200, response.status_code
+ready = time.perf_counter()
+from app import HEAVY_MODULES, preload_modules
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+preload_modules()
+preloaded = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_request': ready - imported,
+    'heavy_loaded': loaded,
+    'preload': preloaded - ready,
+}))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def probe_once(env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def server_once(env, worker_class, timeout=30):
+    """啟動單 worker 的 gunicorn，返回第一次 /health 成功的時間"""
+    port = free_port()
+    env = dict(env, BIND=f'127.0.0.1:{port}', WEB_WORKERS='1', WEB_WORKER_CLASS=worker_class,
+               WEB_ACCESS_LOG='/dev/null', LOG_LEVEL='warning')
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError('gunicorn 未在超時前就緒')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(name, values):
+    print(f"{name:<16} median {statistics.median(values) * 1000:7.1f} ms  "
+          f"min {min(values) * 1000:7.1f} ms  max {max(values) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5, help='重複次數')
+    parser.add_argument('--server', action='store_true', help='測量 gunicorn 啟動到可以響應的時間')
+    parser.add_argument('--worker-class', default='gevent', help='--server 時使用的 worker 類型')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop('OPENAI_API_KEY', None)
+
+    if args.server:
+        summarize('ready', [server_once(env, args.worker_class) for _ in range(args.rounds)])
+        return
+
+    results = [probe_once(env) for _ in range(args.rounds)]
+    summarize('import', [r['import'] for r in results])
+    summarize('first request', [r['first_request'] for r in results])
+    summarize('deferred import', [r['preload'] for r in results])
+    print(f"heavy modules loaded at startup: {results[-1]['heavy_loaded'] or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""字幕解析器基準測試
+
+生成與 YouTube 自動字幕結構相同的多小時 json3、srv3 和 WebVTT 字幕，
+測量各解析器的耗時和吞吐量，並與原先逐事件構造字典的 json3 處理方式對比。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_subtitle_parsers [--hours 4] [--repeat 3]
+"""
+import argparse
+import json
+import random
+import time
+
+from app.services.subtitle_parsers import PARSERS
+from app.services.transcript_service import format_timestamp
+
+WORDS = ['video', 'cache', 'stream', 'today', 'we', 'talk', 'about', 'the', 'design',
+         'of', 'a', 'fast', 'parser', 'and', 'why', 'it', 'matters', '我們', '今天', '討論']
+
+
+def vtt_time(ms):
+    hours, rest = divmod(ms, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}"
+
+
+def generate(hours):
+    """按自動字幕的結構生成字幕：每約 2 秒一個事件，每個事件若干逐詞片段"""
+    random.seed(0)
+    events = []
+    ms = 0
+    end = hours * 3600 * 1000
+    while ms < end:
+        words = [random.choice(WORDS) for _ in range(random.randint(4, 9))]
+        events.append((ms, 2000, words))
+        ms += random.randint(1500, 2500)
+
+    json3 = {'wireMagic': 'pb3', 'events': []}
+    for start, duration, words in events:
+        json3['events'].append({
+            'tStartMs': start,
+            'dDurationMs': duration,
+            'wWinId': 1,
+            'segs': [{'utf8': words[0]}] + [{'utf8': f' {w}', 'tOffsetMs': i * 200}
+                                            for i, w in enumerate(words[1:], 1)],
+        })
+        # 自動字幕在事件之間插入只含換行的追加事件
+        json3['events'].append({'tStartMs': start + duration - 10, 'dDurationMs': 10,
+                                'wWinId': 1, 'aAppend': 1, 'segs': [{'utf8': '\n'}]})
+
+    srv3 = ['<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>']
+    for start, duration, words in events:
+        spans = ''.join(f'<s t="{i * 200}" ac="0">{" " if i else ""}{w}</s>' for i, w in enumerate(words))
+        srv3.append(f'<p t="{start}" d="{duration}" w="1">{spans}</p>')
+    srv3.append('</body></timedtext>')
+
+    vtt = ['WEBVTT', 'Kind: captions', 'Language: en', '']
+    previous = ''
+    for start, duration, words in events:
+        tagged = ''.join(f'<{vtt_time(start + i * 200)}><c> {w}</c>' for i, w in enumerate(words))
+        # 滾動顯示：先重複上一行，再出現帶逐詞時間標籤的新行
+        vtt.append(f'{vtt_time(start)} --> {vtt_time(start + duration)} align:start position:0%')
+        vtt.append(previous or ' ')
+        vtt.append(tagged)
+        vtt.append('')
+        previous = ' '.join(words)
+
+    return {
+        'json3': json.dumps(json3).encode('utf-8'),
+        'srv3': ''.join(srv3).encode('utf-8'),
+        'vtt': '\n'.join(vtt).encode('utf-8'),
+    }
+
+
+def legacy_json3(data):
+    """原先的處理方式：整體 json.loads 後逐事件構造帶 MM:SS 時間字符串的字典"""
+    result = []
+    sub_json = json.loads(data)
+    for event in sub_json['events']:
+        if 'segs' in event:
+            start_time = event.get('tStartMs', 0) / 1000
+            text = ' '.join(seg['utf8'] for seg in event['segs'] if 'utf8' in seg)
+            if text.strip():
+                minutes = int(start_time // 60)
+                seconds = int(start_time % 60)
+                result.append({'time': f"{minutes:02d}:{seconds:02d}", 'text': text.strip()})
+    return result
+
+
+def measure(func, data, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=4, help='字幕時長（小時）')
+    parser.add_argument('--repeat', type=int, default=3, help='每項重複次數，取最快一次')
+    args = parser.parse_args()
+
+    files = generate(args.hours)
+
+    elapsed, legacy = measure(legacy_json3, files['json3'], args.repeat)
+    size_mb = len(files['json3']) / 1024 ** 2
+    print(f"{'json3 (legacy)':<16} {size_mb:7.1f} MiB  {elapsed * 1000:8.1f} ms  "
+          f"{size_mb / elapsed:7.1f} MiB/s  segments={len(legacy)}  last={legacy[-1]['time']}")
+
+    for ext, parse in PARSERS.items():
+        def run(data):
+            return [{'time': format_timestamp(start / 1000), 'text': text} for start, _, text in parse(data)]
+
+        elapsed, segments = measure(run, files[ext], args.repeat)
+        size_mb = len(files[ext]) / 1024 ** 2
+        print(f"{ext:<16} {size_mb:7.1f} MiB  {elapsed * 1000:8.1f} ms  "
+              f"{size_mb / elapsed:7.1f} MiB/s  segments={len(segments)}  last={segments[-1]['time']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""字幕解析內存基準測試
+
+把生成的多小時 json3 / srv3 / WebVTT 字幕寫入臨時文件，模擬從響應中讀取，
+用 tracemalloc 比較兩種方式的峰值內存和解析後保留的內存：
+原先的整體讀取 + json.loads + 每段一個字典，以及流式解析寫入 CompactTranscript。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_transcript_memory [--hours 10]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.services.subtitle_parsers import PARSERS
+from app.services.transcript_service import CompactTranscript
+from benchmarks.bench_subtitle_parsers import generate, legacy_json3
+
+
+def measure(label, func):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} peak {peak / 1024 ** 2:8.1f} MiB  retained {retained / 1024 ** 2:8.1f} MiB  "
+          f"{elapsed * 1000:8.1f} ms  segments={len(result)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=10, help='字幕時長（小時）')
+    args = parser.parse_args()
+
+    files = generate(args.hours)
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = {}
+        for ext, data in files.items():
+            paths[ext] = os.path.join(workdir, f'captions.{ext}')
+            with open(paths[ext], 'wb') as f:
+                f.write(data)
+            print(f"{ext}: {len(data) / 1024 ** 2:.1f} MiB")
+        del files
+
+        def legacy():
+            with open(paths['json3'], 'rb') as f:
+                return legacy_json3(f.read())
+
+        measure('json3 legacy (read + loads)', legacy)
+
+        for ext, parse in PARSERS.items():
+            def streaming():
+                with open(paths[ext], 'rb') as f:
+                    return CompactTranscript.from_segments(parse(f))
+
+            transcript = measure(f'{ext} streaming + compact', streaming)
+        print(f"CompactTranscript 數據大小: {transcript.nbytes() / 1024 ** 2:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""yt-dlp 實例池基準測試
+
+在本地啟動一個支持 HTTP/1.1 長連接的字幕服務器，分別用「每次新建 YoutubeDL」
+和「從 ydl_pool 借出實例」的方式並發下載字幕文件，對比總耗時、每次調用開銷
+和服務器收到的 TCP 連接數（對 HTTPS 平台即 TLS 握手次數）。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.bench_ydl_pool [--requests 200] [--threads 8]
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from yt_dlp import YoutubeDL
+
+from app.services.youtube_service import SUBTITLE_OPTS
+from app.services.ydl_pool import ydl_pool
+
+SUBTITLE = ('WEBVTT\n\n' + ''.join(
+    f"00:00:{i:02d}.000 --> 00:00:{i + 1:02d}.000\nline {i}\n\n" for i in range(59)
+)).encode()
+
+
+class ConnectionCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = set()
+
+    def add(self, address):
+        with self.lock:
+            self.connections.add(address)
+
+    def reset(self):
+        with self.lock:
+            count = len(self.connections)
+            self.connections.clear()
+            return count
+
+
+def start_server(counter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            counter.add(self.client_address)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/vtt')
+            self.send_header('Content-Length', str(len(SUBTITLE)))
+            self.end_headers()
+            self.wfile.write(SUBTITLE)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch_fresh(url):
+    with YoutubeDL(SUBTITLE_OPTS) as ydl:
+        with closing(ydl.urlopen(url)) as response:
+            return len(response.read())
+
+
+def fetch_pooled(url):
+    with ydl_pool.checkout('subtitles') as ydl:
+        with closing(ydl.urlopen(url)) as response:
+            return len(response.read())
+
+
+def run(fetch, url, requests, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        total = sum(executor.map(fetch, [url] * requests))
+    return time.perf_counter() - started, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='字幕請求總數')
+    parser.add_argument('--threads', type=int, default=8, help='並發線程數')
+    args = parser.parse_args()
+
+    counter = ConnectionCounter()
+    server = start_server(counter)
+    url = f"http://127.0.0.1:{server.server_port}/subtitle.vtt"
+
+    for name, fetch in (('fresh', fetch_fresh), ('pooled', fetch_pooled)):
+        elapsed, total = run(fetch, url, args.requests, args.threads)
+        connections = counter.reset()
+        print(f"{name:<8} {elapsed:7.2f} s  {elapsed / args.requests * 1000 * args.threads:7.1f} ms/call  "
+              f"connections={connections}  bytes={total}")
+    print(f"pool: {ydl_pool.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
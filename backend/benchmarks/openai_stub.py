@@ -0,0 +1,160 @@
+"""本地 OpenAI Chat Completions 測試樁
+
+模擬 /v1/chat/completions 的普通和流式響應，可按比例注入 429（附 Retry-After）和 500，
+用於在不訪問真實接口的情況下驗證 LLMClient 的並發限制、重試和熔斷。
+
+用法（在 backend 目錄下）：
+    python -m benchmarks.openai_stub [--port 8100] [--latency 0.5] [--error-rate 0.1] [--rate-limit-rate 0.1]
+
+再讓應用服務器指向測試樁，對摘要接口施壓（cache=false 跳過摘要緩存，每次都請求上游）：
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8100/v1 gunicorn -c gunicorn.conf.py 'app:create_app()'
+    curl -N -X POST http://127.0.0.1:5001/api/summary/stream -H 'Content-Type: application/json' \
+        -d '{"transcript": "[00:00] hello world", "duration": 60, "cache": false}'
+
+/api/summary（非流式）同樣經過 LLMClient；不經過 Web 層時用 benchmarks.bench_llm_client。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def enter(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def make_handler(stats, latency, error_rate, rate_limit_rate, retry_after):
+    class CompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.endswith('/chat/completions'):
+                self.send_json(404, {'error': {'message': 'not found'}})
+                return
+
+            stats.enter()
+            try:
+                time.sleep(latency)
+                roll = random.random()
+                if roll < rate_limit_rate:
+                    with stats.lock:
+                        stats.rate_limited += 1
+                    self.send_json(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}},
+                                   {'Retry-After': str(retry_after)})
+                    return
+                if roll < rate_limit_rate + error_rate:
+                    with stats.lock:
+                        stats.errors += 1
+                    self.send_json(500, {'error': {'message': 'stub failure', 'type': 'server_error'}})
+                    return
+
+                text = f"[00:00] 測試樁回覆（max_tokens={request.get('max_tokens')}）"
+                if request.get('stream'):
+                    self.stream(request, text)
+                else:
+                    self.send_json(200, {
+                        'id': 'chatcmpl-stub',
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': request.get('model', 'stub'),
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': text},
+                            'finish_reason': 'stop',
+                        }],
+                        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                    })
+            finally:
+                stats.leave()
+
+        def stream(self, request, text):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def write(payload):
+                data = f"data: {payload}\n\n".encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            for piece in [text[i:i + 4] for i in range(0, len(text), 4)]:
+                write(json.dumps({
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'stub'),
+                    'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+                }))
+                time.sleep(0.01)
+            write('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+
+    return CompletionsHandler
+
+
+def start_stub(port=0, latency=0.2, error_rate=0.0, rate_limit_rate=0.0, retry_after=1):
+    """在後台線程啟動測試樁，返回 (server, stats, base_url)"""
+    stats = StubStats()
+    handler = make_handler(stats, latency, error_rate, rate_limit_rate, retry_after)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.5, help='每個請求的響應延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 響應的 Retry-After（秒）')
+    args = parser.parse_args()
+
+    server, stats, base_url = start_stub(args.port, args.latency, args.error_rate,
+                                         args.rate_limit_rate, args.retry_after)
+    print(f"OpenAI 測試樁已啟動: {base_url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"requests={stats.requests} max_in_flight={stats.max_in_flight} "
+                  f"429={stats.rate_limited} 500={stats.errors}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
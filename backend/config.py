@@ -2,7 +2,9 @@ import os
 from pathlib import Path
 
 # 獲取項目根目錄
-ROOT_DIR = Path(__file__).parent.parent.parent
+ROOT_DIR = Path(__file__).parent.parent
+# 後端目錄（容器內掛載為 /app）
+BACKEND_DIR = Path(__file__).parent
 
 class Config:
     # 基本配置
@@ -10,14 +12,105 @@ class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     
     # 文件路徑配置
-    TEMP_AUDIO_DIR = os.path.join(ROOT_DIR, 'backend', 'temp_audio')
-    DOWNLOAD_DIR = os.path.join(ROOT_DIR, 'backend', 'downloads')
+    TEMP_AUDIO_DIR = os.path.join(BACKEND_DIR, 'temp_audio')
+    DOWNLOAD_DIR = os.path.join(BACKEND_DIR, 'downloads')
+    CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(BACKEND_DIR, 'cache'))
+
+    # 視頻信息緩存配置（TTL 單位：秒，0 表示不緩存）
+    METADATA_CACHE_MEMORY_ENTRIES = int(os.getenv('METADATA_CACHE_MEMORY_ENTRIES', 1024))
+    METADATA_CACHE_DISK_ENTRIES = int(os.getenv('METADATA_CACHE_DISK_ENTRIES', 50000))
+    METADATA_CACHE_TTL = {
+        'youtube': int(os.getenv('METADATA_CACHE_TTL_YOUTUBE', 6 * 3600)),
+        'x': int(os.getenv('METADATA_CACHE_TTL_X', 3600)),
+    }
+
+    # 字幕緩存，字幕很少變化，默認保留一週
+    TRANSCRIPT_CACHE_MEMORY_ENTRIES = int(os.getenv('TRANSCRIPT_CACHE_MEMORY_ENTRIES', 128))
+    TRANSCRIPT_CACHE_DISK_ENTRIES = int(os.getenv('TRANSCRIPT_CACHE_DISK_ENTRIES', 20000))
+    TRANSCRIPT_CACHE_TTL = int(os.getenv('TRANSCRIPT_CACHE_TTL', 7 * 24 * 3600))
+
+    # 提取上下文（yt-dlp info 字典）在內存中的保留數量和時間
+    EXTRACTION_CONTEXT_ENTRIES = int(os.getenv('EXTRACTION_CONTEXT_ENTRIES', 256))
+    EXTRACTION_CONTEXT_TTL = int(os.getenv('EXTRACTION_CONTEXT_TTL', 3 * 3600))
+    # 每種 yt-dlp 選項配置保留的空閒實例數，複用實例的 HTTP 長連接和播放器簽名緩存
+    YDL_POOL_SIZE = int(os.getenv('YDL_POOL_SIZE', 4))
+
+    # 下載任務隊列配置
+    DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', min(4, os.cpu_count() or 1)))
+    DOWNLOAD_QUEUE_LIMIT = int(os.getenv('DOWNLOAD_QUEUE_LIMIT', 20))
+    DOWNLOAD_JOB_RETENTION = int(os.getenv('DOWNLOAD_JOB_RETENTION', 3600))
+    # 同時運行的 ffmpeg 進程上限（合併、轉碼），使用共享狀態後端時為整機上限
+    FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', os.cpu_count() or 1))
+    # 分段並行下載：每條流的並發連接數、單連接限速（字節/秒，0 為不限）和最小分段大小
+    DOWNLOAD_CONNECTIONS_PER_STREAM = int(os.getenv('DOWNLOAD_CONNECTIONS_PER_STREAM', 4))
+    DOWNLOAD_CONNECTION_RATE_LIMIT = int(os.getenv('DOWNLOAD_CONNECTION_RATE_LIMIT', 0))
+    DOWNLOAD_MIN_SEGMENT_SIZE = int(os.getenv('DOWNLOAD_MIN_SEGMENT_SIZE', 1024 * 1024))
+    # 必須轉碼時使用快速預設（純軟件編碼，犧牲部分畫質和體積）
+    DOWNLOAD_FAST_PRESET = os.getenv('DOWNLOAD_FAST_PRESET', '0').lower() in ('1', 'true', 'yes')
+
+    # 已下載媒體的持久化存儲，超出容量時按 LRU 淘汰
+    MEDIA_STORE_DIR = os.getenv('MEDIA_STORE_DIR', os.path.join(DOWNLOAD_DIR, 'store'))
+    MEDIA_STORE_MAX_BYTES = int(os.getenv('MEDIA_STORE_MAX_BYTES', 10 * 1024 ** 3))
+
+    # AI 摘要：單個片段的 token 預算、片段摘要的輸出上限和 map 階段並發數
+    SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', 6000))
+    SUMMARY_CHUNK_SUMMARY_TOKENS = int(os.getenv('SUMMARY_CHUNK_SUMMARY_TOKENS', 600))
+    SUMMARY_MAP_CONCURRENCY = int(os.getenv('SUMMARY_MAP_CONCURRENCY', 4))
+
+    # OpenAI 客戶端：OPENAI_BASE_URL 可指向兼容接口或本地測試樁；
+    # 並發請求數、每分鐘 token 預算（0 表示不限）、重試次數和熔斷參數
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+    LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', 8))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 0))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+    LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+    LLM_BREAKER_COOLDOWN = int(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+    LLM_TIMEOUT = int(os.getenv('LLM_TIMEOUT', 120))
+
+    # 字幕壓縮：發送給模型的 token 預算、合併窗口（秒）和 tiktoken 編碼
+    TRANSCRIPT_TOKEN_BUDGET = int(os.getenv('TRANSCRIPT_TOKEN_BUDGET', 60000))
+    TRANSCRIPT_WINDOW_SECONDS = int(os.getenv('TRANSCRIPT_WINDOW_SECONDS', 30))
+    TRANSCRIPT_MAX_WINDOW_SECONDS = int(os.getenv('TRANSCRIPT_MAX_WINDOW_SECONDS', 240))
+    TOKENIZER_ENCODING = os.getenv('TOKENIZER_ENCODING', 'cl100k_base')
+    # tiktoken 編碼文件的本地目錄；鏡像構建時預先下載，運行時無需訪問網絡
+    TIKTOKEN_CACHE_DIR = os.getenv('TIKTOKEN_CACHE_DIR', os.path.join(CACHE_DIR, 'tiktoken'))
+
+    # AI 摘要結果緩存（TTL 單位：秒，0 表示不緩存）
+    SUMMARY_CACHE_MEMORY_ENTRIES = int(os.getenv('SUMMARY_CACHE_MEMORY_ENTRIES', 256))
+    SUMMARY_CACHE_DISK_ENTRIES = int(os.getenv('SUMMARY_CACHE_DISK_ENTRIES', 20000))
+    SUMMARY_CACHE_TTL = int(os.getenv('SUMMARY_CACHE_TTL', 7 * 24 * 3600))
+
+    # 一站式處理任務（信息、字幕、摘要）的工作線程數、排隊上限和結束後保留時間（秒）
+    PROCESS_WORKERS = int(os.getenv('PROCESS_WORKERS', 8))
+    PROCESS_QUEUE_LIMIT = int(os.getenv('PROCESS_QUEUE_LIMIT', 50))
+    PROCESS_JOB_RETENTION = int(os.getenv('PROCESS_JOB_RETENTION', 3600))
+
+    # 預取：獲取視頻信息後在後台預先抓取字幕（可選摘要）寫入緩存，默認關閉。
+    # 工作線程數即並發預算；排隊超過 PREFETCH_TTL 秒仍未開始的任務取消；
+    # 進行中的用戶請求達到 PREFETCH_YIELD_THRESHOLD 時暫停開始新的預取
+    PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '0').lower() in ('1', 'true', 'yes')
+    PREFETCH_SUMMARY = os.getenv('PREFETCH_SUMMARY', '0').lower() in ('1', 'true', 'yes')
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+    PREFETCH_QUEUE_LIMIT = int(os.getenv('PREFETCH_QUEUE_LIMIT', 100))
+    PREFETCH_TTL = int(os.getenv('PREFETCH_TTL', 60))
+    PREFETCH_YIELD_THRESHOLD = int(os.getenv('PREFETCH_YIELD_THRESHOLD', 4))
+
+    # 協調狀態後端（任務記錄、進度、隊列和租約）：memory 只適用於單進程，
+    # sqlite 適用於單機多進程，redis 適用於多節點（需要安裝 redis 包）
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+    STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(CACHE_DIR, 'state.sqlite3'))
+    STATE_REDIS_URL = os.getenv('STATE_REDIS_URL', 'redis://localhost:6379/0')
+    # 任務租約時長（秒），持有者崩潰後最多經過這段時間由其他進程接手
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+    # 同一任務因崩潰被重新執行的次數上限
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
     
     # 確保必要的目錄存在
     @classmethod
     def init_app(cls, app):
         os.makedirs(cls.TEMP_AUDIO_DIR, exist_ok=True)
         os.makedirs(cls.DOWNLOAD_DIR, exist_ok=True)
+        os.makedirs(cls.CACHE_DIR, exist_ok=True)
         
         # 配置日誌
         if not app.debug:
@@ -0,0 +1,55 @@
+"""gunicorn 生產配置，所有參數都可以通過環境變量覆蓋
+
+默認使用 gevent worker：視頻信息、字幕、AI 摘要和 SSE 進度流等 I/O 密集的請求
+在等待上游時讓出，每個 worker 進程可同時處理上千個慢請求（WEB_WORKER_CONNECTIONS）。
+多個 worker 之間的任務記錄、進度和隊列需要共享狀態後端（STATE_BACKEND=sqlite 或 redis）；
+STATE_BACKEND=memory（默認）時只運行一個 worker，顯式設置多個 worker 時拒絕啟動。
+
+worker 類型與狀態後端的搭配：sqlite3 是 C 擴展，等待其他進程的寫鎖（busy timeout）時
+不會讓出 gevent 事件循環，整個 worker 的所有連接都會停住；因此 STATE_BACKEND=sqlite 時
+默認改用 gthread worker，gevent worker 應搭配 memory（單 worker）或 redis 後端。
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5001')}")
+
+state_backend = os.getenv('STATE_BACKEND', 'memory').lower()
+
+# gevent（默認）或 gthread；SQLite 狀態後端默認 gthread，每個 worker 的並發數為 WEB_THREADS
+worker_class = os.getenv('WEB_WORKER_CLASS', 'gthread' if state_backend == 'sqlite' else 'gevent')
+# 進程內狀態後端的任務、進度和 single-flight 只在單個 worker 內可見，多 worker 時
+# 查詢任務和訂閱進度的請求會隨機落到看不到該任務的 worker 上
+workers = int(os.getenv('WEB_WORKERS', 1 if state_backend == 'memory' else multiprocessing.cpu_count()))
+if workers > 1 and state_backend == 'memory':
+    raise RuntimeError(
+        f"STATE_BACKEND=memory 時只能運行單個 worker（WEB_WORKERS={workers}），"
+        "多 worker 部署請設置 STATE_BACKEND=sqlite 或 redis"
+    )
+worker_connections = int(os.getenv('WEB_WORKER_CONNECTIONS', 1000))
+threads = int(os.getenv('WEB_THREADS', 32))
+
+# gevent worker 的心跳由事件循環發送，長時間的 SSE 連接不會觸發超時
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('WEB_KEEPALIVE', 5))
+
+# gevent worker 在 monkey patch 之後才能導入應用，不能預加載；
+# gthread worker 可設置 WEB_PRELOAD=1，在主進程中導入應用和較慢的第三方模塊後再 fork，
+# 新 worker（包括擴容和重啟時）無需重新導入即可接收請求
+preload_app = worker_class != 'gevent' and os.getenv('WEB_PRELOAD', '0').lower() in ('1', 'true', 'yes')
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    if preload_app:
+        from app import preload_modules
+        preload_modules()
+    if worker_class == 'gevent' and state_backend == 'sqlite':
+        server.log.warning(
+            "gevent worker 搭配 SQLite 狀態後端時，等待寫鎖會阻塞整個 worker 的事件循環，"
+            "建議使用 gthread worker 或 redis 後端"
+        )
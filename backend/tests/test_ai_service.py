@@ -0,0 +1,146 @@
+import pytest
+
+from app.services import ai_service
+from app.services.ai_service import SUMMARY_TEMPERATURE, AIService, split_transcript, summary_cache_key
+
+TRANSCRIPT = '[00:00] welcome to the talk\n[00:05] today we cover caching'
+
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.data[key] = value
+
+
+class FakeSummaryService(AIService):
+    def __init__(self):
+        super().__init__(client=object())
+        self.generated = []
+
+    def _generate_summary(self, transcript, duration, cache_key=None):
+        self.generated.append(transcript)
+        if cache_key:
+            ai_service.summary_cache.set(cache_key, 'summary')
+        return 'summary'
+
+
+def test_cache_key_ignores_layout_but_not_content():
+    assert summary_cache_key(TRANSCRIPT, 60) == summary_cache_key('\n  ' + TRANSCRIPT.replace(' ', '   ') + '\n\n', 60)
+    assert summary_cache_key(TRANSCRIPT, 60) != summary_cache_key(TRANSCRIPT + ' now', 60)
+    assert summary_cache_key(TRANSCRIPT, 60) != summary_cache_key(TRANSCRIPT, 120)
+
+
+def test_cache_key_includes_sampling_and_prompt_version(monkeypatch):
+    key = summary_cache_key(TRANSCRIPT, 60)
+    monkeypatch.setattr(ai_service, 'SUMMARY_TEMPERATURE', 0.7)
+    assert summary_cache_key(TRANSCRIPT, 60) != key
+    monkeypatch.setattr(ai_service, 'SUMMARY_TEMPERATURE', SUMMARY_TEMPERATURE)
+    monkeypatch.setattr(ai_service, 'SUMMARY_PROMPT_VERSION', ai_service.SUMMARY_PROMPT_VERSION + 1)
+    assert summary_cache_key(TRANSCRIPT, 60) != key
+
+
+def test_cache_is_keyed_on_raw_transcript_regardless_of_tokenizer(monkeypatch):
+    """有無 tiktoken 時壓縮結果不同，緩存仍然互相命中"""
+    cache = DictCache()
+    monkeypatch.setattr(ai_service, 'summary_cache', cache)
+    service = FakeSummaryService()
+
+    monkeypatch.setattr(ai_service, 'compact_transcript', lambda text: 'compacted with tiktoken')
+    assert service.summarize_transcript(TRANSCRIPT, 60) == 'summary'
+    monkeypatch.setattr(ai_service, 'compact_transcript', lambda text: 'compacted with estimate')
+    assert service.summarize_transcript(TRANSCRIPT, 60) == 'summary'
+    events = list(service.stream_summary(TRANSCRIPT, 60))
+
+    assert service.generated == ['compacted with tiktoken']
+    assert list(cache.data) == [summary_cache_key(TRANSCRIPT, 60)]
+    assert events == [{'done': True, 'summary': 'summary', 'cached': True}]
+
+
+def test_summary_requests_use_deterministic_sampling():
+    service = AIService(client=object())
+    assert service.toc_request(TRANSCRIPT, 60)['temperature'] == 0
+    assert service.notes_request(TRANSCRIPT)['temperature'] == 0
+
+
+LONG_TRANSCRIPT = '\n'.join([
+    '[00:00] one two three',
+    '[00:10] four five',
+    '',
+    '[00:20] six seven eight nine',
+    '[01:00:05] ten',
+    '[01:00:15] eleven twelve thirteen fourteen fifteen sixteen',
+    '[01:00:30] seventeen',
+])
+
+
+def word_tokens(monkeypatch):
+    # 按單詞計數（不含時間戳），切分結果不依賴 tokenizer
+    monkeypatch.setattr(ai_service, 'count_tokens', lambda text: len(text.split()) - 1)
+
+
+def test_split_transcript_respects_budget_and_line_boundaries(monkeypatch):
+    word_tokens(monkeypatch)
+    chunks = split_transcript(LONG_TRANSCRIPT, 5)
+    assert chunks == [
+        ('00:00', '00:10', '[00:00] one two three\n[00:10] four five'),
+        ('00:20', '01:00:05', '[00:20] six seven eight nine\n[01:00:05] ten'),
+        # 單行超出預算時獨佔一段，不從行中間切開
+        ('01:00:15', '01:00:15', '[01:00:15] eleven twelve thirteen fourteen fifteen sixteen'),
+        ('01:00:30', '01:00:30', '[01:00:30] seventeen'),
+    ]
+    # 除空行外所有字幕行按順序保留
+    assert '\n'.join(text for _, _, text in chunks) == LONG_TRANSCRIPT.replace('\n\n', '\n')
+
+
+def test_split_transcript_without_timestamps(monkeypatch):
+    word_tokens(monkeypatch)
+    assert split_transcript('plain words here\nmore words', 100) == [('', '', 'plain words here\nmore words')]
+    assert split_transcript('', 100) == []
+
+
+class FakeChunkService(AIService):
+    def __init__(self, fail_index=None):
+        super().__init__(client=object())
+        self.calls = []
+        self.fail_index = fail_index
+
+    def summarize_chunk(self, chunk, index, total):
+        self.calls.append((index, total, chunk[0], chunk[1]))
+        if index == self.fail_index:
+            raise Exception("生成片段摘要失敗")
+        return f'  summary {index}  \n'
+
+
+def test_condense_short_transcript_is_unchanged(monkeypatch):
+    word_tokens(monkeypatch)
+    monkeypatch.setattr(ai_service.Config, 'SUMMARY_CHUNK_TOKENS', 1000)
+    service = FakeChunkService()
+    assert service.condense_transcript(LONG_TRANSCRIPT) == LONG_TRANSCRIPT
+    assert service.calls == []
+
+
+def test_condense_maps_every_chunk_and_keeps_order(monkeypatch):
+    word_tokens(monkeypatch)
+    monkeypatch.setattr(ai_service.Config, 'SUMMARY_CHUNK_TOKENS', 5)
+    service = FakeChunkService()
+    condensed = service.condense_transcript(LONG_TRANSCRIPT)
+    assert sorted(service.calls) == [(0, 4, '00:00', '00:10'), (1, 4, '00:20', '01:00:05'),
+                                     (2, 4, '01:00:15', '01:00:15'), (3, 4, '01:00:30', '01:00:30')]
+    assert condensed == '\n\n'.join([
+        '### 片段 [00:00] - [00:10]\nsummary 0',
+        '### 片段 [00:20] - [01:00:05]\nsummary 1',
+        '### 片段 [01:00:15] - [01:00:15]\nsummary 2',
+        '### 片段 [01:00:30] - [01:00:30]\nsummary 3',
+    ])
+
+
+def test_condense_fails_when_any_chunk_fails(monkeypatch):
+    word_tokens(monkeypatch)
+    monkeypatch.setattr(ai_service.Config, 'SUMMARY_CHUNK_TOKENS', 5)
+    with pytest.raises(Exception, match='片段摘要失敗'):
+        FakeChunkService(fail_index=2).condense_transcript(LONG_TRANSCRIPT)
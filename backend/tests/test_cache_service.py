@@ -0,0 +1,48 @@
+import time
+
+from app.services.cache_service import LRUCache, PersistentCache
+
+
+def test_lru_zero_ttl_does_not_store():
+    cache = LRUCache()
+    cache.set('key', 'old')
+    assert cache.set('key', 'new', ttl=0) == 0
+    assert cache.get('key') is None
+    cache.set('key', 'value', ttl=-5)
+    assert len(cache) == 0
+
+
+def test_lru_none_ttl_never_expires_and_positive_ttl_expires():
+    cache = LRUCache()
+    cache.set('forever', 1, ttl=None)
+    cache.set('short', 2, ttl=0.05)
+    time.sleep(0.06)
+    assert cache.get('forever') == 1
+    assert cache.get('short') is None
+
+
+def test_persistent_zero_ttl_is_no_store(tmp_path):
+    cache = PersistentCache('test', str(tmp_path / 'cache.db'), default_ttl=3600)
+    cache.set('key', {'a': 1})
+    cache.set('key', {'a': 2}, ttl=0)
+    assert cache.get('key') is None
+    # 磁盤上的舊記錄也被刪除，新實例讀不到
+    assert PersistentCache('test', str(tmp_path / 'cache.db')).get('key') is None
+    assert cache.stats()['writes'] == 1
+
+
+def test_persistent_zero_default_ttl_disables_cache(tmp_path):
+    cache = PersistentCache('test', str(tmp_path / 'cache.db'), default_ttl=0)
+    cache.set('key', 'value')
+    assert cache.get('key') is None
+    # 顯式 ttl 仍然生效
+    cache.set('key', 'value', ttl=60)
+    assert cache.get('key') == 'value'
+
+
+def test_persistent_none_default_ttl_never_expires(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    PersistentCache('test', path, default_ttl=None).set('key', 'value')
+    row = PersistentCache('test', path)._connect().execute(
+        'SELECT expires_at FROM "test" WHERE key = ?', ('key',)).fetchone()
+    assert row == (None,)
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+
+from app.services import extraction_service, youtube_service
+from app.services.extraction_service import ExtractionContext, best_thumbnail
+
+
+def test_thumbnail_derived_from_thumbnails_only_payload(monkeypatch):
+    info = {
+        'title': 'clip',
+        'duration': 12,
+        'thumbnails': [
+            {'url': 'https://pbs.twimg.com/small.jpg', 'width': 320, 'height': 180},
+            {'url': 'https://pbs.twimg.com/large.jpg', 'width': 1280, 'height': 720},
+            {'url': 'https://pbs.twimg.com/medium.jpg', 'width': 640, 'height': 360},
+        ],
+    }
+    context = ExtractionContext('x', '123', 'https://x.com/user/status/123', info)
+    monkeypatch.setattr(youtube_service, 'get_extraction', lambda target: context)
+    monkeypatch.setattr(youtube_service.metadata_cache, 'set', lambda *args, **kwargs: None)
+
+    result = youtube_service._fetch_video_info('x', '123', 'https://x.com/user/status/123')
+    assert result['thumbnail'] == 'https://pbs.twimg.com/large.jpg'
+
+
+def test_best_thumbnail_prefers_thumbnail_field_and_preference():
+    assert best_thumbnail({'thumbnail': 'a', 'thumbnails': [{'url': 'b'}]}) == 'a'
+    assert best_thumbnail({'thumbnails': [{'url': 'b', 'preference': 1, 'width': 10},
+                                          {'url': 'c', 'width': 1000}]}) == 'b'
+    assert best_thumbnail({'thumbnails': []}) is None
+
+
+class FakeYoutubeDL:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract_info(self, url, download=True, ie_key=None, process=True):
+        self.calls.append((url, ie_key))
+        return self.results[url]
+
+
+def test_url_and_playlist_results_are_resolved(monkeypatch):
+    ydl = FakeYoutubeDL({
+        'https://x.com/user/status/123': {
+            '_type': 'url_transparent', 'url': 'https://x.com/i/broadcast/1', 'ie_key': 'Twitter',
+            'title': 'outer title', 'description': None,
+        },
+        'https://x.com/i/broadcast/1': {
+            '_type': 'playlist', 'entries': [{'id': 'v1', 'title': 'inner', 'description': 'text'}],
+        },
+    })
+
+    @contextmanager
+    def checkout(profile):
+        yield ydl
+
+    monkeypatch.setattr(extraction_service.ydl_pool, 'checkout', checkout)
+    context = extraction_service._extract('x', '123', 'https://x.com/user/status/123')
+    assert context.info['id'] == 'v1'
+    assert context.info['description'] == 'text'
+    assert ydl.calls[1] == ('https://x.com/i/broadcast/1', 'Twitter')
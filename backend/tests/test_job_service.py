@@ -0,0 +1,56 @@
+import pytest
+
+from app import app, routes
+from app.services.job_service import QUEUED, DownloadJobManager, QueueFullError
+from app.services.state_backend import MemoryBackend, SQLiteBackend
+
+
+def make_manager(backend, tmp_path, max_queue=2):
+    # workers=0：不啟動工作線程，任務停留在隊列中
+    return DownloadJobManager(None, backend, workers=0, max_queue=max_queue,
+                              scratch_dir=str(tmp_path), retention=3600)
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+def test_submit_rejects_when_queue_is_full(tmp_path, kind):
+    backend = MemoryBackend() if kind == 'memory' else SQLiteBackend(str(tmp_path / 'state.db'))
+    manager = make_manager(backend, tmp_path)
+    jobs = [manager.submit(f'https://youtu.be/video{i}') for i in range(2)]
+    assert all(job.status == QUEUED for job in jobs)
+
+    with pytest.raises(QueueFullError) as excinfo:
+        manager.submit('https://youtu.be/video2')
+    # 沒有歷史時長時按每個任務 60 秒、兩個任務排在一個工作線程前估算
+    assert excinfo.value.retry_after == 120
+    assert manager.queue_depth() == 2
+
+
+def test_retry_after_follows_average_duration(tmp_path):
+    manager = DownloadJobManager(None, MemoryBackend(), workers=2, max_queue=10,
+                                 scratch_dir=str(tmp_path), retention=3600)
+    manager._durations = [10, 30]
+    assert manager.retry_after() == 20
+    for i in range(4):
+        manager.backend.enqueue(manager.QUEUE, f'job{i}')
+    assert manager.retry_after() == 40
+
+
+def test_submit_accepts_again_after_queue_drains(tmp_path):
+    manager = make_manager(MemoryBackend(), tmp_path, max_queue=1)
+    job = manager.submit('https://youtu.be/video0')
+    with pytest.raises(QueueFullError):
+        manager.submit('https://youtu.be/video1')
+    manager.backend.remove(manager.QUEUE, job.id)
+    assert manager.submit('https://youtu.be/video1').status == QUEUED
+
+
+def test_download_route_returns_429_with_retry_after(tmp_path, monkeypatch):
+    manager = make_manager(MemoryBackend(), tmp_path, max_queue=1)
+    monkeypatch.setattr(routes, 'download_jobs', manager)
+    client = app.test_client()
+
+    assert client.post('/api/video/download/jobs', json={'url': 'https://youtu.be/video0'}).status_code == 202
+    response = client.post('/api/video/download/jobs', json={'url': 'https://youtu.be/video1'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
+    assert response.get_json()['retry_after'] == 60
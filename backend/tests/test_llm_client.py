@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+openai = pytest.importorskip('openai')
+httpx = pytest.importorskip('httpx')
+
+from app.services import llm_client
+from app.services.llm_client import CircuitBreaker, CircuitOpenError, LLMClient, retry_after_seconds
+
+
+def api_error(cls, status, headers=None):
+    request = httpx.Request('POST', 'http://stub/v1/chat/completions')
+    return cls('error', response=httpx.Response(status, headers=headers or {}, request=request), body=None)
+
+
+class FakeCompletions:
+    """按順序返回或拋出預設結果的 chat.completions"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def create(self, **request):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class FakeOpenAI:
+    def __init__(self, outcomes):
+        self.completions = FakeCompletions(outcomes)
+        self.chat = self
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(llm_client.time, 'sleep', delays.append)
+    return delays
+
+
+def make_client(outcomes, **options):
+    client = LLMClient('test', **dict({'max_retries': 3, 'breaker_threshold': 3}, **options))
+    client.client = FakeOpenAI(outcomes)
+    return client
+
+
+def test_server_errors_are_retried_with_backoff(sleeps):
+    client = make_client([api_error(openai.InternalServerError, 500)] * 2 + ['ok'],
+                         backoff_base=1.0, backoff_max=30.0)
+    assert client.create(model='m', messages=[]) == 'ok'
+    assert client.client.completions.calls == 3
+    # 帶抖動的指數退避：第 n 次重試等待 [base * 2^n / 2, base * 2^n]
+    assert 0.5 <= sleeps[0] <= 1.0
+    assert 1.0 <= sleeps[1] <= 2.0
+    assert client.stats()['in_flight'] == 0
+
+
+def test_backoff_is_capped(sleeps):
+    client = make_client([], backoff_base=1.0, backoff_max=5.0)
+    assert all(2.5 <= client._backoff(10, Exception()) <= 5.0 for _ in range(20))
+
+
+def test_retry_after_header_is_respected(sleeps):
+    client = make_client([api_error(openai.RateLimitError, 429, {'retry-after': '3'}),
+                          api_error(openai.RateLimitError, 429, {'retry-after-ms': '250'}),
+                          'ok'])
+    assert client.create(model='m', messages=[]) == 'ok'
+    assert sleeps == [3.0, 0.25]
+
+
+def test_retry_after_is_capped_at_backoff_max():
+    error = api_error(openai.RateLimitError, 429, {'retry-after': '600'})
+    assert retry_after_seconds(error) == 600
+    assert make_client([], backoff_max=30.0)._backoff(0, error) == 30.0
+
+
+def test_gives_up_after_max_retries(sleeps):
+    timeout = openai.APITimeoutError(request=httpx.Request('POST', 'http://stub'))
+    client = make_client([timeout] * 3, max_retries=2, breaker_threshold=100)
+    with pytest.raises(openai.APITimeoutError):
+        client.create(model='m', messages=[])
+    assert client.client.completions.calls == 3
+    assert len(sleeps) == 2
+    assert client.stats()['in_flight'] == 0
+
+
+def test_non_retryable_errors_are_raised_immediately(sleeps):
+    client = make_client([api_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        client.create(model='m', messages=[])
+    assert client.client.completions.calls == 1
+    assert sleeps == []
+    assert client.breaker.state == 'closed'
+
+
+def test_breaker_opens_after_consecutive_failures(sleeps):
+    client = make_client([api_error(openai.InternalServerError, 500)] * 3,
+                         max_retries=2, breaker_threshold=3, breaker_cooldown=30)
+    with pytest.raises(openai.InternalServerError):
+        client.create(model='m', messages=[])
+    assert client.client.completions.calls == 3
+    assert client.breaker.state == 'open'
+    # 熔斷期間不再請求上游
+    with pytest.raises(CircuitOpenError) as excinfo:
+        client.create(model='m', messages=[])
+    assert excinfo.value.retry_after == 30
+    assert client.client.completions.calls == 3
+    assert client.stats()['in_flight'] == 0
+
+
+def test_rate_limits_do_not_open_breaker(sleeps):
+    client = make_client([api_error(openai.RateLimitError, 429)] * 4 + ['ok'],
+                         max_retries=4, breaker_threshold=2)
+    assert client.create(model='m', messages=[]) == 'ok'
+    assert client.breaker.state == 'closed'
+
+
+def test_half_open_breaker_allows_one_probe():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    breaker.before_request()
+    # 試探請求進行中時其他請求仍被拒絕
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_request()
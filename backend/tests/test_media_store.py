@@ -0,0 +1,43 @@
+import os
+
+from app.services.media_store import MediaStore
+
+
+def store_file(store, tmp_path, key, size):
+    src = tmp_path / f'{key}.src'
+    src.write_bytes(b'x' * size)
+    return store.commit(key, str(src), f'{key}.mp4')
+
+
+def test_pin_from_another_process_prevents_eviction(tmp_path):
+    root = str(tmp_path / 'media')
+    worker_a, worker_b = MediaStore(root, max_bytes=150), MediaStore(root, max_bytes=150)
+    first = store_file(worker_a, tmp_path, 'aa01', 100)
+    token = worker_b.pin('aa01')
+    assert worker_a.stats()['pinned'] == 1
+
+    store_file(worker_a, tmp_path, 'bb02', 100)
+    store_file(worker_a, tmp_path, 'cc03', 10)
+    assert os.path.exists(first['path'])
+    assert worker_a.lookup('bb02') is None
+
+    worker_b.unpin(token)
+    assert worker_a.stats()['pinned'] == 0
+    store_file(worker_a, tmp_path, 'dd04', 100)
+    assert not os.path.exists(first['path'])
+
+
+def test_commit_keeps_object_larger_than_budget(tmp_path):
+    store = MediaStore(str(tmp_path / 'media'), max_bytes=50)
+    entry = store_file(store, tmp_path, 'aa01', 100)
+    assert entry['filename'] == 'aa01.mp4'
+    assert os.path.exists(entry['path'])
+
+
+def test_commit_keeps_new_object_when_pins_fill_budget(tmp_path):
+    store = MediaStore(str(tmp_path / 'media'), max_bytes=150)
+    first = store_file(store, tmp_path, 'aa01', 100)
+    store.pin('aa01')
+    second = store_file(store, tmp_path, 'bb02', 100)
+    assert os.path.exists(first['path'])
+    assert os.path.exists(second['path'])
@@ -0,0 +1,27 @@
+from app.services.prefetch_service import TRANSCRIPT, PrefetchScheduler
+
+INFO = {'platform': 'youtube', 'video_id': 'abc', 'duration': 60}
+
+
+def make_scheduler(enabled):
+    scheduler = PrefetchScheduler(enabled=enabled, summary=False, workers=1, max_queue=10,
+                                  ttl=60, yield_threshold=4)
+    scheduler.scheduled = []
+    scheduler.schedule = lambda op, url, platform, video_id, duration=0: \
+        scheduler.scheduled.append((op, platform, video_id))
+    return scheduler
+
+
+def test_client_flag_cannot_enable_prefetch():
+    scheduler = make_scheduler(enabled=False)
+    scheduler.after_video_info('https://youtu.be/abc', INFO, True)
+    scheduler.after_video_info('https://youtu.be/abc', INFO)
+    assert scheduler.scheduled == []
+
+
+def test_client_flag_can_disable_prefetch():
+    scheduler = make_scheduler(enabled=True)
+    scheduler.after_video_info('https://youtu.be/abc', INFO, False)
+    assert scheduler.scheduled == []
+    scheduler.after_video_info('https://youtu.be/abc', INFO, True)
+    assert scheduler.scheduled == [(TRANSCRIPT, 'youtube', 'abc')]
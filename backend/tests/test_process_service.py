@@ -0,0 +1,43 @@
+import pytest
+
+from app.services import process_service
+from app.services.job_service import DONE, ERROR
+from app.services.process_service import SKIPPED, ProcessJobManager
+from app.services.state_backend import MemoryBackend
+from app.services.youtube_service import NO_TRANSCRIPT
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+INFO = {'title': 'video', 'duration': 60}
+
+
+@pytest.fixture
+def manager():
+    return ProcessJobManager(MemoryBackend(), workers=1, max_queue=5, retention=3600)
+
+
+def run_job(manager, monkeypatch, transcript):
+    monkeypatch.setattr(process_service, 'get_video_info', lambda url: INFO)
+    monkeypatch.setattr(process_service, 'get_video_transcript', lambda url: transcript)
+    job = manager.submit(URL)
+    assert job.wait(10)
+    return job.to_dict()
+
+
+def test_video_without_subtitles_finishes_done(manager, monkeypatch):
+    data = run_job(manager, monkeypatch, NO_TRANSCRIPT)
+    assert data['status'] == DONE
+    assert data['info'] == INFO
+    assert 'error' not in data
+    assert data['stages']['info']['status'] == DONE
+    assert data['stages']['transcript']['status'] == SKIPPED
+    assert data['stages']['transcript']['reason'] == NO_TRANSCRIPT
+    assert data['stages']['summary']['status'] == SKIPPED
+    assert data['stages']['summary']['reason']
+
+
+def test_transcript_fetch_failure_is_still_an_error(manager, monkeypatch):
+    data = run_job(manager, monkeypatch, '無法獲取字幕')
+    assert data['status'] == ERROR
+    assert data['error'] == '無法獲取字幕'
+    assert data['stages']['transcript']['status'] == ERROR
+    assert data['stages']['summary']['status'] == SKIPPED
@@ -0,0 +1,53 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('yt_dlp')
+
+from app.services.segmented_download import fetch_segmented
+
+PAYLOAD = bytes(range(256)) * 400
+
+
+@pytest.fixture
+def range_server():
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            start, _, end = self.headers['Range'][len('bytes='):].partition('-')
+            start, end = int(start), min(int(end), len(PAYLOAD) - 1)
+            requested.append((start, end))
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/media', requested
+    server.shutdown()
+
+
+def test_requests_are_capped_at_chunk_size(range_server, tmp_path):
+    url, requested = range_server
+    path = str(tmp_path / 'media.bin')
+    size = fetch_segmented(url, path, connections=2, min_segment=1024, chunk_size=10000)
+
+    assert size == len(PAYLOAD)
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    # 除探測請求外每次請求都不超過 chunk_size
+    assert max(end - start + 1 for start, end in requested) == 10000
+    # 探測請求，加上兩個 51200 字節的分段各拆成 6 次請求
+    assert len(requested) == 1 + 2 * 6
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from app.services.ai_service import AIService
+from app.services.singleflight import SingleFlight, inflight
+
+
+def test_do_shares_result_between_concurrent_callers():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == ['result', 'result']
+    assert len(calls) == 1
+
+
+def test_do_follower_reruns_abandoned_call():
+    flight = SingleFlight()
+    call, leader = flight.begin('key')
+    assert leader
+
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flight.do('key', lambda: 'rerun')))
+    follower.start()
+    time.sleep(0.05)
+    flight.abandon('key', call)
+    follower.join(5)
+    assert results == ['rerun']
+    assert flight.stats()['abandoned'] == 1
+
+
+class SlowSummaryService(AIService):
+    """不訪問上游，逐段產出固定內容的摘要服務"""
+
+    def __init__(self):
+        super().__init__(client=object())
+        self.runs = 0
+
+    def _stream_sections(self, transcript, duration):
+        self.runs += 1
+        for delta in ('first ', 'second'):
+            time.sleep(0.05)
+            yield {'section': 'notes', 'delta': delta}
+        return 'first second', None
+
+
+def test_stream_summary_follower_takes_over_when_leader_disconnects():
+    service = SlowSummaryService()
+    transcript = '[00:00] a transcript that only this test uses'
+
+    leader = service.stream_summary(transcript, 10, use_cache=False)
+    assert next(leader) == {'section': 'notes', 'delta': 'first '}
+
+    events = []
+    follower = threading.Thread(
+        target=lambda: events.extend(service.stream_summary(transcript, 10, use_cache=False))
+    )
+    follower.start()
+    time.sleep(0.05)
+    leader.close()
+    follower.join(5)
+
+    assert events[-1] == {'done': True, 'summary': 'first second', 'cached': False}
+    assert not any('error' in event for event in events)
+    assert service.runs == 2
+    assert inflight.stats()['in_flight'] == 0
@@ -0,0 +1,106 @@
+import time
+from threading import Thread
+
+from app.services import state_backend as module
+from app.services.job_service import DONE, RUNNING, DownloadJob, DownloadJobManager
+from app.services.state_backend import MemoryBackend, SQLiteBackend
+
+
+def publish_later(backend, channel, states, delay=0.1):
+    def run():
+        for state, terminal in states:
+            time.sleep(delay)
+            backend.publish(channel, state, terminal)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_sqlite_subscriber_wakes_on_local_publish(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'CHANNEL_FALLBACK_INTERVAL', 30)
+    backend = SQLiteBackend(str(tmp_path / 'state.db'))
+    backend.publish('job', {'progress': 0})
+    publish_later(backend, 'job', [({'progress': 50}, False), ({'progress': 100}, True)])
+
+    started = time.monotonic()
+    states = list(backend.channel('job').subscribe(keepalive=30))
+    assert states == [{'progress': 0}, {'progress': 50}, {'progress': 100}]
+    assert time.monotonic() - started < 5
+
+
+def test_sqlite_subscriber_wakes_on_other_process_publish(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'CHANNEL_FALLBACK_INTERVAL', 30)
+    path = str(tmp_path / 'state.db')
+    subscriber, publisher = SQLiteBackend(path), SQLiteBackend(path)
+    publisher.publish('job', {'progress': 0})
+    publish_later(publisher, 'job', [({'progress': 50}, False), ({'progress': 100}, True)])
+
+    started = time.monotonic()
+    states = list(subscriber.channel('job').subscribe(keepalive=30))
+    assert states == [{'progress': 0}, {'progress': 50}, {'progress': 100}]
+    # 由監視線程的 data_version 檢查喚醒，而不是等兜底間隔
+    assert time.monotonic() - started < 5
+
+
+def test_sqlite_watcher_wakes_only_on_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'CHANNEL_FALLBACK_INTERVAL', 30)
+    path = str(tmp_path / 'state.db')
+    subscriber, publisher = SQLiteBackend(path), SQLiteBackend(path)
+    publisher.publish('job', {'progress': 0})
+    with subscriber.watch_channel('job') as wait:
+        started = time.monotonic()
+        wait(1, 0.5)
+        assert time.monotonic() - started >= 0.4
+        publish_later(publisher, 'job', [({'progress': 100}, True)], delay=0.05)
+        wait(1, 10)
+        assert subscriber._versions['job'] == 2
+    assert subscriber._watched == {}
+
+
+def test_sqlite_subscriber_does_not_reread_without_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'CHANNEL_FALLBACK_INTERVAL', 30)
+    backend = SQLiteBackend(str(tmp_path / 'state.db'))
+    backend.publish('job', {'progress': 0})
+    reads = []
+    read_channel = backend.read_channel
+    monkeypatch.setattr(backend, 'read_channel', lambda name: reads.append(name) or read_channel(name))
+
+    states = backend.channel('job').subscribe(keepalive=1)
+    assert next(states) == {'progress': 0}
+    assert next(states) is None
+    # 產出狀態後一次、保活超時後一次，等待期間不輪詢
+    assert len(reads) == 3
+
+
+def test_update_record_only_changes_given_fields(tmp_path):
+    for backend in (MemoryBackend(), SQLiteBackend(str(tmp_path / 'state.db'))):
+        backend.save_record('download', 'a', {'status': 'running', 'cancel_requested': False})
+        assert backend.update_record('download', 'a', {'cancel_requested': True},
+                                     expected={'status': ['queued', 'running']})
+        assert backend.load_record('download', 'a') == {'status': 'running', 'cancel_requested': True}
+        assert not backend.update_record('download', 'missing', {'cancel_requested': True})
+
+
+def test_cancel_does_not_overwrite_finished_job(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'state.db'))
+    manager = DownloadJobManager(None, backend, workers=0, max_queue=10,
+                                 scratch_dir=str(tmp_path), retention=3600)
+    job = DownloadJob(backend, 'https://example.com/video', 0, str(tmp_path))
+    job.status = RUNNING
+    job.save()
+    # 取消請求讀到運行中的快照之後，任務在其他進程中完成
+    stale = DownloadJob.from_record(backend, backend.load_record(DownloadJob.KIND, job.id))
+    job.status = DONE
+    job.result = {'filename': 'video.mp4'}
+    job.save()
+    snapshots = iter([stale])
+    manager.get = lambda job_id: next(snapshots, None) or \
+        DownloadJob.from_record(backend, backend.load_record(DownloadJob.KIND, job_id))
+
+    cancelled = manager.cancel(job.id)
+    record = backend.load_record(DownloadJob.KIND, job.id)
+    assert record['status'] == DONE
+    assert record['result'] == {'filename': 'video.mp4'}
+    assert not record['cancel_requested']
+    assert cancelled.status == DONE
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from app import app
+from app.services import stream_service
+from app.services.stream_service import PassthroughStream
+
+
+class FakeResponse:
+    def __init__(self, chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.closed = False
+
+    def read(self, size):
+        if self.chunks:
+            return self.chunks.pop(0)
+        if self.error:
+            raise self.error
+        return b''
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def committed(monkeypatch):
+    commits = []
+    monkeypatch.setattr(stream_service.ydl_pool, 'release', lambda pooled: None)
+    monkeypatch.setattr(stream_service.media_store, 'commit',
+                        lambda key, path, filename: commits.append((key, open(path, 'rb').read())))
+    return commits
+
+
+def make_stream(tmp_path, chunks, content_length=None, filesize=None, chunked=False, error=None):
+    """跳過上游解析，直接用給定的響應構造直通流"""
+    stream = object.__new__(PassthroughStream)
+    stream.media_key = 'key'
+    stream.filename = 'video.mp4'
+    stream._pooled = None
+    stream._response = FakeResponse(chunks, error)
+    stream.content_length = content_length
+    stream.expected_size = content_length or filesize
+    stream._chunked = chunked
+    stream._finished = False
+    stream._tee_path = str(tmp_path / 'key.part')
+    stream._tee_file = open(stream._tee_path, 'wb')
+    return stream
+
+
+def test_complete_transfer_is_committed(tmp_path, committed):
+    stream = make_stream(tmp_path, [b'ab', b'cd'], content_length=4)
+    assert b''.join(stream) == b'abcd'
+    assert committed == [('key', b'abcd')]
+    assert stream._response.closed
+
+
+def test_short_transfer_is_discarded(tmp_path, committed):
+    stream = make_stream(tmp_path, [b'ab'], content_length=4)
+    list(stream)
+    assert committed == []
+    assert not os.path.exists(stream._tee_path)
+
+
+def test_unknown_length_is_checked_against_format_filesize(tmp_path, committed):
+    list(make_stream(tmp_path, [b'ab'], filesize=4))
+    assert committed == []
+    list(make_stream(tmp_path, [b'ab', b'cd'], filesize=4))
+    assert committed == [('key', b'abcd')]
+
+
+def test_connection_delimited_body_is_not_committed(tmp_path, committed):
+    # 沒有長度也不是分塊傳輸時無法區分正常結束和上游中斷
+    stream = make_stream(tmp_path, [b'ab', b'cd'])
+    assert b''.join(stream) == b'abcd'
+    assert committed == []
+    assert not os.path.exists(stream._tee_path)
+
+
+def test_chunked_body_that_ends_cleanly_is_committed(tmp_path, committed):
+    list(make_stream(tmp_path, [b'ab', b'cd'], chunked=True))
+    assert committed == [('key', b'abcd')]
+
+
+def test_upstream_error_is_discarded(tmp_path, committed):
+    stream = make_stream(tmp_path, [b'ab'], chunked=True, error=ConnectionResetError())
+    with pytest.raises(ConnectionResetError):
+        list(stream)
+    assert committed == []
+
+
+def test_client_disconnect_is_discarded(tmp_path, committed):
+    stream = make_stream(tmp_path, [b'ab', b'cd'], content_length=4, chunked=True)
+    chunks = iter(stream)
+    next(chunks)
+    chunks.close()
+    stream.close()
+    assert committed == []
+    assert not os.path.exists(stream._tee_path)
+
+
+@pytest.mark.parametrize('url', ['https://example.com/video', 'https://www.youtube.com/watch'])
+def test_invalid_stream_url_is_bad_request(url):
+    response = app.test_client().get('/api/video/download/stream', query_string={'url': url})
+    assert response.status_code == 400
+    assert response.get_json()['error']
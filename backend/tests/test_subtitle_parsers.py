@@ -0,0 +1,224 @@
+import json
+import re
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from app.services.subtitle_parsers import parse_json3, parse_srv3, parse_vtt
+
+
+# 改為流式解析之前的整體解析實現，作為對照
+def _text(raw):
+    return ' '.join(raw.split())
+
+
+def reference_json3(data):
+    for event in json.loads(data).get('events') or ():
+        segs = event.get('segs')
+        if not segs:
+            continue
+        text = _text(''.join(seg.get('utf8', '') for seg in segs))
+        if text:
+            yield event.get('tStartMs', 0), event.get('dDurationMs', 0), text
+
+
+def reference_srv3(data):
+    root = ElementTree.fromstring(data.encode('utf-8'))
+    body = root.find('body')
+    for p in (body if body is not None else root).iter('p'):
+        text = _text(''.join(p.itertext()))
+        if text:
+            yield int(p.get('t', 0)), int(p.get('d', 0)), text
+
+
+VTT_TIMING = re.compile(
+    r'^(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})\s+-->\s+(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})'
+)
+VTT_TAG = re.compile(r'<[^>]*>')
+
+
+def _vtt_ms(hours, minutes, seconds, millis):
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def reference_vtt(data):
+    last_line = None
+    start = end = None
+    lines = []
+
+    def flush():
+        nonlocal last_line
+        new_lines = []
+        for line in lines:
+            text = _text(VTT_TAG.sub('', line))
+            if text and text != last_line:
+                new_lines.append(text)
+                last_line = text
+        if new_lines:
+            return start, end - start, ' '.join(new_lines)
+        return None
+
+    for raw in data.splitlines():
+        line = raw.strip()
+        match = VTT_TIMING.match(line)
+        if match:
+            if start is not None:
+                segment = flush()
+                if segment:
+                    yield segment
+            groups = match.groups()
+            start = _vtt_ms(*groups[:4])
+            end = _vtt_ms(*groups[4:])
+            lines = []
+        elif not raw:
+            if start is not None:
+                segment = flush()
+                if segment:
+                    yield segment
+            start = None
+            lines = []
+        elif start is not None:
+            lines.append(line)
+
+    if start is not None:
+        segment = flush()
+        if segment:
+            yield segment
+
+
+JSON3 = json.dumps({
+    'wireMagic': 'pb3',
+    'pens': [{}],
+    'events': [
+        {'tStartMs': 0, 'dDurationMs': 5000, 'id': 1, 'wWinId': 1},
+        {'tStartMs': 120, 'dDurationMs': 2880, 'wWinId': 1,
+         'segs': [{'utf8': 'welcome'}, {'utf8': ' back', 'tOffsetMs': 400}, {'utf8': ' everyone'}]},
+        {'tStartMs': 3000, 'dDurationMs': 10, 'aAppend': 1, 'segs': [{'utf8': '\n'}]},
+        {'tStartMs': 3010, 'dDurationMs': 2990, 'segs': [{'utf8': '今天'}, {'utf8': '討論緩存 "設計" 和 [括號]'}]},
+        {'tStartMs': 6000, 'segs': [{'utf8': 'no duration'}]},
+        {'dDurationMs': 100, 'segs': [{'utf8': '  spaced\tout  '}]},
+    ],
+}, ensure_ascii=False, indent=1)
+
+SRV3 = '''<?xml version="1.0" encoding="utf-8" ?>
+<timedtext format="3">
+<head><ws id="0"/><wp id="0"/></head>
+<body>
+<p t="0" d="2500" w="1"><s ac="0">hello</s><s t="400" ac="0"> world</s></p>
+<p t="2500" d="10" w="1" a="1">
+</p>
+<p t="2510" d="3000"><s>我們</s><s>今天</s> &amp; more</p>
+<p t="6000">plain text &lt;not a tag&gt;</p>
+</body>
+</timedtext>
+'''
+
+# YouTube 自動字幕：首個 cue 以單個空格行佔位，後續 cue 重複上一行
+VTT = '''WEBVTT
+Kind: captions
+Language: en
+
+00:00:00.000 --> 00:00:02.500 align:start position:0%
+\x20
+welcome<00:00:00.480><c> back</c>
+
+00:00:02.500 --> 00:00:02.510 align:start position:0%
+welcome back
+
+
+00:00:02.510 --> 00:00:05.000 align:start position:0%
+welcome back
+to<00:00:03.000><c> the</c><c> show</c>
+
+NOTE a comment block
+
+cue-id
+01:02:03,004 --> 01:02:05,000
+第一行
+第二行
+'''
+
+FIXTURES = [
+    (parse_json3, reference_json3, JSON3),
+    (parse_srv3, reference_srv3, SRV3),
+    (parse_vtt, reference_vtt, VTT),
+]
+
+
+class TrickleStream:
+    """每次最多返回幾個字節的響應對象，讓事件、多字節字符和換行跨越讀取塊邊界"""
+
+    def __init__(self, data, size=5):
+        self.data = data
+        self.size = size
+        self.offset = 0
+
+    def read(self, size=-1):
+        chunk = self.data[self.offset:self.offset + self.size]
+        self.offset += len(chunk)
+        return chunk
+
+
+@pytest.mark.parametrize('parser, reference, text', FIXTURES)
+def test_matches_previous_implementation(parser, reference, text):
+    expected = list(reference(text))
+    assert expected
+    assert list(parser(text)) == expected
+    assert list(parser(text.encode('utf-8'))) == expected
+    for size in (1, 5, 64):
+        assert list(parser(TrickleStream(text.encode('utf-8'), size))) == expected
+
+
+def test_vtt_crlf_matches_previous_implementation():
+    text = VTT.replace('\n', '\r\n')
+    assert list(parse_vtt(TrickleStream(text.encode('utf-8'), 3))) == list(reference_vtt(text))
+
+
+def test_fixtures_parse_as_expected():
+    assert list(parse_json3(JSON3))[:2] == [(120, 2880, 'welcome back everyone'),
+                                            (3010, 2990, '今天討論緩存 "設計" 和 [括號]')]
+    assert list(parse_srv3(SRV3))[1] == (2510, 3000, '我們今天 & more')
+    assert list(parse_vtt(VTT)) == [(0, 2500, 'welcome back'),
+                                    (2510, 2490, 'to the show'),
+                                    (3723004, 1996, '第一行 第二行')]
+
+
+def test_json3_without_events_is_empty():
+    assert list(parse_json3('{"wireMagic": "pb3"}')) == []
+    assert list(parse_json3('{"events": []}')) == []
+    assert list(parse_json3(b'')) == []
+
+
+def test_json3_truncated_inside_event_raises():
+    truncated = JSON3[:JSON3.index('everyone')]
+    with pytest.raises(ValueError):
+        list(parse_json3(TrickleStream(truncated.encode('utf-8'))))
+
+
+def test_json3_truncated_between_events_keeps_parsed_events():
+    # 流式解析在事件邊界截斷時保留已解析的事件
+    truncated = JSON3[:JSON3.index('"tStartMs": 3000')]
+    truncated = truncated[:truncated.rindex('}') + 1]
+    assert list(parse_json3(truncated)) == [(120, 2880, 'welcome back everyone')]
+
+
+def test_srv3_malformed_raises():
+    with pytest.raises(ElementTree.ParseError):
+        list(parse_srv3('<timedtext><body><p t="0">unclosed</body></timedtext>'))
+    with pytest.raises(ElementTree.ParseError):
+        list(parse_srv3(b''))
+
+
+def test_srv3_bad_timestamp_raises():
+    with pytest.raises(ValueError):
+        list(parse_srv3('<timedtext><body><p t="soon">text</p></body></timedtext>'))
+
+
+def test_vtt_garbage_is_ignored():
+    assert list(parse_vtt('not a subtitle file\n\n12:34 -> nonsense\ntext\n')) == []
+    assert list(parse_vtt(b'')) == []
+
+
+def test_invalid_utf8_is_replaced():
+    data = VTT.encode('utf-8').replace('第一行'.encode('utf-8'), b'\xff\xfe')
+    assert list(parse_vtt(TrickleStream(data, 1)))[-1] == (3723004, 1996, '�� 第二行')
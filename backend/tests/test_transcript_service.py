@@ -0,0 +1,48 @@
+from app.services.transcript_service import _strip_overlap, clean_caption_text, clean_segments
+
+
+def test_exact_repeat_is_dropped():
+    assert _strip_overlap('the answer is no', 'the answer is no') == ''
+
+
+def test_short_line_contained_in_previous_is_kept():
+    assert _strip_overlap('the answer is no', 'no') == 'no'
+    assert _strip_overlap('a long sentence', 'a') == 'a'
+
+
+def test_single_word_overlap_is_kept():
+    assert _strip_overlap('we went to the park', 'park rangers were there') == 'park rangers were there'
+
+
+def test_character_overlap_not_applied_to_spaced_text():
+    assert _strip_overlap('you should go over there', 'here is the thing') == 'here is the thing'
+
+
+def test_multi_word_overlap_is_stripped():
+    assert _strip_overlap('today we talk about', 'talk about the design') == 'the design'
+    assert _strip_overlap('today we talk', 'today we talk about caching') == 'about caching'
+
+
+def test_cjk_character_overlap_is_stripped():
+    assert _strip_overlap('我們今天討論', '今天討論緩存設計') == '緩存設計'
+
+
+def test_short_cjk_overlap_is_kept():
+    assert _strip_overlap('這是一個問題', '問題在於') == '問題在於'
+
+
+def test_clean_segments_keeps_short_answers():
+    segments = [(0, 'is the answer yes or no'), (2, 'no'), (4, 'no')]
+    assert clean_segments(segments) == [(0, 'is the answer yes or no'), (2, 'no')]
+
+
+def test_caption_cues_are_removed():
+    assert clean_caption_text('[Music] welcome back (Applause)') == 'welcome back'
+    assert clean_caption_text('[ 音樂 ] 大家好（笑）') == '大家好'
+    assert clean_caption_text('♪ la la la ♪ thanks ♫♫') == 'thanks'
+
+
+def test_ordinary_parentheticals_are_kept():
+    assert clean_caption_text('as shown (see figure 2) in the paper (2019)') == \
+        'as shown (see figure 2) in the paper (2019)'
+    assert clean_caption_text('the list [1] and [citation needed]') == 'the list [1] and [citation needed]'
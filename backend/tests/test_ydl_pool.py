@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('yt_dlp')
+
+from app.services.ydl_pool import YoutubeDLPool  # noqa: E402
+
+
+def make_info():
+    formats = [
+        {'format_id': 'a1', 'url': 'https://example.com/a1.m4a', 'ext': 'm4a',
+         'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 64},
+        {'format_id': 'a2', 'url': 'https://example.com/a2.m4a', 'ext': 'm4a',
+         'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128},
+    ]
+    return {
+        'id': 'video', 'title': 'video', 'extractor': 'generic', 'extractor_key': 'Generic',
+        'webpage_url': 'https://example.com/video', 'formats': formats,
+    }
+
+
+@pytest.fixture
+def pool():
+    pool = YoutubeDLPool(max_idle=1)
+    pool.register('audio', {'format': 'bestaudio', 'quiet': True, 'no_warnings': True})
+    yield pool
+    pool.close()
+
+
+def selected_format(ydl):
+    return ydl.process_ie_result(make_info(), download=False)['format_id']
+
+
+def test_format_override_changes_selection(pool):
+    with pool.checkout('audio', format='a1') as ydl:
+        assert selected_format(ydl) == 'a1'
+
+
+def test_format_restored_after_checkout(pool):
+    with pool.checkout('audio', format='a1'):
+        pass
+    with pool.checkout('audio') as ydl:
+        assert selected_format(ydl) == 'a2'
+    assert pool.stats()['reused'] == 1
+
+
+def test_outtmpl_override_restored(pool):
+    info = {'id': 'x', 'title': 't', 'ext': 'mp4'}
+    with pool.checkout('audio', outtmpl='/tmp/out/%(title)s.%(ext)s') as ydl:
+        assert ydl.prepare_filename(info) == '/tmp/out/t.mp4'
+    with pool.checkout('audio') as ydl:
+        assert ydl.prepare_filename(info) != '/tmp/out/t.mp4'
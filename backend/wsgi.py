@@ -0,0 +1,9 @@
+"""WSGI 入口，供 gunicorn 等生產服務器加載：
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()
+
+__all__ = ['app']
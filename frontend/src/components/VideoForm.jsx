@@ -3,6 +3,17 @@ import axios from 'axios';
 import './VideoForm.css';
 import ReactMarkdown from 'react-markdown';
 
+const streamError = (message) => Object.assign(new Error(message), { streamError: message });
+
+const stageMessages = {
+  info: '獲取影片資訊中...',
+  transcript: '獲取字幕中...',
+  summary: '生成AI筆記中...'
+};
+
+// 目錄和筆記分別累積，按固定順序顯示
+const renderSummary = (sections) => `## 📋 目錄\n\n${sections.toc}\n\n${sections.notes}`;
+
 const VideoForm = () => {
   const [url, setUrl] = useState('');
   const [loading, setLoading] = useState(false);
@@ -16,9 +27,42 @@ const VideoForm = () => {
   const [downloadProgress, setDownloadProgress] = useState(0);
   const [downloadStage, setDownloadStage] = useState('');
   const [downloadCompleted, setDownloadCompleted] = useState(false);
-  const [mergeProgress, setMergeProgress] = useState(0);
   const downloadRef = useRef({ progress: 0, stage: '' });
-  const mergeInterval = useRef(null);
+
+  const runProcess = async () => {
+    // 一次請求完成信息、字幕和摘要，服務端以 SSE 推送任務狀態
+    const response = await fetch('http://localhost:5001/api/process', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ url })
+    });
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      throw streamError(data.error || '處理失敗，請檢查影片連結是否正確');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const event of events) {
+        if (!event.startsWith('data: ')) continue;
+        const job = JSON.parse(event.slice(6));
+        if (job.info) setVideoInfo(job.info);
+        if (job.status === 'error') throw streamError(job.error || '處理失敗');
+        if (job.status === 'done') return job.summary;
+        if (job.partial) setSummary(renderSummary(job.partial));
+        const running = Object.keys(stageMessages).find((name) => job.stages[name].status === 'running');
+        if (running) setProcessStatus(stageMessages[running]);
+      }
+    }
+    throw streamError('處理中斷，請重試');
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -29,39 +73,18 @@ const VideoForm = () => {
     setIsGeneratingNotes(true);
     setIsNotesCompleted(false);
     
-    // 設置進度更新定時器，每秒增加5%
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-      if (progress < 90) {
-        progress += 5;
-        setProcessStatus(`生成AI筆記中：${progress}%`);
-      }
-    }, 1000);
-    
     try {
-      // 獲取視頻信息
-      const infoResponse = await axios.post('http://localhost:5001/api/video/info', { url });
-      setVideoInfo(infoResponse.data);
-      
-      // 獲取字幕並生成摘要
-      const transcriptResponse = await axios.post('http://localhost:5001/api/transcript', { url });
-      const summaryResponse = await axios.post('http://localhost:5001/api/summary', {
-        transcript: transcriptResponse.data.transcript,
-        duration: infoResponse.data.duration
-      });
-      
-      // 清除進度定時器
-      clearInterval(progressInterval);
+      setProcessStatus('獲取影片資訊中...');
+      const summary = await runProcess();
       
       // 設置最終進度為100%並保持顯示
       setProcessStatus('AI筆記生成完成：100%');
       setIsNotesCompleted(true);
-      setSummary(summaryResponse.data.summary);
+      setSummary(summary);
       
     } catch (err) {
-      clearInterval(progressInterval);
       console.error('錯誤詳情:', err);
-      const errorMessage = err.response?.data?.error || '處理失敗，請檢查影片連結是否正確';
+      const errorMessage = err.response?.data?.error || err.streamError || '處理失敗，請檢查影片連結是否正確';
       setError(errorMessage);
       setProcessStatus('');
     } finally {
@@ -70,6 +93,37 @@ const VideoForm = () => {
     }
   };
 
+  const waitForJob = (jobId) => new Promise((resolve, reject) => {
+    // 訂閱任務進度，收到終止事件後服務端會關閉連接
+    const eventSource = new EventSource(`http://localhost:5001/api/video/download/jobs/${jobId}/progress`);
+
+    eventSource.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.status === 'done') {
+            eventSource.close();
+            resolve(data);
+        } else if (data.status === 'error' || data.status === 'cancelled') {
+            eventSource.close();
+            reject(new Error(data.error || '下載已取消'));
+        } else if (data.stage === 'processing') {
+            // 合併階段，進度來自服務端 ffmpeg
+            setDownloadProgress(data.progress);
+            setDownloadStage(`影片處理中：${Math.round(data.progress)}%`);
+        } else if (data.status === 'queued') {
+            setDownloadStage('排隊等待下載...');
+        } else {
+            // 下載階段
+            setDownloadProgress(data.progress);
+            setDownloadStage(`影片文件下載中：${Math.round(data.progress)}%`);
+        }
+    };
+
+    eventSource.onerror = () => {
+        eventSource.close();
+        reject(new Error('進度連接中斷'));
+    };
+  });
+
   const handleDownload = async () => {
     try {
         setIsDownloading(true);
@@ -77,69 +131,27 @@ const VideoForm = () => {
         setDownloadStage('準備下載...');
         setDownloadCompleted(false);  // 重置完成狀態
         
-        // 清理之前的計時器
-        if (mergeInterval.current) {
-            clearInterval(mergeInterval.current);
-            mergeInterval.current = null;
-        }
-        
-        // 創建 EventSource 來接收進度更新
-        const eventSource = new EventSource(`http://localhost:5001/api/video/download/progress`);
-        
-        eventSource.onmessage = (event) => {
-            const data = JSON.parse(event.data);
-            if (data.progress < 50) {
-                // 下載階段
-                setDownloadProgress(data.progress);
-                setDownloadStage(`影片文件下載中：${Math.round(data.progress)}%`);
-            } else {
-                // 合併階段開始，關閉 EventSource
-                eventSource.close();
-                
-                // 開始模擬合併進度
-                let mergeProgress = 50;
-                mergeInterval.current = setInterval(() => {
-                    mergeProgress += 0.3;
-                    if (mergeProgress < 99) {
-                        setDownloadProgress(mergeProgress);
-                        setDownloadStage(`影片處理中：${Math.round(mergeProgress)}%`);
-                    }
-                }, 1000);
-            }
-        };
-        
-        // 實際下載請求
-        const response = await axios.post(
-            'http://localhost:5001/api/video/download', 
-            { url },
-            { responseType: 'blob' }
-        );
-        
-        // 清理計時器
-        if (mergeInterval.current) {
-            clearInterval(mergeInterval.current);
-            mergeInterval.current = null;
-        }
+        // 提交下載任務並等待完成
+        const jobResponse = await axios.post('http://localhost:5001/api/video/download/jobs', { url });
+        const jobId = jobResponse.data.job_id;
+        await waitForJob(jobId);
         
         // 設置完成狀態
         setDownloadProgress(100);
         setDownloadStage('已完成下載，請檢查下載資料夾');
         setDownloadCompleted(true);  // 設置完成狀態為 true
         
-        // 處理文件下載
-        const blob = new Blob([response.data], { type: 'video/mp4' });
-        const downloadUrl = window.URL.createObjectURL(blob);
+        // 交給瀏覽器直接下載到磁盤，支持斷點續傳，不在內存中緩衝整個文件
         const link = document.createElement('a');
-        link.href = downloadUrl;
+        link.href = `http://localhost:5001/api/video/download/jobs/${jobId}/file`;
         link.download = `${videoInfo?.title || 'video'}.mp4`;
         document.body.appendChild(link);
         link.click();
         document.body.removeChild(link);
-        window.URL.revokeObjectURL(downloadUrl);
         
     } catch (error) {
         console.error('下載錯誤:', error);
-        setError(error.message || '下載失敗，請稍後再試');
+        setError(error.response?.data?.error || error.message || '下載失敗，請稍後再試');
         setDownloadStage('下載失敗');
         setDownloadProgress(0);
         setDownloadCompleted(false);  // 設置完成狀態為 false